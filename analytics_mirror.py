@@ -0,0 +1,372 @@
+"""
+分析镜像模块 - 将业务表增量同步到本地DuckDB，承载只读聚合查询
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from decimal import Decimal
+from typing import Optional, Tuple, List, Dict, Any
+import pandas as pd
+from config import ANALYTICS_MIRROR_CONFIG
+from database import database_manager
+from utils.sql_analyzer import sql_analyzer
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    duckdb = None
+    DUCKDB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def _find_function_calls(sql: str, function_name: str):
+    """查找函数调用，返回 (起始位置, 结束位置, 顶层参数列表)"""
+    pattern = re.compile(rf'\b{function_name}\s*\(', re.IGNORECASE)
+    position = 0
+    while True:
+        match = pattern.search(sql, position)
+        if not match:
+            return
+        depth = 0
+        args = []
+        current_start = match.end()
+        quote = None
+        for index in range(match.end() - 1, len(sql)):
+            char = sql[index]
+            if quote:
+                if char == quote:
+                    quote = None
+                continue
+            if char in ("'", '"'):
+                quote = char
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+                if depth == 0:
+                    args.append(sql[current_start:index].strip())
+                    yield match.start(), index + 1, args
+                    position = index + 1
+                    break
+            elif char == ',' and depth == 1:
+                args.append(sql[current_start:index].strip())
+                current_start = index + 1
+        else:
+            return
+
+
+def _replace_function(sql: str, function_name: str, transform) -> str:
+    """使用transform(args)重写所有指定函数调用，transform返回None表示保持原样"""
+    result = []
+    last_end = 0
+    for start, end, args in list(_find_function_calls(sql, function_name)):
+        replacement = transform(args)
+        if replacement is None:
+            continue
+        result.append(sql[last_end:start])
+        result.append(replacement)
+        last_end = end
+    result.append(sql[last_end:])
+    return ''.join(result)
+
+
+def translate_mysql_to_duckdb(sql: str) -> str:
+    """将常见的MySQL方言函数转换为DuckDB等价写法"""
+    translated = sql.strip().rstrip(';')
+    
+    # 标识符引号
+    translated = translated.replace('`', '"')
+    
+    # 日期函数
+    translated = re.sub(r'\b(CURDATE|CURRENT_DATE)\s*\(\s*\)', 'CURRENT_DATE', translated, flags=re.IGNORECASE)
+    translated = re.sub(r'\bNOW\s*\(\s*\)', 'CURRENT_TIMESTAMP', translated, flags=re.IGNORECASE)
+    
+    def interval_arithmetic(operator):
+        def transform(args):
+            if len(args) != 2:
+                return None
+            interval = args[1] if args[1].upper().startswith('INTERVAL') else f"INTERVAL {args[1]} DAY"
+            return f"({args[0]} {operator} {interval})"
+        return transform
+    
+    # 先处理内层函数，嵌套调用时重复替换直到稳定
+    for _ in range(3):
+        translated = _replace_function(translated, 'DATE_SUB', interval_arithmetic('-'))
+        translated = _replace_function(translated, 'DATE_ADD', interval_arithmetic('+'))
+    
+    translated = _replace_function(
+        translated, 'DATEDIFF',
+        lambda args: f"date_diff('day', CAST({args[1]} AS DATE), CAST({args[0]} AS DATE))" if len(args) == 2 else None
+    )
+    translated = _replace_function(
+        translated, 'DATE_FORMAT',
+        lambda args: f"strftime({args[0]}, {args[1].replace('%i', '%M').replace('%s', '%S')})" if len(args) == 2 else None
+    )
+    
+    # MySQL的 LIMIT offset, count 语法
+    translated = re.sub(
+        r'\bLIMIT\s+(\d+)\s*,\s*(\d+)',
+        lambda m: f"LIMIT {m.group(2)} OFFSET {m.group(1)}",
+        translated, flags=re.IGNORECASE
+    )
+    return translated
+
+
+class AnalyticsMirror:
+    """DuckDB分析镜像管理器"""
+    
+    STATE_TABLE = "_mirror_state"
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or ANALYTICS_MIRROR_CONFIG
+        self.db_manager = database_manager
+        self._conn = None
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._sync_thread = None
+        self._stop_event = threading.Event()
+        self.stats = {"routed": 0, "fallback": 0, "stale": 0, "synced_rows": 0}
+    
+    def is_enabled(self) -> bool:
+        """镜像是否启用且依赖可用"""
+        return bool(self.config.get("enabled")) and DUCKDB_AVAILABLE
+    
+    def _get_connection(self):
+        """获取DuckDB连接（懒加载）"""
+        if self._conn is None:
+            path = self.config["database_path"]
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = duckdb.connect(path)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.STATE_TABLE} ("
+                "table_name VARCHAR PRIMARY KEY, watermark VARCHAR, synced_at DOUBLE)"
+            )
+        return self._conn
+    
+    def _get_state(self, table_name: str) -> Tuple[Optional[str], Optional[float]]:
+        """获取表的同步水位和上次同步时间"""
+        row = self._get_connection().execute(
+            f"SELECT watermark, synced_at FROM {self.STATE_TABLE} WHERE table_name = ?", [table_name]
+        ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+    
+    def _set_state(self, table_name: str, watermark: Optional[str]):
+        """记录表的同步水位"""
+        conn = self._get_connection()
+        conn.execute(f"DELETE FROM {self.STATE_TABLE} WHERE table_name = ?", [table_name])
+        conn.execute(
+            f"INSERT INTO {self.STATE_TABLE} VALUES (?, ?, ?)", [table_name, watermark, time.time()]
+        )
+    
+    def _table_exists(self, table_name: str) -> bool:
+        """检查镜像中是否已存在该表"""
+        row = self._get_connection().execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE lower(table_name) = lower(?)", [table_name]
+        ).fetchone()
+        return bool(row and row[0])
+    
+    @staticmethod
+    def _normalize_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+        """将Decimal列转换为浮点数，便于DuckDB推断类型"""
+        for column in chunk.columns:
+            if chunk[column].dtype == object:
+                sample = chunk[column].dropna()
+                if not sample.empty and isinstance(sample.iloc[0], Decimal):
+                    chunk[column] = chunk[column].astype(float)
+        return chunk
+    
+    def _stage_chunk(self, cursor, staging_table: str, chunk: pd.DataFrame, create: bool):
+        """将一批数据写入暂存表（使用同步专用的游标，不占用查询锁）"""
+        cursor.register("_mirror_chunk", self._normalize_chunk(chunk))
+        try:
+            if create:
+                cursor.execute(f'CREATE OR REPLACE TABLE "{staging_table}" AS SELECT * FROM _mirror_chunk')
+            else:
+                cursor.execute(f'INSERT INTO "{staging_table}" SELECT * FROM _mirror_chunk')
+        finally:
+            cursor.unregister("_mirror_chunk")
+    
+    def _swap_in(self, table_name: str, key: str, staging_table: str, staged: bool, incremental: bool,
+                 has_table: bool, watermark: Optional[str]):
+        """在一个事务内用暂存表替换或合并镜像表并记录水位（持有查询锁的时间很短）"""
+        with self._lock:
+            conn = self._get_connection()
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                if staged and not incremental:
+                    conn.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM "{staging_table}"')
+                elif staged:
+                    conn.execute(
+                        f'DELETE FROM "{table_name}" WHERE "{key}" IN (SELECT "{key}" FROM "{staging_table}")'
+                    )
+                    conn.execute(f'INSERT INTO "{table_name}" SELECT * FROM "{staging_table}"')
+                elif not incremental and has_table:
+                    # 全量模式下源表为空时同样清空镜像
+                    conn.execute(f'DELETE FROM "{table_name}"')
+                self._set_state(table_name, watermark)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def sync_table(self, table_name: str) -> int:
+        """
+        增量同步单张表：先写入暂存表，再在短事务内替换或合并到镜像表
+        
+        Returns:
+            int: 本次同步的行数
+        """
+        table_config = self.config["tables"][table_name]
+        key = table_config["key"]
+        mode = table_config.get("mode", "full")
+        watermark_column = table_config.get("watermark", key)
+        batch_size = self.config.get("fetch_batch_size", 50000)
+        
+        with self._sync_lock:
+            with self._lock:
+                last_watermark, _ = self._get_state(table_name)
+                has_table = self._table_exists(table_name)
+                cursor = self._get_connection().cursor()
+            
+            params = {}
+            if mode == "full" or not has_table or last_watermark is None:
+                sql = f"SELECT * FROM {table_name}"
+                incremental = False
+            elif mode == "watermark":
+                # 日期水位按 >= 重叠拉取，依靠主键覆盖去重
+                sql = f"SELECT * FROM {table_name} WHERE {watermark_column} >= %(watermark)s"
+                params = {"watermark": last_watermark}
+                incremental = True
+            else:
+                sql = f"SELECT * FROM {table_name} WHERE {key} > %(watermark)s ORDER BY {key}"
+                params = {"watermark": last_watermark}
+                incremental = True
+            
+            staging_table = f"_mirror_staging_{table_name}"
+            synced_rows = 0
+            max_value = None
+            first_chunk = True
+            try:
+                # 拉取MySQL数据并写入暂存表期间不持有查询锁，聚合查询不会等待整个同步过程
+                engine = self.db_manager.get_read_engine(sql)
+                for chunk in pd.read_sql(sql, engine, params=params, chunksize=batch_size):
+                    if chunk.empty:
+                        continue
+                    self._stage_chunk(cursor, staging_table, chunk, create=first_chunk)
+                    first_chunk = False
+                    synced_rows += len(chunk)
+                    chunk_max = chunk[watermark_column].dropna().max()
+                    if pd.notna(chunk_max) and (max_value is None or chunk_max > max_value):
+                        max_value = chunk_max
+                
+                self._swap_in(
+                    table_name, key, staging_table, not first_chunk, incremental, has_table,
+                    str(max_value) if max_value is not None else last_watermark
+                )
+            finally:
+                cursor.execute(f'DROP TABLE IF EXISTS "{staging_table}"')
+                cursor.close()
+            
+            self.stats["synced_rows"] += synced_rows
+            return synced_rows
+    
+    def sync_all(self) -> Dict[str, int]:
+        """同步所有配置的表"""
+        results = {}
+        for table_name in self.config["tables"]:
+            try:
+                results[table_name] = self.sync_table(table_name)
+            except Exception as e:
+                results[table_name] = -1
+                logger.warning(f"分析镜像同步失败 {table_name}: {e}")
+        return results
+    
+    def start_background_sync(self):
+        """启动后台周期同步线程"""
+        if not self.is_enabled() or (self._sync_thread and self._sync_thread.is_alive()):
+            return
+        
+        def run():
+            while not self._stop_event.is_set():
+                self.sync_all()
+                self._stop_event.wait(self.config.get("sync_interval", 600))
+        
+        self._stop_event.clear()
+        self._sync_thread = threading.Thread(target=run, name="analytics-mirror-sync", daemon=True)
+        self._sync_thread.start()
+    
+    def stop_background_sync(self):
+        """停止后台同步线程"""
+        self._stop_event.set()
+    
+    def get_staleness(self, tables) -> Optional[float]:
+        """获取给定表集合中最旧一张表的数据延迟（秒），未同步返回None"""
+        oldest = None
+        with self._lock:
+            for table_name in tables:
+                _, synced_at = self._get_state(table_name)
+                if synced_at is None:
+                    return None
+                oldest = synced_at if oldest is None else min(oldest, synced_at)
+        return None if oldest is None else time.time() - oldest
+    
+    def can_serve(self, sql: str, max_staleness: Optional[float] = None) -> bool:
+        """判断SQL能否由分析镜像承载：只读聚合查询、表均已镜像且数据足够新"""
+        if not self.is_enabled():
+            return False
+        if not sql_analyzer.is_read_only(sql) or not sql_analyzer.is_aggregate_query(sql):
+            return False
+        
+        tables = sql_analyzer.extract_tables(sql)
+        if not tables or not tables.issubset(self.config["tables"].keys()):
+            return False
+        
+        limit = self.config.get("max_staleness", 900) if max_staleness is None else max_staleness
+        staleness = self.get_staleness(tables)
+        if staleness is None or staleness > limit:
+            self.stats["stale"] += 1
+            return False
+        return True
+    
+    def execute(self, sql: str) -> Tuple[List[str], List[tuple]]:
+        """在镜像上执行查询，返回 (列名列表, 行元组列表)"""
+        translated = translate_mysql_to_duckdb(sql)
+        with self._lock:
+            cursor = self._get_connection().execute(translated)
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        self.stats["routed"] += 1
+        return columns, rows
+    
+    def record_fallback(self):
+        """记录一次镜像执行失败后回退到MySQL"""
+        self.stats["fallback"] += 1
+    
+    def export_parquet(self, directory: Optional[str] = None) -> List[str]:
+        """将镜像表导出为Parquet文件"""
+        directory = directory or self.config["parquet_dir"]
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        with self._lock:
+            for table_name in self.config["tables"]:
+                if not self._table_exists(table_name):
+                    continue
+                path = os.path.join(directory, f"{table_name}.parquet")
+                self._get_connection().execute(f"COPY \"{table_name}\" TO '{path}' (FORMAT PARQUET)")
+                paths.append(path)
+        return paths
+    
+    def get_stats(self) -> Dict[str, int]:
+        """获取路由统计信息"""
+        return dict(self.stats)
+
+
+# 全局分析镜像实例
+analytics_mirror = AnalyticsMirror()
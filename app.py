@@ -2,10 +2,28 @@
 主应用程序 - Streamlit界面和应用逻辑
 """
 
+import threading
 import streamlit as st
 import pandas as pd
 from config import *
 from query_engine import query_engine
+from analytics_mirror import analytics_mirror
+from materialized_views import materialization_manager
+from utils.result_exporter import result_exporter
+from utils.sql_analyzer import sql_analyzer
+from query_history import query_history
+from index_advisor import index_advisor
+from llm_model import llm_manager
+from job_queue import job_worker_pool
+
+# 后台任务状态显示文本
+JOB_STATUS_LABELS = {
+    "queued": "⏳ 排队中",
+    "running": "🔄 运行中",
+    "succeeded": "✅ 已完成",
+    "failed": "❌ 失败",
+    "cancelled": "⛔ 已取消"
+}
 
 
 def setup_page_config():
@@ -18,6 +36,24 @@ def setup_page_config():
     )
 
 
+@st.cache_resource
+def init_background_services():
+    """启动后台服务（每个进程只执行一次）"""
+    # 预加载并常驻推荐模型，避免首个查询承担模型加载时间
+    llm_manager.start_preload_in_background()
+    # 分析镜像周期同步
+    analytics_mirror.start_background_sync()
+    # 汇总表周期增量刷新
+    materialization_manager.start_background_refresh()
+    # 后台重放高频历史查询，预热生成缓存和结果缓存
+    if HISTORY_CONFIG["enabled"] and HISTORY_CONFIG["warmup_enabled"]:
+        threading.Thread(target=query_engine.warm_up_caches, name="cache-warmup", daemon=True).start()
+    # 后台任务工作进程
+    if JOB_QUEUE_CONFIG["enabled"]:
+        job_worker_pool.start()
+    return True
+
+
 def setup_sidebar():
     """设置侧边栏"""
     with st.sidebar:
@@ -30,13 +66,16 @@ def setup_sidebar():
         # 模型分类选择
         model_category = st.selectbox(
             "选择模型类别",
-            options=["推荐SQL模型", "SQL专用模型", "大型通用模型", "中型通用模型", "小型通用模型", "全部模型"],
+            options=["自动选择", "推荐SQL模型", "SQL专用模型", "大型通用模型", "中型通用模型", "小型通用模型", "全部模型"],
             index=0,
             help="选择模型类别以筛选适合的模型"
         )
         
         # 根据分类筛选模型
-        if model_category == "推荐SQL模型":
+        if model_category == "自动选择":
+            available_models = [AUTO_MODEL]
+            st.info("🧭 按问题复杂度自动选择模型，生成的SQL未通过校验时自动换用更大的模型")
+        elif model_category == "推荐SQL模型":
             available_models = RECOMMENDED_SQL_MODELS
             st.info("💡 推荐使用SQL专用模型以获得最佳查询效果")
         elif model_category == "SQL专用模型":
@@ -60,7 +99,13 @@ def setup_sidebar():
         )
         
         # 显示模型信息
-        if model_name in MODEL_CATEGORIES["sql_specialized"]:
+        if model_name == AUTO_MODEL:
+            routing_stats = query_engine.get_cache_stats()["routing"]
+            st.caption(
+                f"已路由: 简单 {routing_stats['simple']} | 中等 {routing_stats['medium']} | "
+                f"复杂 {routing_stats['complex']} | 升级 {routing_stats['escalations']} 次"
+            )
+        elif model_name in MODEL_CATEGORIES["sql_specialized"]:
             st.success("✅ SQL专用模型 - 推荐用于SQL查询")
         elif "72b" in model_name or "32b" in model_name:
             st.warning("⚠️ 大型模型 - 需要充足的系统资源")
@@ -69,6 +114,26 @@ def setup_sidebar():
         else:
             st.info("ℹ️ 小型模型 - 快速响应，资源消耗低")
         
+        # 显示模型预加载状态
+        preload_status = llm_manager.get_preload_status(model_name)
+        if preload_status:
+            if preload_status["status"] == "ready":
+                memory_gb = preload_status.get("size", 0) / 1024 ** 3
+                st.caption(f"🔥 模型已预加载（加载 {preload_status['load_seconds']:.1f}s，常驻内存 {memory_gb:.1f}GB）")
+            elif preload_status["status"] == "loading":
+                st.caption("⏳ 模型正在后台预加载...")
+            else:
+                st.caption(f"⚠️ 模型预加载失败: {preload_status.get('error', '')}")
+        
+        # 显示最近一次调用使用的生成参数
+        generation_stats = query_engine.generation_profiles.get_stats(model_name)
+        if generation_stats.get("options"):
+            options = generation_stats["options"]
+            st.caption(
+                f"⚙️ 生成参数: num_ctx {options.get('num_ctx', '默认')} | num_predict {options.get('num_predict', '默认')} | "
+                f"调用 {generation_stats['calls']} 次 | 上下文扩大 {generation_stats['ctx_growths']} 次"
+            )
+        
         # 连接状态检查
         st.subheader("🔗 连接状态")
         if st.button("检查连接状态", use_container_width=True):
@@ -88,6 +153,10 @@ def setup_sidebar():
                 if error_msg:
                     st.error(f"错误详情: {error_msg}")
         
+        # 查询历史与缓存统计
+        st.subheader("📈 查询统计")
+        show_query_history()
+        
         # 数据库Schema信息
         st.subheader("📊 数据库Schema")
         show_database_schema()
@@ -95,6 +164,156 @@ def setup_sidebar():
         return model_name
 
 
+def show_query_history():
+    """显示查询历史统计和缓存命中情况"""
+    if not HISTORY_CONFIG["enabled"]:
+        st.caption("查询历史未启用")
+        return
+    
+    with st.expander("查看查询历史", expanded=False):
+        try:
+            stats = query_history.get_stats()
+            recent = query_history.get_recent(20)
+        except Exception as e:
+            st.error(f"读取查询历史失败: {e}")
+            return
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("查询总数", stats["total"])
+        with col2:
+            success_rate = stats["succeeded"] / stats["total"] if stats["total"] else 0
+            st.metric("成功率", f"{success_rate:.0%}")
+        
+        cache_stats = query_engine.get_cache_stats()
+        st.caption(
+            f"生成缓存命中率 {cache_stats['generation']['hit_rate']:.0%} | "
+            f"结果缓存命中率 {cache_stats['result']['hit_rate']:.0%} | "
+            f"合并并发请求 {cache_stats['coalescing']['coalesced']} 次"
+        )
+        template_stats = cache_stats["templates"]
+        st.caption(
+            f"问题模板命中率 {template_stats['hit_rate']:.0%}（{template_stats['hits']}/{template_stats['checked']}）"
+        )
+        speculation_stats = cache_stats["speculation"]
+        if speculation_stats["requested"]:
+            st.caption(
+                f"预生成命中率 {speculation_stats['hit_rate']:.0%}（命中 {speculation_stats['hits']} | "
+                f"等待完成 {speculation_stats['joined']} | 未命中 {speculation_stats['misses']}）| "
+                f"取消 {speculation_stats['cancelled']} | 浪费 {speculation_stats['wasted']} 次 "
+                f"{speculation_stats['wasted_ms'] / 1000:.1f}s"
+            )
+        conversation_stats = cache_stats["conversation"]
+        if conversation_stats["follow_ups"] or conversation_stats["new_conversations"]:
+            st.caption(
+                f"追问 {conversation_stats['follow_ups']} 次 | 直接改写 {conversation_stats['edits']} | "
+                f"模型修改 {conversation_stats['model_refinements']} | 重新生成 {conversation_stats['fallbacks']} | "
+                f"新对话 {conversation_stats['new_conversations']}"
+            )
+        batch_stats = cache_stats["batch"]
+        if batch_stats["batches"]:
+            st.caption(
+                f"SQL脚本 {batch_stats['batches']} 个（并行 {batch_stats['parallel']} | 顺序 {batch_stats['sequential']}）| "
+                f"语句 {batch_stats['statements']} 条 | 并行节省 {batch_stats['saved_ms'] / 1000:.1f}s"
+            )
+        progressive_stats = cache_stats["progressive"]
+        if progressive_stats["previews"]:
+            st.caption(
+                f"渐进式预览 {progressive_stats['previews']} 次 | 预览平均 {progressive_stats['avg_preview_ms']:.0f} ms | "
+                f"完整结果平均 {progressive_stats['avg_full_ms']:.0f} ms"
+            )
+        prepared_stats = cache_stats["prepared"]
+        st.caption(
+            f"预处理语句复用率 {prepared_stats['reuse_rate']:.0%} | 模板 {prepared_stats['templates']} 个 | "
+            f"预处理 {prepared_stats['prepares']} 次 | 复用 {prepared_stats['reuses']} 次"
+        )
+        template_hits = {name: count for name, count in template_stats["by_template"].items() if count}
+        if template_hits:
+            st.caption("模板命中: " + " | ".join(f"{name} {count}" for name, count in template_hits.items()))
+        if JOB_QUEUE_CONFIG["enabled"]:
+            job_stats = query_engine.job_queue.get_stats()
+            pool_status = job_worker_pool.get_status()
+            st.caption(
+                f"后台任务: 排队 {job_stats['queued']} | 运行 {job_stats['running']} | 完成 {job_stats['succeeded']} | "
+                f"失败 {job_stats['failed']} | 工作进程 {pool_status['alive']}/{pool_status['processes']}"
+            )
+        store_stats = cache_stats["result_store"]
+        st.caption(
+            f"结果存储 {store_stats['results']} 个 | 内存 {store_stats['memory_mb']:.1f} MB | "
+            f"溢写 {store_stats['disk_mb']:.1f} MB | 淘汰 {store_stats['evicted']} 次"
+        )
+        
+        prompt_report = query_engine.prompt_budget.get_report()
+        if prompt_report:
+            st.markdown("**提示词规模与生成耗时**")
+            st.dataframe(pd.DataFrame([
+                {
+                    "模型": row["model"],
+                    "schema编码": row["schema_encoding"],
+                    "次数": row["count"],
+                    "平均tokens": row["avg_prompt_tokens"],
+                    "平均耗时(ms)": row["avg_latency_ms"],
+                    "每千tokens耗时(ms)": row["ms_per_1k_tokens"]
+                }
+                for row in prompt_report
+            ]), use_container_width=True, hide_index=True)
+        
+        slow_queries = query_engine.profiler.get_slow_queries(10)
+        if slow_queries:
+            st.markdown(f"**慢查询（超过 {PROFILING_CONFIG['slow_query_ms']} ms）**")
+            st.dataframe(pd.DataFrame([
+                {
+                    "时间": entry["timestamp"],
+                    "问题/SQL": entry["question"] or entry["sql"],
+                    "模型": entry["model"] or "",
+                    "耗时(ms)": round(entry["total_ms"]),
+                    "剖析文件": (entry["profile"] or {}).get("folded", "")
+                }
+                for entry in slow_queries
+            ]), use_container_width=True, hide_index=True)
+        
+        if st.button("🗂️ 分析索引建议", help="根据查询历史和执行计划生成建索引DDL（只供审阅，不会执行）"):
+            with st.spinner("正在分析查询历史..."):
+                try:
+                    index_advisor.advise()
+                except Exception as e:
+                    st.error(f"索引分析失败: {e}")
+        index_report = index_advisor.get_last_report()
+        if index_report:
+            st.markdown(f"**索引建议**（分析 {index_report['analyzed']} 条查询）")
+            if index_report["suggestions"]:
+                st.dataframe(pd.DataFrame([
+                    {
+                        "表": suggestion["table"],
+                        "索引列": ", ".join(suggestion["columns"]),
+                        "估算收益": suggestion["benefit"],
+                        "执行次数": suggestion["executions"],
+                        "全表扫描": suggestion["full_scans"],
+                        "说明": "；".join(suggestion["notes"])
+                    }
+                    for suggestion in index_report["suggestions"]
+                ]), use_container_width=True, hide_index=True)
+                st.code("\n".join(suggestion["ddl"] for suggestion in index_report["suggestions"]), language="sql")
+            else:
+                st.caption("没有需要新增的索引")
+            for warning in index_report["warnings"]:
+                st.caption(f"⚠️ {warning['warning']}（{warning['executions']} 次）")
+        
+        if recent:
+            df = pd.DataFrame([
+                {
+                    "来源": record["source"],
+                    "问题/SQL": record["question"] or record["sql_text"],
+                    "模型": record["model"] or "",
+                    "耗时(ms)": round(record["total_ms"] or 0),
+                    "行数": record["row_count"],
+                    "成功": "✅" if record["success"] else "❌"
+                }
+                for record in recent
+            ])
+            st.dataframe(df, use_container_width=True, hide_index=True)
+
+
 def show_database_schema():
     """显示数据库Schema信息表格"""
     # 显示视图选择器
@@ -312,45 +531,7 @@ def get_dominant_type(columns):
 
 def show_table_query_examples_inline(table_name):
     """在当前位置显示查询示例"""
-    examples = {
-        "Customer": [
-            "SELECT * FROM Customer WHERE IsActive = 1;",
-            "SELECT FirstName, LastName, Email FROM Customer;",
-            "SELECT COUNT(*) FROM Customer WHERE CustomerSince >= '2024-01-01';"
-        ],
-        "Employee": [
-            "SELECT * FROM Employee ORDER BY Salary DESC LIMIT 10;",
-            "SELECT Position, AVG(Salary) FROM Employee GROUP BY Position;",
-            "SELECT * FROM Employee WHERE HireDate >= '2024-01-01';"
-        ],
-        "Product": [
-            "SELECT * FROM Product WHERE StockQuantity < ReorderLevel;",
-            "SELECT ProductName, UnitPrice FROM Product WHERE UnitPrice > 100;",
-            "SELECT * FROM Product WHERE Discontinued = 0;"
-        ],
-        "SalesOrder": [
-            "SELECT * FROM SalesOrder WHERE Status = 'Completed';",
-            "SELECT COUNT(*) FROM SalesOrder WHERE IsPaid = 1;",
-            "SELECT * FROM SalesOrder WHERE OrderDate >= CURDATE() - INTERVAL 30 DAY;"
-        ],
-        "LineItem": [
-            "SELECT SalesOrderID, SUM(TotalPrice) FROM LineItem GROUP BY SalesOrderID;",
-            "SELECT ProductID, SUM(Quantity) FROM LineItem GROUP BY ProductID;",
-            "SELECT * FROM LineItem WHERE Discount > 0;"
-        ],
-        "InventoryLog": [
-            "SELECT * FROM InventoryLog WHERE ChangeDate >= CURDATE() - INTERVAL 7 DAY;",
-            "SELECT ProductID, SUM(QuantityChange) FROM InventoryLog GROUP BY ProductID;",
-            "SELECT * FROM InventoryLog WHERE QuantityChange < 0;"
-        ],
-        "Supplier": [
-            "SELECT CompanyName, ContactName, Email FROM Supplier;",
-            "SELECT * FROM Supplier WHERE Email IS NOT NULL;",
-            "SELECT COUNT(*) FROM Supplier;"
-        ]
-    }
-    
-    table_examples = examples.get(table_name, [])
+    table_examples = [example["query"] for example in TABLE_QUERY_EXAMPLES.get(table_name, [])]
     
     if table_examples:
         st.write(f"**💡 {table_name} 表查询示例：**")
@@ -405,45 +586,7 @@ def infer_column_type(column_name):
 
 def show_table_query_examples(table_name):
     """显示特定表的查询示例"""
-    examples = {
-        "Customer": [
-            "SELECT * FROM Customer WHERE IsActive = 1;",
-            "SELECT FirstName, LastName, Email FROM Customer;",
-            "SELECT COUNT(*) FROM Customer WHERE CustomerSince >= '2024-01-01';"
-        ],
-        "Employee": [
-            "SELECT * FROM Employee ORDER BY Salary DESC LIMIT 10;",
-            "SELECT Position, AVG(Salary) FROM Employee GROUP BY Position;",
-            "SELECT * FROM Employee WHERE HireDate >= '2024-01-01';"
-        ],
-        "Product": [
-            "SELECT * FROM Product WHERE StockQuantity < ReorderLevel;",
-            "SELECT ProductName, UnitPrice FROM Product WHERE UnitPrice > 100;",
-            "SELECT * FROM Product WHERE Discontinued = 0;"
-        ],
-        "SalesOrder": [
-            "SELECT * FROM SalesOrder WHERE Status = 'Completed';",
-            "SELECT COUNT(*) FROM SalesOrder WHERE IsPaid = 1;",
-            "SELECT * FROM SalesOrder WHERE OrderDate >= CURDATE() - INTERVAL 30 DAY;"
-        ],
-        "LineItem": [
-            "SELECT SalesOrderID, SUM(TotalPrice) FROM LineItem GROUP BY SalesOrderID;",
-            "SELECT ProductID, SUM(Quantity) FROM LineItem GROUP BY ProductID;",
-            "SELECT * FROM LineItem WHERE Discount > 0;"
-        ],
-        "InventoryLog": [
-            "SELECT * FROM InventoryLog WHERE ChangeDate >= CURDATE() - INTERVAL 7 DAY;",
-            "SELECT ProductID, SUM(QuantityChange) FROM InventoryLog GROUP BY ProductID;",
-            "SELECT * FROM InventoryLog WHERE QuantityChange < 0;"
-        ],
-        "Supplier": [
-            "SELECT CompanyName, ContactName, Email FROM Supplier;",
-            "SELECT * FROM Supplier WHERE Email IS NOT NULL;",
-            "SELECT COUNT(*) FROM Supplier;"
-        ]
-    }
-    
-    table_examples = examples.get(table_name, [])
+    table_examples = [example["query"] for example in TABLE_QUERY_EXAMPLES.get(table_name, [])]
     
     if table_examples:
         for i, example in enumerate(table_examples, 1):
@@ -494,6 +637,19 @@ def show_sql_cleaner():
                 st.warning("请输入SQL查询")
 
 
+def speculate_question(model_name, enabled):
+    """问题输入框内容变化时在后台预生成SQL"""
+    if enabled and st.session_state.get("speculative_mode"):
+        query_engine.speculate(st.session_state.get("natural_language_input", ""), model_name)
+
+
+def show_preview(placeholder, columns, rows, preview):
+    """完整查询仍在执行时显示预览结果，完成后由完整结果替换"""
+    with placeholder.container():
+        st.info(f"🔎 预览（{preview['label']}，{preview['ms']:.0f} ms）——完整结果计算中，完成后自动替换")
+        st.dataframe(pd.DataFrame(rows, columns=columns), use_container_width=True, hide_index=True)
+
+
 def main_query_interface(model_name):
     """主查询界面"""
     st.title("🔍 SQL智能助手")
@@ -506,14 +662,41 @@ def main_query_interface(model_name):
         horizontal=True
     )
     
+    # 对话模式：追问在上一轮SQL基础上修改
+    conversation_mode, turns = False, []
+    if query_mode == "自然语言查询" and CONVERSATION_CONFIG["enabled"]:
+        conversation_mode = st.checkbox(
+            "对话模式",
+            help="追问（如“只看2024年的”“按金额排序”）在上一轮SQL基础上修改，不重新生成完整SQL"
+        )
+        turns = query_engine.get_conversation() if conversation_mode else []
+        if turns:
+            with st.expander(f"💬 当前对话（{len(turns)} 轮）"):
+                for index, turn in enumerate(turns, 1):
+                    st.markdown(f"{index}. {turn['question']}")
+                    st.code(turn["sql"], language="sql")
+                if st.button("开始新对话", key="reset_conversation"):
+                    query_engine.reset_conversation()
+                    st.rerun()
+    
+    # 输入时预生成：问题输入完成后在后台提前生成SQL（对话中的追问依赖上一轮SQL，不预生成）
+    if query_mode == "自然语言查询" and SPECULATION_CONFIG["enabled"] and not turns:
+        st.checkbox(
+            "输入时预生成",
+            key="speculative_mode",
+            help="输入框失去焦点或按Ctrl+Enter后，在后台提前生成SQL；提交的问题未改动时直接使用"
+        )
+    
     # 用户输入
     if query_mode == "自然语言查询":
         user_input = st.text_area(
-            "请输入您的问题:",
+            "请输入追问:" if turns else "请输入您的问题:",
             value=st.session_state.get('user_input', ''),
             placeholder="例如：查询所有用户的姓名和邮箱",
             height=100,
-            key="natural_language_input"
+            key="natural_language_input",
+            on_change=speculate_question,
+            args=(model_name, not turns)
         )
     else:
         user_input = st.text_area(
@@ -535,17 +718,61 @@ def main_query_interface(model_name):
     col1, col2 = st.columns([1, 4])
     with col1:
         query_button = st.button("🔍 执行查询", type="primary", use_container_width=True)
+    with col2:
+        profile_query = st.checkbox("剖析本次查询", help="记录调用栈采样和cProfile数据，生成火焰图文件")
+        run_in_background = st.checkbox(
+            "后台执行",
+            disabled=not JOB_QUEUE_CONFIG["enabled"],
+            help="提交到后台任务队列由工作进程执行，页面不阻塞，刷新页面后仍可在后台任务中查看结果"
+        )
+        progressive = st.checkbox(
+            "渐进式结果",
+            value=PROGRESSIVE_CONFIG["enabled"],
+            disabled=not PROGRESSIVE_CONFIG["enabled"],
+            help="查询较慢时先显示LIMIT或采样得到的预览（近似结果），完整结果完成后自动替换"
+        )
+    
+    # 提交后台任务
+    if query_button and user_input.strip() and run_in_background:
+        if query_mode == "自然语言查询":
+            job_id = query_engine.submit_natural_language_job(user_input, model_name)
+        else:
+            job_id = query_engine.submit_direct_sql_job(user_input)
+        st.success(f"已提交后台任务 {job_id}，可在下方后台任务中查看进度")
+    
+    # 多语句脚本：相互独立的只读语句并行执行
+    elif (
+        query_button and query_mode == "直接SQL查询" and BATCH_CONFIG["enabled"]
+        and query_engine.batch_executor.is_batch(user_input)
+    ):
+        with st.spinner("正在执行SQL脚本..."):
+            try:
+                report = query_engine.execute_sql_batch(user_input)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                show_batch_report(report, display_format)
     
     # 执行查询
-    if query_button and user_input.strip():
+    elif query_button and user_input.strip():
+        preview_placeholder = st.empty()
+        on_preview = (
+            (lambda columns, rows, preview: show_preview(preview_placeholder, columns, rows, preview))
+            if progressive else None
+        )
         if query_mode == "自然语言查询":
             success, result, sql_query, error_msg = query_engine.execute_natural_language_query(
-                user_input, model_name
+                user_input, model_name, profile=profile_query, conversation=conversation_mode,
+                on_preview=on_preview
             )
         else:
             success, result, sql_query, error_msg = query_engine.execute_direct_sql_query(
-                user_input
+                user_input, profile=profile_query, on_preview=on_preview
             )
+        preview_placeholder.empty()
+        
+        if profile_query:
+            st.caption(f"剖析文件: {query_engine.profiler.get_stats()['last_profile']}")
         
         # 显示结果
         if success:
@@ -557,6 +784,10 @@ def main_query_interface(model_name):
             # 显示查询结果
             query_engine.format_and_display_result(result, sql_query, display_format)
             
+            # 记录最近一次成功的查询，供完整结果导出使用
+            st.session_state.last_sql_query = sql_query
+            clear_export_file()
+        
         else:
             st.error(f"查询失败: {error_msg}")
             if sql_query:
@@ -565,6 +796,119 @@ def main_query_interface(model_name):
     
     elif query_button:
         st.warning("请输入查询内容")
+    
+    show_background_jobs(display_format)
+    
+    # 完整结果导出（只对只读查询提供，避免重新执行写入语句）
+    if st.session_state.get('last_sql_query') and sql_analyzer.is_read_only(st.session_state.last_sql_query):
+        show_export_panel(st.session_state.last_sql_query)
+
+
+def show_batch_report(report, display_format):
+    """显示多语句脚本的执行结果：汇总耗时以及每条语句的状态、依赖、耗时和结果"""
+    mode_label = "并行" if report["mode"] == "parallel" else "同一连接顺序（含会话状态）"
+    summary = (
+        f"执行 {len(report['statements'])} 条语句（{mode_label}）：成功 {report['succeeded']} | "
+        f"失败 {report['failed']} | 跳过 {report['skipped']} — 总耗时 {report['wall_ms']:.0f} ms，"
+        f"逐条累计 {report['serial_ms']:.0f} ms"
+    )
+    if report["failed"]:
+        st.warning(summary)
+    else:
+        st.success(summary)
+    
+    status_labels = {"succeeded": "✅", "failed": "❌", "skipped": "⏭️ 已跳过"}
+    for statement in report["statements"]:
+        header = f"{status_labels[statement['status']]} 语句 {statement['index'] + 1}"
+        if statement["status"] != "skipped":
+            header += f" · 开始于 {statement['started_ms']:.0f} ms · 耗时 {statement['ms']:.0f} ms"
+        if statement["depends_on"]:
+            header += " · 依赖语句 " + ", ".join(str(index + 1) for index in statement["depends_on"])
+        st.markdown(f"**{header}**")
+        st.code(statement["sql"], language="sql")
+        if statement["status"] == "failed":
+            st.error(statement["error"])
+        elif statement["status"] == "succeeded" and statement["read_only"]:
+            query_engine.format_and_display_result(statement["result_id"], statement["sql"], display_format)
+        elif statement["status"] == "succeeded":
+            st.caption("语句已执行")
+
+
+def show_background_jobs(display_format):
+    """显示后台任务：轮询状态、取消任务和查看结果"""
+    if not JOB_QUEUE_CONFIG["enabled"]:
+        return
+    jobs = query_engine.list_jobs(10)
+    if not jobs:
+        return
+    
+    viewing_job = None
+    with st.expander("⏳ 后台任务", expanded=any(job["status"] in ("queued", "running") for job in jobs)):
+        st.button("刷新状态", key="refresh_jobs")
+        for job in jobs:
+            payload = job["payload"]
+            col1, col2, col3 = st.columns([5, 1, 1])
+            with col1:
+                st.markdown(f"`{job['id']}` {JOB_STATUS_LABELS[job['status']]} — {payload.get('question') or payload.get('sql')}")
+                if job["status"] == "failed" and job["error"]:
+                    st.caption(job["error"])
+            with col2:
+                if job["status"] in ("queued", "running") and st.button("取消", key=f"cancel_job_{job['id']}"):
+                    query_engine.cancel_job(job["id"])
+                    st.rerun()
+            with col3:
+                if job["status"] == "succeeded" and st.button("查看结果", key=f"view_job_{job['id']}"):
+                    viewing_job = job
+    
+    if viewing_job:
+        result, row_count = query_engine.load_job_result(viewing_job["id"])
+        if result is None:
+            st.warning("任务结果已过期，请重新提交查询")
+            return
+        st.subheader(f"🔧 后台任务 {viewing_job['id']} 的SQL查询")
+        st.code(viewing_job["sql_text"], language="sql")
+        query_engine.format_and_display_result(result, viewing_job["sql_text"], display_format)
+        st.session_state.last_sql_query = viewing_job["sql_text"]
+        clear_export_file()
+
+
+def clear_export_file():
+    """丢弃会话中上一次生成的导出文件并删除临时文件"""
+    result_exporter.discard(st.session_state.pop('export_file', None))
+
+
+def show_export_panel(sql_query):
+    """显示完整结果导出面板（从数据库游标流式写入文件，不经过DataFrame）"""
+    with st.expander("📥 导出完整结果", expanded=False):
+        st.caption("按批次从数据库流式导出，适合大结果集")
+        st.code(sql_query, language="sql")
+        
+        file_format = st.selectbox(
+            "导出格式",
+            options=result_exporter.get_supported_formats(),
+            index=0,
+            key="export_format"
+        )
+        
+        if st.button("生成导出文件", key="generate_export"):
+            with st.spinner("正在导出查询结果..."):
+                clear_export_file()
+                try:
+                    st.session_state.export_file = result_exporter.export_to_tempfile(sql_query, file_format)
+                except Exception as e:
+                    st.error(f"导出失败: {e}")
+        
+        export_file = st.session_state.get('export_file')
+        if export_file:
+            st.info(f"已导出 {export_file['rows']} 行，耗时 {export_file['elapsed']:.2f} 秒")
+            with open(export_file['path'], "rb") as f:
+                st.download_button(
+                    "下载导出文件",
+                    data=f,
+                    file_name=f"query_result{result_exporter.FORMATS[export_file['format']]['extension']}",
+                    mime=result_exporter.get_mime_type(export_file['format']),
+                    key="download_export"
+                )
 
 
 def show_usage_instructions():
@@ -624,6 +968,9 @@ def main():
     # 设置页面配置
     setup_page_config()
     
+    # 启动后台服务
+    init_background_services()
+    
     # 设置侧边栏并获取模型选择
     model_name = setup_sidebar()
     
@@ -0,0 +1,185 @@
+"""
+批量SQL执行模块 - 将多条语句的脚本按读写表集合建立依赖图，相互独立的只读语句在连接池的多个连接上并行执行
+"""
+
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict, Any, List, Callable, ContextManager, Tuple
+from config import BATCH_CONFIG
+from utils.sql_analyzer import sql_analyzer
+
+
+class BatchExecutor:
+    """
+    批量SQL执行器
+    
+    依赖规则（按脚本顺序）：
+    - 写语句在之前的所有语句完成后才开始（保持写入顺序，之前的语句失败时不会执行）
+    - 只读语句依赖之前写过其任一表的语句；与其它只读语句、写其它表的语句并行
+    - DDL语句（CREATE/DROP/ALTER/RENAME/TRUNCATE）和无法识别表的写语句是屏障，之后的语句都依赖它
+    脚本中含有依赖同一连接的会话状态（会话变量、临时表、显式事务、USE等）时，整个脚本在同一个连接上顺序执行
+    """
+    
+    # 依赖同一连接会话状态的语句
+    SESSION_STATE_PATTERNS = (
+        r'^\s*(SET|USE|BEGIN|START\s+TRANSACTION|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|LOCK|UNLOCK|'
+        r'CALL|PREPARE|EXECUTE|DEALLOCATE|HANDLER)\b',
+        r'\bTEMPORARY\b', r'@\w', r'\bLAST_INSERT_ID\s*\(', r'\bFOUND_ROWS\s*\(', r'\bROW_COUNT\s*\(',
+        r'\bGET_LOCK\s*\(', r'\bRELEASE_LOCK\s*\('
+    )
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or BATCH_CONFIG
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = {"batches": 0, "parallel": 0, "sequential": 0, "statements": 0, "failed": 0, "saved_ms": 0.0}
+    
+    def is_enabled(self) -> bool:
+        """批量执行是否启用"""
+        return bool(self.config.get("enabled"))
+    
+    def is_batch(self, script: str) -> bool:
+        """脚本是否包含多条语句"""
+        return len(sql_analyzer.split_statements(script)) > 1
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """按需创建执行只读语句的线程池"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.get("max_workers", 4), thread_name_prefix="batch-statement"
+                )
+            return self._executor
+    
+    def plan(self, script: str) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        拆分脚本并建立依赖图
+        
+        Returns:
+            Tuple[List[Dict[str, Any]], str]: (语句列表 [{"index", "sql", "read_only", "ddl", "tables", "depends_on"}],
+            执行方式 parallel/sequential)
+        """
+        statements = []
+        session_state = False
+        for index, sql in enumerate(sql_analyzer.split_statements(script)):
+            keyword_text = sql_analyzer.strip_literals(sql).upper()
+            if any(re.search(pattern, keyword_text) for pattern in self.SESSION_STATE_PATTERNS):
+                session_state = True
+            statements.append({
+                "index": index,
+                "sql": sql,
+                "read_only": sql_analyzer.is_read_only(sql),
+                "ddl": sql_analyzer.is_ddl(sql),
+                # 写语句引用的表全部按写入处理（INSERT ... SELECT 的源表同样视为写入，保守但安全）
+                "tables": sorted(sql_analyzer.extract_tables(sql)),
+                "depends_on": []
+            })
+        
+        for statement in statements:
+            tables = set(statement["tables"])
+            for previous in statements[:statement["index"]]:
+                if (
+                    not statement["read_only"]
+                    or previous["ddl"]
+                    or (not previous["read_only"] and (not previous["tables"] or tables & set(previous["tables"])))
+                ):
+                    statement["depends_on"].append(previous["index"])
+        return statements, "sequential" if session_state else "parallel"
+    
+    def run(self, script: str, execute_fn: Callable[[str, dict], Tuple[Optional[str], int]],
+            single_connection: Callable[[], ContextManager[Callable[[str, dict], Tuple[Optional[str], int]]]]
+            ) -> Dict[str, Any]:
+        """
+        执行脚本
+        
+        Args:
+            execute_fn: 在连接池的任一连接上执行一条语句，返回 (结果ID, 行数)，结果ID为None表示失败；
+                会在线程池中调用
+            single_connection: 返回上下文管理器，进入后得到在同一个连接上执行语句的函数（会话状态模式使用）
+        
+        Returns:
+            Dict[str, Any]: {"mode", "statements", "wall_ms", "serial_ms", "succeeded", "failed", "skipped"}，
+            每条语句附带 status/result_id/row_count/error/started_ms/ms/timings
+        """
+        statements, mode = self.plan(script)
+        max_statements = self.config.get("max_statements", 100)
+        if len(statements) > max_statements:
+            raise ValueError(f"脚本包含 {len(statements)} 条语句，超过上限 {max_statements}")
+        
+        batch_start = time.perf_counter()
+        for statement in statements:
+            statement.update({"status": "pending", "result_id": None, "row_count": None, "error": "", "timings": {}})
+        if mode == "sequential":
+            with single_connection() as execute_on_connection:
+                for statement in statements:
+                    succeeded = self._execute(statement, execute_on_connection, batch_start)
+                    if not succeeded and self.config.get("stop_on_error", True):
+                        break
+        else:
+            self._run_parallel(statements, execute_fn, batch_start)
+        
+        for statement in statements:
+            if statement["status"] == "pending":
+                statement["status"] = "skipped"
+        wall_ms = (time.perf_counter() - batch_start) * 1000
+        serial_ms = sum(statement.get("ms", 0.0) for statement in statements)
+        counts = {status: sum(1 for statement in statements if statement["status"] == status)
+                  for status in ("succeeded", "failed", "skipped")}
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats[mode] += 1
+            self.stats["statements"] += len(statements)
+            self.stats["failed"] += counts["failed"]
+            self.stats["saved_ms"] += max(serial_ms - wall_ms, 0.0)
+        return {"mode": mode, "statements": statements, "wall_ms": wall_ms, "serial_ms": serial_ms, **counts}
+    
+    def _execute(self, statement: Dict[str, Any], execute_fn: Callable, batch_start: float) -> bool:
+        """执行一条语句并记录开始时间、耗时和结果"""
+        start_time = time.perf_counter()
+        statement["started_ms"] = (start_time - batch_start) * 1000
+        try:
+            result_id, row_count = execute_fn(statement["sql"], statement["timings"])
+            error = "" if result_id is not None else "语句执行失败"
+        except Exception as e:
+            result_id, row_count, error = None, None, str(e)
+        statement["ms"] = (time.perf_counter() - start_time) * 1000
+        statement.update({
+            "status": "succeeded" if result_id is not None else "failed",
+            "result_id": result_id, "row_count": row_count, "error": error
+        })
+        return result_id is not None
+    
+    def _run_parallel(self, statements: List[Dict[str, Any]], execute_fn: Callable, batch_start: float):
+        """按依赖图调度：依赖全部成功的语句提交到线程池，失败时按配置停止提交或只跳过其后继"""
+        executor = self._get_executor()
+        running = {}
+        stop = False
+        while True:
+            if not stop:
+                for statement in statements:
+                    if statement["status"] != "pending":
+                        continue
+                    dependencies = [statements[index]["status"] for index in statement["depends_on"]]
+                    if any(status in ("failed", "skipped") for status in dependencies):
+                        statement["status"] = "skipped"
+                    elif all(status == "succeeded" for status in dependencies):
+                        statement["status"] = "running"
+                        running[executor.submit(self._execute, statement, execute_fn, batch_start)] = statement
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                if not future.result() and self.config.get("stop_on_error", True):
+                    stop = True
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批量执行次数、语句数和并行节省的耗时"""
+        with self._lock:
+            return dict(self.stats)
+
+
+# 全局批量执行器实例
+batch_executor = BatchExecutor()
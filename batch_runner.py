@@ -0,0 +1,63 @@
+"""
+批处理脚本 - 批量执行SQL文件中的查询并流式导出结果
+
+使用方法:
+    python batch_runner.py queries.sql --format parquet --output-dir exports
+"""
+
+import os
+import sys
+import argparse
+
+# 添加当前目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from config import EXPORT_CONFIG
+from utils.sql_analyzer import sql_analyzer
+from utils.result_exporter import result_exporter
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="批量执行SQL并导出结果")
+    parser.add_argument("sql_file", help="包含一条或多条SQL语句的文件（分号分隔）")
+    parser.add_argument("--format", choices=list(result_exporter.FORMATS), default="csv", help="导出格式")
+    parser.add_argument("--output-dir", default=EXPORT_CONFIG["output_dir"], help="导出目录")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_CONFIG["batch_size"], help="每批读取的行数")
+    return parser.parse_args(argv)
+
+
+def run_export(sql_file, file_format, output_dir, batch_size):
+    """逐条执行SQL文件中的只读查询并导出，返回每条语句的导出统计；写入语句跳过并记为错误"""
+    with open(sql_file, encoding="utf-8") as f:
+        statements = sql_analyzer.split_statements(f.read())
+    
+    extension = result_exporter.FORMATS[file_format]["extension"]
+    summaries = []
+    for index, statement in enumerate(statements, 1):
+        output_path = os.path.join(output_dir, f"query_{index:03d}{extension}")
+        if not sql_analyzer.is_read_only(statement):
+            summary = {"path": None, "error": "非只读语句，未执行"}
+            print(f"[{index}/{len(statements)}] 已跳过: 非只读语句不会执行（批处理只导出查询结果）")
+            summaries.append(summary)
+            continue
+        try:
+            summary = result_exporter.export(statement, output_path, file_format, batch_size)
+            print(f"[{index}/{len(statements)}] {summary['rows']} 行 -> {output_path} ({summary['elapsed']:.2f}s)")
+        except Exception as e:
+            summary = {"path": output_path, "error": str(e)}
+            print(f"[{index}/{len(statements)}] 导出失败: {e}")
+        summaries.append(summary)
+    return summaries
+
+
+def main(argv=None):
+    """批处理入口"""
+    args = parse_args(argv)
+    summaries = run_export(args.sql_file, args.format, args.output_dir, args.batch_size)
+    return 0 if all("error" not in summary for summary in summaries) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -86,6 +86,56 @@ RECOMMENDED_SQL_MODELS = [
     "qwen2.5:14b-instruct-q8_0"                  # 通用模型备选
 ]
 
+# 自动模型路由配置 - 选择"auto"时按问题复杂度选择模型，校验失败时升级到更大的模型
+AUTO_MODEL = "auto"
+MODEL_ROUTING_CONFIG = {
+    "tiers": {                                   # 各复杂度级别的候选模型（无历史数据时按列表顺序选择）
+        "simple": ["sqlcoder:7b"] + MODEL_CATEGORIES["general_small"],
+        "medium": ["mannix/defog-llama3-sqlcoder-8b:latest"] + MODEL_CATEGORIES["general_medium"],
+        "complex": ["sqlcoder:15b"] + MODEL_CATEGORIES["general_large"]
+    },
+    "thresholds": {"simple": 1, "medium": 4},    # 复杂度得分 <= 阈值归入对应级别，其余为complex
+    "max_escalations": 2,                        # 校验失败后最多升级的次数
+    "validate_with_explain": True,               # 使用EXPLAIN校验生成的只读SQL
+    "min_samples": 5,                            # 模型在该级别的样本数达到后才按历史表现排序
+    "min_success_rate": 0.7,                     # 成功率低于该值的模型不再用于该级别
+    "latency_weight": 0.02,                      # 每秒平均耗时扣减的得分（得分 = 成功率 - 权重 × 秒数）
+    "history_days": 14,                          # 从查询历史学习的时间范围
+    "history_refresh_interval": 300              # 重新读取查询历史统计的间隔（秒）
+}
+
+# 模型预加载配置 - 应用启动时在后台加载并常驻模型，避免首个查询承担模型加载时间
+MODEL_PRELOAD_CONFIG = {
+    "enabled": True,
+    "max_models": 1,                             # 按RECOMMENDED_SQL_MODELS优先级预加载的模型数量
+    "models": [],                                # 显式指定要预加载的模型，留空则使用推荐列表
+    "keep_alive": "30m",                         # 模型常驻时间，-1 表示永久常驻
+    "prime_prompt": True,                        # 预热时发送静态schema前缀，填充提示词缓存
+    "request_timeout": 600                       # 预加载请求超时（秒），大模型首次加载较慢
+}
+
+# 生成参数配置 - 按模型选择生成参数，num_ctx按实测提示词长度确定（未设置的参数使用模型默认值）
+GENERATION_PROFILE_CONFIG = {
+    "enabled": True,                             # 关闭时使用Ollama默认参数
+    "min_ctx": 2048,                             # num_ctx下限，按2的幂次向上扩大
+    "token_estimate_margin": 1.2,                # 提示词token为估算值，按该倍数预留余量
+    "ctx_headroom": 128,                         # 提示词和输出之外额外预留的token数（模板、特殊token）
+    "default_profile": {
+        "num_predict": 512,                      # 输出token上限
+        "stop": [";", "\n```\n"],                # 在语句结束或代码块结束处停止
+        "max_ctx": 8192,                         # num_ctx上限
+        "num_thread": None,                      # CPU线程数
+        "num_gpu": None                          # 放到GPU上的层数
+    },
+    "profiles": {                                # 按模型名前缀匹配，覆盖默认参数
+        "duckdb-nsql": {"num_predict": 256, "max_ctx": 4096},
+        "qwen2.5:0.5b": {"num_predict": 256, "max_ctx": 4096},
+        "qwen2.5:1.5b": {"num_predict": 256, "max_ctx": 4096},
+        "deepseek-r1": {"num_predict": 2048, "stop": [], "max_ctx": 16384},   # 推理模型先输出思考过程，不在分号处截断
+        "QwQ": {"num_predict": 4096, "stop": [], "max_ctx": 16384}
+    }
+}
+
 # 数据库连接配置
 DATABASE_CONFIG = {
     "host": "localhost",
@@ -97,6 +147,319 @@ DATABASE_CONFIG = {
 # 数据库URI - 用于SQLDatabase连接
 DATABASE_URI = f"mysql+mysqlconnector://{DATABASE_CONFIG['user']}:{DATABASE_CONFIG['password']}@{DATABASE_CONFIG['host']}/{DATABASE_CONFIG['database']}"
 
+# 分析镜像配置 - 将业务表增量同步到本地DuckDB，用于承载只读聚合查询
+ANALYTICS_MIRROR_CONFIG = {
+    "enabled": False,                            # 是否启用分析镜像（需要安装duckdb）
+    "database_path": "data/analytics_mirror.duckdb",
+    "parquet_dir": "data/parquet",               # export_parquet() 导出目录
+    "sync_interval": 600,                        # 后台同步间隔（秒）
+    "max_staleness": 900,                        # 镜像数据允许的最大延迟（秒），超过则回退MySQL
+    "fetch_batch_size": 50000,                   # 每批从MySQL拉取的行数
+    # 同步策略: key=按自增主键增量, watermark=按日期水位增量(重叠拉取并按主键覆盖), full=全量
+    "tables": {
+        "Customer": {"key": "CustomerID", "mode": "full"},
+        "Employee": {"key": "EmployeeID", "mode": "full"},
+        "Product": {"key": "ProductID", "mode": "full"},
+        "Supplier": {"key": "SupplierID", "mode": "full"},
+        "SalesOrder": {"key": "SalesOrderID", "mode": "watermark", "watermark": "OrderDate"},
+        "LineItem": {"key": "LineItemID", "mode": "key"},
+        "InventoryLog": {"key": "LogID", "mode": "key"}
+    }
+}
+
+# 物化汇总表配置 - 维护常用聚合的汇总表，并将匹配的SQL透明改写为读取汇总表
+# 改写规则的pattern匹配 sql_analyzer.normalize_sql() 规范化后的SQL，
+# rewrite模板中的 {name} 由pattern的同名分组填充，tail为可选的 ORDER BY / LIMIT 尾部
+_MV_TAIL = r"(?P<tail>(?: order by \w+(?: asc| desc)?)?(?: limit \d+)?)"
+
+MATERIALIZED_VIEWS_CONFIG = {
+    "enabled": False,                            # 是否启用汇总表改写
+    "state_table": "mv_refresh_state",           # 记录各汇总表刷新水位的状态表
+    "max_staleness": 300,                        # 汇总表允许的最大延迟（秒）
+    "refresh_on_stale": True,                    # 命中但过期时先同步增量刷新再改写
+    "refresh_interval": 120,                     # 后台增量刷新间隔（秒）
+    "full_refresh_interval": 86400,              # 全量重建间隔（秒），用于纠正删除/更新带来的偏差
+    "views": {
+        "mv_customer_order_count": {
+            "source_table": "SalesOrder",
+            "watermark_column": "SalesOrderID",
+            "ddl": "CREATE TABLE IF NOT EXISTS mv_customer_order_count ("
+                   "CustomerID INT PRIMARY KEY, OrderCount BIGINT NOT NULL)",
+            "full_refresh": [
+                "INSERT INTO mv_customer_order_count (CustomerID, OrderCount) "
+                "SELECT CustomerID, COUNT(*) FROM SalesOrder WHERE SalesOrderID <= :high GROUP BY CustomerID"
+            ],
+            "incremental_refresh": [
+                "INSERT INTO mv_customer_order_count (CustomerID, OrderCount) "
+                "SELECT CustomerID, COUNT(*) FROM SalesOrder WHERE SalesOrderID > :low AND SalesOrderID <= :high "
+                "GROUP BY CustomerID "
+                "ON DUPLICATE KEY UPDATE OrderCount = OrderCount + VALUES(OrderCount)"
+            ],
+            "rewrites": [
+                {
+                    "pattern": r"select (?P<c>\w+)\.firstname,(?P=c)\.lastname,count\((?P<s>\w+)\.salesorderid\)(?: as (?P<alias>\w+))? "
+                               r"from customer (?:as )?(?P=c) left join salesorder (?:as )?(?P=s) "
+                               r"on (?:(?P=c)\.customerid=(?P=s)\.customerid|(?P=s)\.customerid=(?P=c)\.customerid) "
+                               r"group by (?P=c)\.customerid,(?P=c)\.firstname,(?P=c)\.lastname" + _MV_TAIL,
+                    "rewrite": "SELECT c.FirstName, c.LastName, COALESCE(m.OrderCount, 0) AS {alias} "
+                               "FROM Customer c LEFT JOIN mv_customer_order_count m ON c.CustomerID = m.CustomerID{tail}",
+                    "defaults": {"alias": "OrderCount"}
+                },
+                {
+                    "pattern": r"select customerid,count\((?:\*|salesorderid)\)(?: as (?P<alias>\w+))? from salesorder group by customerid" + _MV_TAIL,
+                    "rewrite": "SELECT CustomerID, OrderCount AS {alias} FROM mv_customer_order_count{tail}",
+                    "defaults": {"alias": "OrderCount"}
+                }
+            ]
+        },
+        "mv_product_sales": {
+            "source_table": "LineItem",
+            "watermark_column": "LineItemID",
+            "ddl": "CREATE TABLE IF NOT EXISTS mv_product_sales ("
+                   "ProductID INT PRIMARY KEY, TotalSales DECIMAL(18, 2) NOT NULL, TotalQuantity BIGINT NOT NULL)",
+            "full_refresh": [
+                "INSERT INTO mv_product_sales (ProductID, TotalSales, TotalQuantity) "
+                "SELECT ProductID, SUM(TotalPrice), SUM(Quantity) FROM LineItem WHERE LineItemID <= :high GROUP BY ProductID"
+            ],
+            "incremental_refresh": [
+                "INSERT INTO mv_product_sales (ProductID, TotalSales, TotalQuantity) "
+                "SELECT ProductID, SUM(TotalPrice), SUM(Quantity) FROM LineItem WHERE LineItemID > :low AND LineItemID <= :high "
+                "GROUP BY ProductID "
+                "ON DUPLICATE KEY UPDATE TotalSales = TotalSales + VALUES(TotalSales), "
+                "TotalQuantity = TotalQuantity + VALUES(TotalQuantity)"
+            ],
+            "rewrites": [
+                {
+                    "pattern": r"select (?P<p>\w+)\.productname,sum\((?P<l>\w+)\.totalprice\)(?: as (?P<alias>\w+))? "
+                               r"from product (?:as )?(?P=p) (?:inner )?join lineitem (?:as )?(?P=l) "
+                               r"on (?:(?P=p)\.productid=(?P=l)\.productid|(?P=l)\.productid=(?P=p)\.productid) "
+                               r"group by (?:(?P=p)\.productid,(?P=p)\.productname|(?P=p)\.productname,(?P=p)\.productid)" + _MV_TAIL,
+                    "rewrite": "SELECT p.ProductName, m.TotalSales AS {alias} "
+                               "FROM Product p JOIN mv_product_sales m ON p.ProductID = m.ProductID{tail}",
+                    "defaults": {"alias": "TotalSales"}
+                },
+                {
+                    "pattern": r"select productid,sum\(quantity\)(?: as (?P<alias>\w+))? from lineitem group by productid" + _MV_TAIL,
+                    "rewrite": "SELECT ProductID, TotalQuantity AS {alias} FROM mv_product_sales{tail}",
+                    "defaults": {"alias": "TotalQuantity"}
+                }
+            ]
+        },
+        "mv_low_stock": {
+            # 库存变化通过InventoryLog记录，增量刷新只重新评估受影响的产品
+            "source_table": "InventoryLog",
+            "watermark_column": "LogID",
+            "ddl": "CREATE TABLE IF NOT EXISTS mv_low_stock ("
+                   "ProductID INT PRIMARY KEY, ProductName VARCHAR(255), StockQuantity INT, ReorderLevel INT)",
+            "full_refresh": [
+                "INSERT INTO mv_low_stock (ProductID, ProductName, StockQuantity, ReorderLevel) "
+                "SELECT ProductID, ProductName, StockQuantity, ReorderLevel FROM Product WHERE StockQuantity < ReorderLevel"
+            ],
+            "incremental_refresh": [
+                "DELETE FROM mv_low_stock WHERE ProductID IN ("
+                "SELECT ProductID FROM InventoryLog WHERE LogID > :low AND LogID <= :high)",
+                "INSERT INTO mv_low_stock (ProductID, ProductName, StockQuantity, ReorderLevel) "
+                "SELECT ProductID, ProductName, StockQuantity, ReorderLevel FROM Product "
+                "WHERE StockQuantity < ReorderLevel AND ProductID IN ("
+                "SELECT ProductID FROM InventoryLog WHERE LogID > :low AND LogID <= :high)"
+            ],
+            "rewrites": [
+                {
+                    "pattern": r"select productname,stockquantity,reorderlevel from product where stockquantity<reorderlevel" + _MV_TAIL,
+                    "rewrite": "SELECT ProductName, StockQuantity, ReorderLevel FROM mv_low_stock{tail}",
+                    "defaults": {}
+                }
+            ]
+        }
+    }
+}
+
+# 结果导出配置 - 流式导出时内存占用只与批大小有关
+EXPORT_CONFIG = {
+    "batch_size": 10000,                         # 每批从游标读取的行数
+    "output_dir": "exports",                     # 批处理导出的默认目录
+    "temp_dir": "",                              # 下载按钮使用的临时目录，留空使用系统临时目录
+    "temp_max_age": 3600,                        # 临时导出文件的最长保留时间（秒），超时的文件在下次导出时清理
+    "csv_encoding": "utf-8-sig"                  # 带BOM便于Excel正确识别中文
+}
+
+# 压测配置 - load_test.py 以多个模拟会话驱动查询引擎，逐级增加并发
+LOAD_TEST_CONFIG = {
+    "concurrency_steps": [1, 2, 4, 8, 16],      # 每一级的并发会话数
+    "step_duration": 30,                         # 每一级持续时间（秒）
+    "nl_ratio": 0.5,                             # 自然语言查询占比，其余为直接SQL
+    "think_time": 0.5,                           # 会话两次请求间的平均间隔（秒，指数分布），0为连续请求
+    "stub_parallel": 1,                          # 替身Ollama的并行槽位（对应OLLAMA_NUM_PARALLEL）
+    "stub_prompt_ms_per_token": 0.5,             # 替身Ollama每个提示词token的处理耗时
+    "stub_ms_per_token": 20,                     # 替身Ollama每个输出token的生成耗时
+    "pool_sample_interval": 0.1,                 # 连接池占用采样间隔（秒）
+    "saturation_gain": 0.1,                      # 吞吐增幅低于该比例视为饱和
+    "output_dir": "data/load_test"               # 报告输出目录
+}
+
+# 模型评估配置 - evaluate_models.py 在本地DuckDB测试库上比较各模型的执行准确率和生成性能
+EVALUATION_CONFIG = {
+    "fixture_path": "data/eval_fixture.duckdb",  # 测试库路径（不存在时按下方行数生成）
+    "fixture_seed": 42,
+    "fixture_rows": {
+        "Customer": 50, "Employee": 20, "Product": 40, "Supplier": 15,
+        "SalesOrder": 200, "LineItem": 600, "InventoryLog": 300
+    },
+    "fixture_days": 730,                         # 日期列分布在最近N天内，使相对日期条件有结果
+    "recordings_path": "data/eval_recordings.jsonl",  # 录制的模型响应，离线评估时回放
+    "output_dir": "data/evaluation",
+    "accuracy_bar": 0.8,                         # 推荐模型需达到的执行准确率
+    "num_predict": 256,                          # 录制时每个回答最多生成的token数
+    "request_timeout": 600                       # 录制时单次生成的超时（秒）
+}
+
+# 提示词预算配置 - 按模型上下文预算选择schema表示（full → compact → minimal）
+PROMPT_BUDGET_CONFIG = {
+    "enabled": True,                             # 关闭时始终使用完整schema
+    "default_budget": 2048,                      # 未配置模型的提示词token预算（Ollama默认num_ctx）
+    "reserve_for_output": 256,                   # 为生成的SQL预留的token数
+    "model_budgets": {                           # 按模型名前缀匹配
+        "sqlcoder": 2048,
+        "mannix/defog-llama3-sqlcoder-8b": 4096,
+        "qwen2.5:0.5b": 1024,
+        "qwen2.5:1.5b": 1024,
+        "qwen2.5": 4096,
+        "deepseek-r1": 4096,
+        "QwQ": 8192
+    },
+    "max_records_per_model": 500                 # 每个模型保留的提示词规模/耗时记录数
+}
+
+# 结果存储配置 - 查询结果以列式缓冲区保存，超出预算时溢写到内存映射文件
+RESULT_STORE_CONFIG = {
+    "session_memory_budget_mb": 256,             # 单个会话常驻内存上限
+    "global_memory_budget_mb": 1024,             # 所有会话常驻内存上限
+    "spill_threshold_mb": 64,                    # 超过该大小的结果直接溢写
+    "disk_budget_mb": 4096,                      # 溢写文件总大小上限，超出按LRU淘汰
+    "max_results_per_session": 20,               # 每个会话保留的结果数
+    "spill_dir": "data/result_spill",
+    "decimal_as_float": True                     # Decimal列转为float64（否则保留为定点数，需要pyarrow）
+}
+
+# 查询缓存配置
+CACHE_CONFIG = {
+    "generation_cache_size": 256,                # SQL生成缓存条目数（按 模型+问题 缓存）
+    "result_cache_size": 128,                    # 查询结果缓存条目数（仅缓存只读查询）
+    "result_ttl": 300,                           # 查询结果缓存有效期（秒）
+    "coalesce_requests": True                    # 合并并发的相同问题生成和相同只读SQL执行
+}
+
+# 查询历史配置 - 本地SQLite记录每次查询，用于统计和启动预热
+HISTORY_CONFIG = {
+    "enabled": True,
+    "database_path": "data/query_history.sqlite3",
+    "max_rows": 100000,                          # 最多保留的历史记录条数
+    "warmup_enabled": True,                      # 启动时重放高频查询预热缓存
+    "warmup_top_n": 20,                          # 预热的高频查询数量
+    "warmup_days": 7                             # 只统计最近N天的历史
+}
+
+# 性能剖析配置 - 按请求或按采样率剖析查询，总耗时超过阈值的查询写入慢查询日志
+PROFILING_CONFIG = {
+    "sample_rate": 0.0,                          # 随机剖析的请求比例，0表示只剖析显式要求的请求
+    "profilers": ["sampling", "cprofile"],       # sampling: 栈采样（火焰图折叠栈）；cprofile: 确定性剖析（.prof）
+    "sampling_interval_ms": 5,                   # 栈采样间隔
+    "output_dir": "data/profiles",
+    "max_profiles": 200,                         # 保留的剖析文件数，超出删除最旧的
+    "slow_query_ms": 5000,                       # 总耗时超过该值写入慢查询日志
+    "slow_query_log": "data/slow_queries.jsonl",
+    "explain_slow_queries": True                 # 慢查询日志附带只读查询的EXPLAIN结果
+}
+
+# 索引建议配置 - index_advisor.py 汇总查询历史中的过滤条件、连接键和执行计划，生成建索引DDL供审阅（从不自动执行）
+INDEX_ADVISOR_CONFIG = {
+    "history_days": 30,                          # 分析最近N天的查询历史
+    "max_queries": 500,                          # 最多分析的不同SQL（按执行次数取前N个）
+    "min_frequency": 2,                          # 候选索引对应的查询至少执行的次数
+    "max_index_columns": 3,                      # 建议索引的最大列数
+    "max_suggestions": 10,
+    "default_table_rows": 1000,                  # 无法获取执行计划和表行数时假设的扫描行数
+    "indexed_scan_factor": 0.1,                  # 已走索引的表按扫描行数的该比例估算收益
+    "usage_weights": {                           # 各类用法的收益权重（等值/连接 > 范围 > 排序/分组）
+        "equality": 1.0, "join": 1.0, "range": 0.5, "order": 0.3, "group": 0.3
+    },
+    "verify_repeat": 3,                          # --verify 时每条查询的执行次数（取最快一次）
+    "output_dir": "data/index_advice",
+    "fixture_path": "data/index_fixture.sqlite3"  # 本地SQLite测试库（--build-fixture 按TABLE_INFO生成）
+}
+
+# 后台任务配置 - 查询作为任务提交到SQLite任务队列，由工作进程池执行，页面刷新后任务仍可查询
+JOB_QUEUE_CONFIG = {
+    "enabled": True,
+    "database_path": "data/job_queue.sqlite3",   # 多主机共同消费时放在共享目录
+    "journal_mode": "WAL",                       # 通过网络文件系统共享时改为DELETE（WAL依赖本机共享内存）
+    "result_dir": "data/job_results",            # 任务结果文件目录（多主机时同样需要共享）
+    "local_workers": 2,                          # 应用进程启动的工作进程数，0表示只由外部 job_queue.py 消费
+    "poll_interval": 1.0,                        # 空闲工作进程轮询队列的间隔（秒）
+    "heartbeat_interval": 2.0,                   # 运行中任务写心跳及检查取消请求的间隔（秒）
+    "stale_after": 60,                           # 心跳超过该时间未更新视为工作进程失联，只读的直接SQL任务重新排队
+    "max_attempts": 2,                           # 任务最多执行次数（可能包含写入的任务不重试）
+    "result_ttl_hours": 24                       # 已结束任务及结果文件的保留时间
+}
+
+# 增量刷新配置 - 重复执行的单表明细查询只拉取水位之后的新行并合并到缓存结果
+# 只适用于只追加的表：已有行的UPDATE/DELETE在下一次完整执行前不可见，默认关闭
+INCREMENTAL_REFRESH_CONFIG = {
+    "enabled": False,
+    # mode=key 使用自增主键水位（只对新增行精确）；mode=date 使用日期水位（日期列需出现在查询结果中）
+    "tables": {
+        "SalesOrder": {"mode": "key", "key": "SalesOrderID", "date": "OrderDate"},
+        "InventoryLog": {"mode": "key", "key": "LogID", "date": "ChangeDate"},
+        "LineItem": {"mode": "key", "key": "LineItemID"}
+    },
+    "max_entries": 64,                           # 最多缓存的查询数
+    "max_rows_per_entry": 200000,                # 结果超过该行数时不缓存
+    "full_refresh_interval": 300                 # 定期完整执行的间隔（秒），纠正更新和删除带来的偏差；不超过result_ttl
+}
+
+# 渐进式结果配置 - 耗时较长的只读查询先执行LIMIT或采样预览并显示近似结果，完整结果完成后替换预览（每次查询多一次预览查询，默认关闭）
+PROGRESSIVE_CONFIG = {
+    "enabled": False,
+    "preview_delay_ms": 500,                     # 完整查询在该时间内未完成才执行预览，快查询不显示预览
+    "preview_rows": 100,                         # 明细查询预览的LIMIT
+    "sample_rows": 5000,                         # 聚合/排序查询的预览只统计大表最近N行（按主键倒序）
+    "sample_tables": {                           # 可采样的大表及其自增主键（取第一个出现在查询中的表）
+        "LineItem": "LineItemID",
+        "SalesOrder": "SalesOrderID",
+        "InventoryLog": "LogID"
+    },
+    "max_workers": 4                             # 执行预览查询的线程数（完整查询在请求线程中执行），预览与完整查询各占一个连接
+}
+
+# 批量SQL配置 - 直接SQL中的多条语句按读写表集合建立依赖，相互独立的只读语句在连接池的多个连接上并行执行
+BATCH_CONFIG = {
+    "enabled": True,
+    "max_workers": 4,                            # 同时执行的语句数（需小于连接池大小）
+    "max_statements": 100,                       # 单个脚本最多的语句数
+    "stop_on_error": True                        # 语句失败后不再开始新的语句（与mysql客户端一致）
+}
+
+# 预处理语句配置 - 重复执行的直接SQL参数化后使用服务端预处理语句（需要mysql-connector驱动）
+PREPARED_STATEMENT_CONFIG = {
+    "enabled": True,
+    "min_executions": 2,                         # 同一模板执行达到该次数后才预处理
+    "max_per_connection": 64,                    # 每个连接缓存的预处理语句数（受MySQL max_prepared_stmt_count限制）
+    "max_templates": 1000                        # 记录执行次数的模板数
+}
+
+# 只读副本配置 - 只读语句按权重分发到复制延迟在阈值内的副本，其余语句发往主库
+REPLICA_CONFIG = {
+    "enabled": False,
+    # 每个副本可填写连接参数，或直接用 "uri" 指定SQLAlchemy连接串（便于用本地实例替代）
+    "replicas": [
+        # {"host": "replica-1", "user": "root", "password": "MySecure123!", "database": "SalesOrderSchema", "weight": 1},
+    ],
+    "max_lag_seconds": 5,                        # 复制延迟超过该值的副本暂停接收读请求
+    "lag_check_interval": 10,                    # 复制延迟检查间隔（秒）
+    "read_after_write_seconds": 5,               # 写操作后该时间内的读请求仍发往主库，保证读到最新写入
+    "unhealthy_retry_seconds": 30                # 副本出错后暂停使用的时间（秒）
+}
+
 # 数据库表信息
 TABLE_INFO = """
 - Customer(CustomerID INT, FirstName VARCHAR(100), LastName VARCHAR(100), Email VARCHAR(255), Phone VARCHAR(20), BillingAddress TEXT, ShippingAddress TEXT, CustomerSince DATE, IsActive TINYINT)
@@ -119,6 +482,153 @@ TABLE_COLUMNS = {
     'Supplier': ['SupplierID', 'CompanyName', 'ContactName', 'ContactTitle', 'Address', 'Phone', 'Email']
 }
 
+# 表名同义词 - 用于识别问题中提到的表
+TABLE_SYNONYMS = {
+    'Customer': ['客户', '顾客', '用户', 'customer'],
+    'Employee': ['员工', '雇员', '职员', 'employee'],
+    'Product': ['产品', '商品', 'product'],
+    'SalesOrder': ['订单', 'order'],
+    'LineItem': ['订单明细', '订单项', '明细', '销售额', '销量', 'line item'],
+    'InventoryLog': ['库存变化', '库存记录', '库存日志', '出入库', 'inventory log'],
+    'Supplier': ['供应商', 'supplier']
+}
+
+# 列名同义词 - 按表配置，一个同义词可对应多列（如"姓名"对应名和姓）
+COLUMN_SYNONYMS = {
+    'Customer': {
+        'FirstName': ['名字'], 'LastName': ['姓氏'], 'Email': ['邮箱', '电子邮件', '邮件'],
+        'Phone': ['电话', '手机', '联系电话'], 'BillingAddress': ['账单地址'], 'ShippingAddress': ['收货地址', '地址'],
+        'CustomerSince': ['注册时间', '成为客户时间'], 'IsActive': ['是否激活', '激活状态']
+    },
+    'Employee': {
+        'FirstName': ['名字'], 'LastName': ['姓氏'], 'Email': ['邮箱', '电子邮件', '邮件'],
+        'Phone': ['电话', '手机', '联系电话'], 'HireDate': ['入职日期', '入职时间'],
+        'Position': ['职位', '岗位'], 'Salary': ['工资', '薪资', '薪水']
+    },
+    'Product': {
+        'ProductName': ['名称', '产品名称', '商品名称', '产品名'], 'Description': ['描述', '说明'],
+        'UnitPrice': ['价格', '单价', '售价'], 'StockQuantity': ['库存', '库存量', '库存数量'],
+        'ReorderLevel': ['重订水平', '补货水平'], 'Discontinued': ['是否停产']
+    },
+    'SalesOrder': {
+        'OrderDate': ['订单日期', '下单日期', '下单时间'], 'RequiredDate': ['要求日期'], 'ShippedDate': ['发货日期'],
+        'Status': ['状态', '订单状态'], 'Comments': ['备注'], 'PaymentMethod': ['支付方式', '付款方式'],
+        'IsPaid': ['是否付款', '是否已付款']
+    },
+    'LineItem': {
+        'Quantity': ['数量'], 'UnitPrice': ['价格', '单价'], 'Discount': ['折扣'], 'TotalPrice': ['总价', '金额']
+    },
+    'InventoryLog': {
+        'ChangeDate': ['变更日期', '变化日期'], 'QuantityChange': ['变化量', '数量变化', '变更数量'], 'Notes': ['备注']
+    },
+    'Supplier': {
+        'CompanyName': ['名称', '公司名称', '公司'], 'ContactName': ['联系人'], 'ContactTitle': ['联系人职位'],
+        'Address': ['地址'], 'Phone': ['电话', '联系电话'], 'Email': ['邮箱', '电子邮件', '邮件']
+    }
+}
+
+# 多列同义词（对应表中的多列）
+MULTI_COLUMN_SYNONYMS = {
+    '姓名': ['FirstName', 'LastName'],
+    '名字和姓氏': ['FirstName', 'LastName']
+}
+
+# 各表的标识列（条件查询时与条件列一起返回）和日期列（时间范围查询使用）
+TABLE_LABEL_COLUMNS = {
+    'Customer': ['FirstName', 'LastName'],
+    'Employee': ['FirstName', 'LastName'],
+    'Product': ['ProductName'],
+    'Supplier': ['CompanyName']
+}
+TABLE_DATE_COLUMNS = {
+    'Customer': 'CustomerSince',
+    'Employee': 'HireDate',
+    'SalesOrder': 'OrderDate',
+    'InventoryLog': 'ChangeDate'
+}
+
+# 问题模板配置 - 匹配固定句式的问题直接生成SQL，不调用模型
+# 模式中的占位符：{verb} 查询动词, {table} 表, {column} 列, {columns} 列列表, {number} 数字,
+# {year} 年份, {unit} 时间单位, {op} 比较运算, {order} 排序方向
+TEMPLATE_CONFIG = {
+    "enabled": True,
+    "max_limit": 1000                            # 模板生成的LIMIT上限
+}
+QUESTION_TEMPLATES = [
+    {
+        "name": "top_n",
+        "pattern": r"{verb}前{number}(?:个|条|名|位|家)?{table}(?:的)?(?:详细信息|信息|数据|记录|列表)?",
+        "sql": "SELECT * FROM {table} LIMIT {number};"
+    },
+    {
+        "name": "top_by_column",
+        "pattern": r"{verb}{column}{order}的(?:前{number}(?:个|条|名|位|家)?)?{table}",
+        "sql": "SELECT * FROM {table} ORDER BY {column} {order} LIMIT {number};",
+        "defaults": {"number": 1}
+    },
+    {
+        "name": "filter_compare",
+        "pattern": r"{verb}(?:所有)?{column}{op}{number}的{table}",
+        "sql": "SELECT {select_list} FROM {table} WHERE {column} {op} {number};"
+    },
+    {
+        "name": "recent_period",
+        "pattern": r"{verb}(?:最近|过去|近){number}{unit}(?:内)?的(?:所有)?{table}(?:的)?(?:信息|数据|记录)?",
+        "sql": "SELECT * FROM {table} WHERE {date_column} >= DATE_SUB(CURDATE(), INTERVAL {number} {unit});"
+    },
+    {
+        "name": "by_year",
+        "pattern": r"{verb}{year}年(?:的)?(?:所有|全部)?{table}(?:的)?(?:信息|数据|记录)?",
+        "sql": "SELECT * FROM {table} WHERE YEAR({date_column}) = {year};"
+    },
+    {
+        "name": "count_total",
+        "pattern": r"(?:统计|计算|查询)?(?:所有|全部)?{table}(?:的)?(?:总数|总数量|数量|个数)",
+        "sql": "SELECT COUNT(*) FROM {table};"
+    },
+    {
+        "name": "count_question",
+        "pattern": r"(?:一共|总共|共)?有多少(?:个|位|条|家|名)?{table}",
+        "sql": "SELECT COUNT(*) FROM {table};"
+    },
+    {
+        "name": "count_question_suffix",
+        "pattern": r"{table}(?:一共|总共|共)?有多少(?:个|位|条|家|名)?",
+        "sql": "SELECT COUNT(*) FROM {table};"
+    },
+    {
+        "name": "select_columns",
+        "pattern": r"{verb}(?:所有|全部)?(?:的)?{table}的{columns}",
+        "sql": "SELECT {columns} FROM {table};"
+    },
+    {
+        "name": "select_all",
+        "pattern": r"{verb}(?:所有|全部)?(?:的)?{table}(?:的)?(?:详细信息|信息|数据|记录|列表)?",
+        "sql": "SELECT * FROM {table};"
+    }
+]
+
+# 预测生成配置 - 用户输入问题时在后台提前生成SQL，提交的问题与之相同时直接使用
+SPECULATION_CONFIG = {
+    "enabled": True,                             # 是否在页面提供"输入时预生成"选项
+    "debounce_ms": 800,                          # 输入停止变化后等待的时间，期间再次变化则取消
+    "min_chars": 4,                              # 问题短于该长度时不预生成
+    "result_ttl": 300,                           # 预生成结果的有效期（秒）
+    "idle_poll_ms": 100                          # 前台有查询时推迟预生成的轮询间隔
+}
+
+# 对话模式配置 - 追问在上一轮SQL基础上修改，不重新完整生成
+CONVERSATION_CONFIG = {
+    "enabled": True,
+    "max_turns": 10,                             # 每个会话保留的对话轮数
+    "max_sessions": 1000,                        # 同时保留对话上下文的会话数，超出时淘汰最久未使用的会话
+    "deterministic_edits": True,                 # 能识别的追问（年份、最近N天、排序、前N条）直接改写SQL，不调用模型
+    "default_order": "DESC",                     # 追问只说"按X排序"时的排序方向
+    "follow_up_max_chars": 20,                   # 不匹配改写句式的问题不超过该长度且含指代/承接词时才视为追问，否则开始新对话
+    "max_limit": 1000,                           # 改写生成的LIMIT上限
+    "delta_schema_encoding": "compact"           # 发给模型的增量提示词中schema的编码（只包含相关的表）
+}
+
 # 应用配置
 APP_CONFIG = {
     "title": "🤖智能SQL查询助手🤖",
@@ -162,4 +672,43 @@ FEW_SHOT_EXAMPLES = [
         "input": "查找最近30天的订单",
         "query": "SELECT * FROM SalesOrder WHERE OrderDate >= DATE_SUB(CURDATE(), INTERVAL 30 DAY);"
     }
-]
\ No newline at end of file
+]
+
+# 各表查询示例 - 页面按表展示，同时作为模型评估的标注问题集
+TABLE_QUERY_EXAMPLES = {
+    "Customer": [
+        {"input": "查询所有活跃客户", "query": "SELECT * FROM Customer WHERE IsActive = 1;"},
+        {"input": "列出所有客户的名字、姓氏和邮箱", "query": "SELECT FirstName, LastName, Email FROM Customer;"},
+        {"input": "统计2024年以来新增的客户数量", "query": "SELECT COUNT(*) FROM Customer WHERE CustomerSince >= '2024-01-01';"}
+    ],
+    "Employee": [
+        {"input": "查询工资最高的10名员工", "query": "SELECT * FROM Employee ORDER BY Salary DESC LIMIT 10;"},
+        {"input": "统计每个职位的平均工资", "query": "SELECT Position, AVG(Salary) FROM Employee GROUP BY Position;"},
+        {"input": "查询2024年以来入职的员工", "query": "SELECT * FROM Employee WHERE HireDate >= '2024-01-01';"}
+    ],
+    "Product": [
+        {"input": "查询库存低于重订水平的产品", "query": "SELECT * FROM Product WHERE StockQuantity < ReorderLevel;"},
+        {"input": "查找单价超过100的产品名称和单价", "query": "SELECT ProductName, UnitPrice FROM Product WHERE UnitPrice > 100;"},
+        {"input": "查询所有未停产的产品", "query": "SELECT * FROM Product WHERE Discontinued = 0;"}
+    ],
+    "SalesOrder": [
+        {"input": "查询所有已完成的订单", "query": "SELECT * FROM SalesOrder WHERE Status = 'Completed';"},
+        {"input": "统计已付款的订单数量", "query": "SELECT COUNT(*) FROM SalesOrder WHERE IsPaid = 1;"},
+        {"input": "查询最近30天内下的订单", "query": "SELECT * FROM SalesOrder WHERE OrderDate >= CURDATE() - INTERVAL 30 DAY;"}
+    ],
+    "LineItem": [
+        {"input": "统计每个订单的明细总金额", "query": "SELECT SalesOrderID, SUM(TotalPrice) FROM LineItem GROUP BY SalesOrderID;"},
+        {"input": "统计每个产品的销售数量", "query": "SELECT ProductID, SUM(Quantity) FROM LineItem GROUP BY ProductID;"},
+        {"input": "查询有折扣的订单明细", "query": "SELECT * FROM LineItem WHERE Discount > 0;"}
+    ],
+    "InventoryLog": [
+        {"input": "查询最近7天的库存变化记录", "query": "SELECT * FROM InventoryLog WHERE ChangeDate >= CURDATE() - INTERVAL 7 DAY;"},
+        {"input": "统计每个产品的库存净变化量", "query": "SELECT ProductID, SUM(QuantityChange) FROM InventoryLog GROUP BY ProductID;"},
+        {"input": "查询所有库存减少的记录", "query": "SELECT * FROM InventoryLog WHERE QuantityChange < 0;"}
+    ],
+    "Supplier": [
+        {"input": "列出所有供应商的公司名称、联系人和邮箱", "query": "SELECT CompanyName, ContactName, Email FROM Supplier;"},
+        {"input": "查询有邮箱的供应商", "query": "SELECT * FROM Supplier WHERE Email IS NOT NULL;"},
+        {"input": "统计供应商数量", "query": "SELECT COUNT(*) FROM Supplier;"}
+    ]
+}
@@ -2,9 +2,151 @@
 数据库模块 - 处理数据库连接和操作
 """
 
+import time
+import logging
+import threading
 import streamlit as st
+from contextlib import contextmanager
+from sqlalchemy import create_engine, text
 from langchain_community.utilities import SQLDatabase
-from config import DATABASE_URI
+from config import DATABASE_URI, REPLICA_CONFIG
+from utils.sql_analyzer import sql_analyzer
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    """只读副本路由器 - 平滑加权轮询，并根据复制延迟和健康状态剔除副本"""
+    
+    # MySQL 8.0.22+ 使用REPLICA术语，旧版本使用SLAVE术语
+    LAG_QUERIES = (
+        ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+        ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+    )
+    
+    def __init__(self, config=None):
+        self.config = config or REPLICA_CONFIG
+        self.replicas = []
+        self._lock = threading.Lock()
+        self._last_write_at = 0.0
+        self.stats = {"primary": 0, "replica": 0, "replica_errors": 0}
+    
+    @staticmethod
+    def _build_uri(replica):
+        """根据副本配置生成连接串"""
+        if replica.get("uri"):
+            return replica["uri"]
+        return (
+            f"mysql+mysqlconnector://{replica['user']}:{replica['password']}"
+            f"@{replica['host']}/{replica['database']}"
+        )
+    
+    def connect(self):
+        """为每个副本创建独立的引擎（连接池）"""
+        self.replicas = [
+            {
+                "name": replica.get("name") or replica.get("host") or f"replica-{index}",
+                "engine": create_engine(self._build_uri(replica), pool_pre_ping=True),
+                "weight": replica.get("weight", 1),
+                "current_weight": 0,
+                "lag": None,
+                "lag_checked_at": 0.0,
+                "unhealthy_until": 0.0,
+                "queries": 0
+            }
+            for index, replica in enumerate(self.config["replicas"], 1)
+        ]
+    
+    def is_enabled(self):
+        """是否启用副本路由"""
+        return bool(self.config.get("enabled")) and bool(self.replicas)
+    
+    def _check_lag(self, replica):
+        """查询副本复制延迟（秒），非MySQL或未配置复制的替身实例视为无延迟"""
+        with replica["engine"].connect() as connection:
+            if connection.dialect.name != "mysql":
+                return 0
+            for query, column in self.LAG_QUERIES:
+                try:
+                    row = connection.execute(text(query)).mappings().first()
+                except Exception:
+                    # 语法不支持或缺少REPLICATION CLIENT权限时尝试下一种写法
+                    continue
+                if row is None:
+                    return 0
+                return row.get(column)
+        return 0
+    
+    def _refresh_lag(self, replica, now):
+        """按检查间隔刷新副本复制延迟"""
+        if now - replica["lag_checked_at"] < self.config.get("lag_check_interval", 10):
+            return
+        replica["lag_checked_at"] = now
+        try:
+            replica["lag"] = self._check_lag(replica)
+        except Exception as e:
+            self.mark_unhealthy(replica, e)
+    
+    def _is_eligible(self, replica, now):
+        """副本是否健康且复制延迟在阈值内（复制中断时延迟为None，视为不可用）"""
+        if now < replica["unhealthy_until"]:
+            return False
+        self._refresh_lag(replica, now)
+        return replica["lag"] is not None and replica["lag"] <= self.config.get("max_lag_seconds", 5)
+    
+    def record_write(self):
+        """记录写操作时间，用于读写一致性窗口"""
+        self._last_write_at = time.time()
+    
+    def mark_unhealthy(self, replica, error):
+        """副本出错后暂停使用一段时间"""
+        replica["unhealthy_until"] = time.time() + self.config.get("unhealthy_retry_seconds", 30)
+        self.stats["replica_errors"] += 1
+        logger.warning(f"只读副本 {replica['name']} 不可用: {error}")
+    
+    def select_replica(self, sql_query):
+        """
+        为SQL选择副本
+        
+        Returns:
+            dict: 选中的副本，返回None表示应发往主库
+        """
+        if not self.is_enabled() or not sql_analyzer.is_read_only(sql_query):
+            return None
+        
+        now = time.time()
+        if now - self._last_write_at < self.config.get("read_after_write_seconds", 5):
+            return None
+        
+        with self._lock:
+            candidates = [replica for replica in self.replicas if self._is_eligible(replica, now)]
+            if not candidates:
+                return None
+            # 平滑加权轮询
+            total_weight = sum(replica["weight"] for replica in candidates)
+            for replica in candidates:
+                replica["current_weight"] += replica["weight"]
+            selected = max(candidates, key=lambda replica: replica["current_weight"])
+            selected["current_weight"] -= total_weight
+            selected["queries"] += 1
+            return selected
+    
+    def get_status(self):
+        """获取各副本状态和路由统计"""
+        now = time.time()
+        return {
+            "stats": dict(self.stats),
+            "replicas": [
+                {
+                    "name": replica["name"],
+                    "weight": replica["weight"],
+                    "lag": replica["lag"],
+                    "healthy": now >= replica["unhealthy_until"],
+                    "queries": replica["queries"]
+                }
+                for replica in self.replicas
+            ]
+        }
 
 
 class DatabaseManager:
@@ -12,12 +154,18 @@ class DatabaseManager:
     
     def __init__(self):
         self.db = None
+        self.engine = None
+        self.replica_router = ReplicaRouter()
         # 不在初始化时连接，而是在需要时连接
     
     def _connect(self):
         """建立数据库连接"""
         try:
-            self.db = SQLDatabase.from_uri(DATABASE_URI)
+            # SQLDatabase与直接取数共用同一个引擎（连接池）
+            self.engine = create_engine(DATABASE_URI, pool_pre_ping=True)
+            self.db = SQLDatabase(self.engine)
+            if REPLICA_CONFIG["enabled"]:
+                self.replica_router.connect()
         except Exception as e:
             st.error(f"数据库连接失败: {str(e)}")
             raise ConnectionError(f"数据库连接失败: {str(e)}")
@@ -28,15 +176,71 @@ class DatabaseManager:
             self._connect()
         return self.db
     
-    def execute_query(self, sql_query):
-        """执行SQL查询"""
-        try:
-            if self.db is None:
-                self._connect()
-            return self.db.run(sql_query)
-        except Exception as e:
-            st.error(f"查询执行失败: {str(e)}")
-            return None
+    def get_engine(self):
+        """获取SQLAlchemy引擎"""
+        if self.engine is None:
+            self._connect()
+        return self.engine
+    
+    def fetch_rows(self, sql_query, params=None):
+        """
+        执行SQL并返回列名和原始行数据，只读语句在启用副本时路由到副本
+        
+        Returns:
+            Tuple[list, list]: (列名列表, 行元组列表)，非查询语句返回空列表
+        """
+        engine = self.get_engine()
+        replica = self.replica_router.select_replica(sql_query)
+        if replica is not None:
+            try:
+                rows = self._fetch_from_engine(replica["engine"], sql_query, params)
+                self.replica_router.stats["replica"] += 1
+                return rows
+            except Exception as e:
+                # 副本故障时回退主库
+                self.replica_router.mark_unhealthy(replica, e)
+        
+        self.replica_router.stats["primary"] += 1
+        if not sql_analyzer.is_read_only(sql_query):
+            self.replica_router.record_write()
+        return self._fetch_from_engine(engine, sql_query, params)
+    
+    def _fetch_from_engine(self, engine, sql_query, params=None):
+        """在指定引擎上执行SQL并返回列名和行数据"""
+        with engine.begin() as connection:
+            result = connection.execute(text(sql_query), params or {})
+            if not result.returns_rows:
+                return [], []
+            return list(result.keys()), [tuple(row) for row in result.fetchall()]
+    
+    @contextmanager
+    def single_connection(self):
+        """
+        占用主库的一个自动提交连接，生成在该连接上依次执行SQL的函数 fetch(sql) -> (列名, 行数据)
+        
+        用于依赖会话状态（会话变量、临时表、显式事务）的多语句脚本
+        """
+        with self.get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            def fetch(sql_query, params=None):
+                self.replica_router.stats["primary"] += 1
+                if not sql_analyzer.is_read_only(sql_query):
+                    self.replica_router.record_write()
+                result = connection.execute(text(sql_query), params or {})
+                if not result.returns_rows:
+                    return [], []
+                return list(result.keys()), [tuple(row) for row in result.fetchall()]
+            
+            yield fetch
+    
+    def get_read_engine(self, sql_query):
+        """获取执行该SQL应使用的引擎（只读语句可能返回副本引擎）"""
+        engine = self.get_engine()
+        replica = self.replica_router.select_replica(sql_query)
+        return replica["engine"] if replica is not None else engine
+    
+    def format_rows(self, rows):
+        """将行数据格式化为与SQLDatabase.run一致的字符串结果"""
+        return str([tuple(row) for row in rows]) if rows else ""
     
     def test_connection(self):
         """测试数据库连接"""
@@ -0,0 +1,386 @@
+"""
+模型评估脚本 - 用标注问题集比较各模型的执行准确率与生成性能，帮助选出满足准确率要求的最快模型
+
+- 标注问题集来自 FEW_SHOT_EXAMPLES 和 TABLE_QUERY_EXAMPLES（可用 --dataset 追加）
+- 标准SQL与模型生成的SQL在本地DuckDB测试库上执行，按结果集比较（执行准确率）
+- 默认离线运行：回放录制的模型响应；--record 时调用Ollama录制响应及耗时、tokens/s和内存占用
+
+使用方法:
+    python evaluate_models.py --record --models sqlcoder:7b,duckdb-nsql:7b       # 录制（需要Ollama）
+    python evaluate_models.py                                                # 离线评估
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from datetime import date, datetime
+from decimal import Decimal
+from collections import Counter
+
+# 添加当前目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+import requests
+from config import (
+    EVALUATION_CONFIG, OLLAMA_CONFIG, MODEL_PRELOAD_CONFIG, AVAILABLE_MODELS,
+    FEW_SHOT_EXAMPLES, TABLE_QUERY_EXAMPLES
+)
+from analytics_mirror import translate_mysql_to_duckdb, duckdb, DUCKDB_AVAILABLE
+from llm_model import llm_manager
+from utils.sql_processor import sql_processor
+from utils.fixture_data import generate_fixture_rows, base_type
+
+# MySQL类型 -> DuckDB类型
+FIXTURE_TYPES = {"INT": "INTEGER", "TINYINT": "TINYINT", "DECIMAL": "DECIMAL(12, 2)", "DATE": "DATE"}
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="评估各模型的执行准确率与生成性能")
+    parser.add_argument("--models", help="要评估的模型，逗号分隔，默认全部可用模型")
+    parser.add_argument("--record", action="store_true", help="调用Ollama录制模型响应（默认回放已录制的响应）")
+    parser.add_argument("--recordings", default=EVALUATION_CONFIG["recordings_path"], help="录制文件路径")
+    parser.add_argument("--fixture", default=EVALUATION_CONFIG["fixture_path"], help="DuckDB测试库路径")
+    parser.add_argument("--rebuild-fixture", action="store_true", help="重新生成测试库")
+    parser.add_argument("--dataset", help="追加的标注问题JSON文件，格式同FEW_SHOT_EXAMPLES")
+    parser.add_argument("--accuracy-bar", type=float, default=EVALUATION_CONFIG["accuracy_bar"], help="推荐模型的准确率要求")
+    parser.add_argument("--output", help="JSON报告路径，默认写入配置的输出目录")
+    return parser.parse_args(argv)
+
+
+def build_dataset(extra_path=None):
+    """汇总标注问题集，按问题去重"""
+    items = [{**example, "source": "few_shot"} for example in FEW_SHOT_EXAMPLES]
+    for table_name, examples in TABLE_QUERY_EXAMPLES.items():
+        items += [{**example, "source": table_name} for example in examples]
+    if extra_path:
+        with open(extra_path, encoding="utf-8") as f:
+            items += [{**example, "source": "extra"} for example in json.load(f)]
+    
+    dataset, seen = [], set()
+    for item in items:
+        if item["input"] not in seen:
+            seen.add(item["input"])
+            dataset.append(item)
+    return dataset
+
+
+def build_fixture(path, seed=None, row_counts=None, days=None):
+    """按TABLE_INFO生成DuckDB测试库（数据见 utils.fixture_data）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = duckdb.connect(temp_path)
+    try:
+        for table_name, (columns, rows) in generate_fixture_rows(seed, row_counts, days).items():
+            column_defs = ", ".join(
+                f"{column_name} {FIXTURE_TYPES.get(base_type(column_type), 'VARCHAR')}"
+                for column_name, column_type in columns
+            )
+            connection.execute(f"CREATE TABLE {table_name} ({column_defs})")
+            placeholders = ", ".join("?" for _ in columns)
+            connection.executemany(f"INSERT INTO {table_name} VALUES ({placeholders})", rows)
+    finally:
+        connection.close()
+    os.replace(temp_path, path)
+
+
+class FixtureDatabase:
+    """只读打开的DuckDB测试库，MySQL方言转换后执行"""
+    
+    def __init__(self, path):
+        self.connection = duckdb.connect(path, read_only=True)
+    
+    def execute(self, sql):
+        """执行SQL，返回 (行数据, 错误信息)"""
+        try:
+            return self.connection.execute(translate_mysql_to_duckdb(sql)).fetchall(), None
+        except Exception as e:
+            return None, str(e)
+    
+    def close(self):
+        """关闭连接"""
+        self.connection.close()
+
+
+def normalize_value(value):
+    """统一数值精度和日期格式，便于比较结果集"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float, Decimal)):
+        return round(float(value), 2)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def results_match(gold_rows, predicted_rows, ordered):
+    """
+    比较结果集：各行按列顺序逐列比较，标准SQL有ORDER BY时要求行顺序一致，否则按多重集比较
+    """
+    def normalize(rows):
+        return [tuple(normalize_value(value) for value in row) for row in rows]
+    gold, predicted = normalize(gold_rows), normalize(predicted_rows)
+    return gold == predicted if ordered else Counter(gold) == Counter(predicted)
+
+
+def build_prompt(question, dataset):
+    """评估用提示词：与模型预热共用的静态schema前缀 + 少样本示例（不含被评估的问题本身）+ 问题"""
+    examples = "\n\n".join(
+        f"Question: {example['input']}\nSQL: {example['query']}"
+        for example in FEW_SHOT_EXAMPLES if example["input"] != question
+    )
+    return (
+        f"{llm_manager.get_static_prompt_prefix()}\n\n### Examples\n{examples}\n\n"
+        f"### Task\nGenerate a MySQL query to answer the question. Return only the SQL.\n"
+        f"Question: {question}\nSQL:"
+    )
+
+
+def load_recordings(path):
+    """读取录制的模型响应: (模型, 问题) -> 记录"""
+    recordings = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    recordings[(record["model"], record["question"])] = record
+    return recordings
+
+
+def save_recordings(path, recordings):
+    """写回录制文件（同一模型和问题只保留最新一次）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for record in recordings.values():
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def record_model(model_name, dataset):
+    """调用Ollama录制一个模型对全部问题的响应，模型加载耗时单独记录，不计入生成耗时"""
+    base_url = OLLAMA_CONFIG["base_url"]
+    timeout = EVALUATION_CONFIG["request_timeout"]
+    load_response = requests.post(
+        f"{base_url}/api/generate",
+        json={"model": model_name, "keep_alive": MODEL_PRELOAD_CONFIG["keep_alive"], "stream": False},
+        timeout=timeout
+    )
+    load_response.raise_for_status()
+    load_seconds = load_response.json().get("load_duration", 0) / 1e9
+    try:
+        memory = llm_manager.get_running_models().get(model_name, {})
+    except Exception:
+        memory = {}
+    
+    records = []
+    for item in dataset:
+        record = {
+            "model": model_name,
+            "question": item["input"],
+            "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "load_seconds": load_seconds,
+            "memory_bytes": memory.get("size"),
+            "vram_bytes": memory.get("size_vram")
+        }
+        start_time = time.perf_counter()
+        try:
+            response = requests.post(
+                f"{base_url}/api/generate",
+                json={
+                    "model": model_name,
+                    "prompt": build_prompt(item["input"], dataset),
+                    "stream": False,
+                    "keep_alive": MODEL_PRELOAD_CONFIG["keep_alive"],
+                    "options": {"temperature": 0, "num_predict": EVALUATION_CONFIG["num_predict"]}
+                },
+                timeout=timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+            # Ollama返回的耗时单位为纳秒
+            record.update({
+                "response": data.get("response", ""),
+                "latency_ms": (time.perf_counter() - start_time) * 1000,
+                "prompt_eval_count": data.get("prompt_eval_count", 0),
+                "prompt_eval_ms": data.get("prompt_eval_duration", 0) / 1e6,
+                "eval_count": data.get("eval_count", 0),
+                "eval_ms": data.get("eval_duration", 0) / 1e6
+            })
+        except Exception as e:
+            record.update({"response": None, "latency_ms": (time.perf_counter() - start_time) * 1000, "error": str(e)})
+        records.append(record)
+    
+    # 卸载模型，避免影响下一个模型的内存占用测量
+    try:
+        requests.post(f"{base_url}/api/generate", json={"model": model_name, "keep_alive": 0}, timeout=timeout)
+    except Exception:
+        pass
+    return records
+
+
+def _percentile(values, fraction):
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(int(fraction * len(ordered) + 0.999999) - 1, 0)]
+
+
+def evaluate_model(model_name, dataset, recordings, fixture, gold_results):
+    """回放一个模型的录制响应并在测试库上评估"""
+    details = []
+    for item in dataset:
+        gold_rows = gold_results.get(item["input"])
+        if gold_rows is None:
+            continue
+        record = recordings.get((model_name, item["input"]))
+        detail = {"question": item["input"], "source": item["source"], "gold_sql": item["query"]}
+        if record is None:
+            details.append({**detail, "status": "missing"})
+            continue
+        if record.get("error"):
+            details.append({**detail, "status": "generation_error", "error": record["error"]})
+            continue
+        
+        predicted_sql = sql_processor.clean_sql_query(record["response"] or "") or ""
+        rows, error = fixture.execute(predicted_sql) if predicted_sql else (None, "未生成SQL")
+        ordered = bool(re.search(r'\bORDER\s+BY\b', item["query"], re.IGNORECASE))
+        if error:
+            status = "execution_error"
+        else:
+            status = "correct" if results_match(gold_rows, rows, ordered) else "wrong_result"
+        details.append({
+            **detail, "status": status, "predicted_sql": predicted_sql, "error": error,
+            "latency_ms": record["latency_ms"]
+        })
+    
+    recorded = [record for record in (recordings.get((model_name, item["input"])) for item in dataset) if record]
+    evaluated = [detail for detail in details if detail["status"] != "missing"]
+    latencies = [detail["latency_ms"] for detail in details if "latency_ms" in detail]
+    eval_tokens = sum(record.get("eval_count", 0) for record in recorded)
+    eval_ms = sum(record.get("eval_ms", 0) for record in recorded)
+    memory = max((record.get("memory_bytes") or 0 for record in recorded), default=0)
+    vram = max((record.get("vram_bytes") or 0 for record in recorded), default=0)
+    correct = sum(1 for detail in details if detail["status"] == "correct")
+    return {
+        "model": model_name,
+        "questions": len(details),
+        "evaluated": len(evaluated),
+        "complete": bool(details) and len(evaluated) == len(details),
+        "accuracy": correct / len(evaluated) if evaluated else None,
+        "executable_rate": (
+            sum(1 for detail in evaluated if detail["status"] in ("correct", "wrong_result")) / len(evaluated)
+            if evaluated else None
+        ),
+        "latency_p50_ms": _percentile(latencies, 0.5),
+        "latency_p95_ms": _percentile(latencies, 0.95),
+        "tokens_per_second": eval_tokens / (eval_ms / 1000) if eval_ms else None,
+        "load_seconds": max((record.get("load_seconds") or 0 for record in recorded), default=None),
+        "memory_mb": round(memory / 1024 / 1024) if memory else None,
+        "vram_mb": round(vram / 1024 / 1024) if vram else None,
+        "details": details
+    }
+
+
+def recommend(summaries, accuracy_bar):
+    """在完整评估且达到准确率要求的模型中选择生成延迟中位数最低的模型"""
+    qualified = [
+        summary for summary in summaries
+        if summary["complete"] and summary["accuracy"] is not None and summary["accuracy"] >= accuracy_bar
+        and summary["latency_p50_ms"] is not None
+    ]
+    return min(qualified, key=lambda summary: summary["latency_p50_ms"])["model"] if qualified else None
+
+
+def _format(value, pattern):
+    """格式化可能为空的数值"""
+    return "-" if value is None else pattern.format(value)
+
+
+def print_summary(summaries):
+    """按准确率从高到低打印各模型的评估结果"""
+    ranked = sorted(summaries, key=lambda summary: (summary["accuracy"] is None, -(summary["accuracy"] or 0)))
+    for summary in ranked:
+        if not summary["evaluated"]:
+            print(f"{summary['model']:<45} 未录制")
+            continue
+        print(
+            f"{summary['model']:<45} 准确率 {_format(summary['accuracy'], '{:6.1%}')} "
+            f"可执行 {_format(summary['executable_rate'], '{:6.1%}')} "
+            f"P50 {_format(summary['latency_p50_ms'], '{:7.0f}ms')} P95 {_format(summary['latency_p95_ms'], '{:7.0f}ms')} "
+            f"{_format(summary['tokens_per_second'], '{:6.1f}')} tok/s "
+            f"内存 {_format(summary['memory_mb'], '{}MB')} 显存 {_format(summary['vram_mb'], '{}MB')}"
+            + ("" if summary["complete"] else f"（仅 {summary['evaluated']}/{summary['questions']} 题有录制）")
+        )
+
+
+def main(argv=None):
+    """评估入口"""
+    args = parse_args(argv)
+    if not DUCKDB_AVAILABLE:
+        print("评估需要安装duckdb: pip install duckdb")
+        return 1
+    
+    models = [model.strip() for model in args.models.split(",")] if args.models else list(AVAILABLE_MODELS)
+    dataset = build_dataset(args.dataset)
+    recordings = load_recordings(args.recordings)
+    
+    if args.record:
+        for model_name in models:
+            print(f"录制 {model_name} ...")
+            try:
+                for record in record_model(model_name, dataset):
+                    recordings[(record["model"], record["question"])] = record
+            except Exception as e:
+                print(f"    录制失败: {e}")
+            save_recordings(args.recordings, recordings)
+    
+    if args.rebuild_fixture or not os.path.exists(args.fixture):
+        build_fixture(args.fixture)
+    fixture = FixtureDatabase(args.fixture)
+    try:
+        gold_results = {}
+        for item in dataset:
+            rows, error = fixture.execute(item["query"])
+            if error:
+                print(f"标准SQL无法在测试库执行，已跳过: {item['input']} ({error})")
+            else:
+                gold_results[item["input"]] = rows
+        summaries = [evaluate_model(model_name, dataset, recordings, fixture, gold_results) for model_name in models]
+    finally:
+        fixture.close()
+    
+    print(f"标注问题 {len(gold_results)} 个，准确率要求 {args.accuracy_bar:.0%}")
+    print_summary(summaries)
+    best = recommend(summaries, args.accuracy_bar)
+    print(f"推荐模型: {best}" if best else "没有模型达到准确率要求")
+    
+    output_path = args.output or os.path.join(
+        EVALUATION_CONFIG["output_dir"], f"evaluation_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "accuracy_bar": args.accuracy_bar,
+            "questions": len(gold_results),
+            "recommended_model": best,
+            "models": summaries
+        }, f, ensure_ascii=False, indent=2, default=str)
+    print(f"报告已写入 {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
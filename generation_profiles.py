@@ -0,0 +1,105 @@
+"""
+生成参数模块 - 按模型选择生成参数（输出上限、停止序列、线程/GPU层数），并按实测提示词长度确定num_ctx
+"""
+
+import threading
+from typing import Optional, Dict, Any
+from config import GENERATION_PROFILE_CONFIG, TABLE_INFO, FEW_SHOT_EXAMPLES
+from utils.prompt_budget import PromptBudgetManager
+
+
+class GenerationProfileManager:
+    """
+    按模型选择Ollama生成参数
+    
+    num_ctx = 提示词token数 × 估算余量 + num_predict + 预留，按 min_ctx 的2的幂次向上取整，不超过模型的 max_ctx；
+    同一模型只增不减（num_ctx变化会使Ollama重新加载模型，缩小上下文带来的收益不抵重新加载的开销）
+    """
+    
+    # 传给Ollama的参数（值为None时不传，使用模型默认值）
+    OPTION_NAMES = ("num_ctx", "num_predict", "stop", "num_thread", "num_gpu")
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or GENERATION_PROFILE_CONFIG
+        self._lock = threading.Lock()
+        # 模型 -> 当前使用的num_ctx
+        self._ctx_sizes = {}
+        self._typical_prompt_tokens = None
+        # 模型 -> {"calls", "ctx_growths", "last_prompt_tokens", "options"}
+        self.stats = {}
+    
+    def get_profile(self, model_name: str) -> Dict[str, Any]:
+        """获取模型的生成参数配置（按模型名前缀匹配，最长前缀优先，覆盖默认配置）"""
+        profiles = self.config.get("profiles", {})
+        matches = [prefix for prefix in profiles if model_name.startswith(prefix)]
+        profile = dict(self.config.get("default_profile", {}))
+        if matches:
+            profile.update(profiles[max(matches, key=len)])
+        return profile
+    
+    def typical_prompt_tokens(self) -> int:
+        """通用提示词（schema + 少样本示例）的token数，用于没有具体问题时（如预加载）确定num_ctx"""
+        if self._typical_prompt_tokens is None:
+            examples = "\n".join(f"{example['input']}\n{example['query']}" for example in FEW_SHOT_EXAMPLES)
+            self._typical_prompt_tokens = PromptBudgetManager.count_tokens(TABLE_INFO + "\n" + examples)
+        return self._typical_prompt_tokens
+    
+    def _size_context(self, prompt_tokens: int, num_predict: Optional[int], max_ctx: int) -> int:
+        """按提示词长度和输出上限计算num_ctx"""
+        needed = (
+            prompt_tokens * self.config.get("token_estimate_margin", 1.0)
+            + (num_predict or 0) + self.config.get("ctx_headroom", 0)
+        )
+        num_ctx = self.config.get("min_ctx", 2048)
+        while num_ctx < needed and num_ctx < max_ctx:
+            num_ctx *= 2
+        return min(num_ctx, max_ctx)
+    
+    def select(self, model_name: str, prompt_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        为一次调用选择生成参数
+        
+        Args:
+            prompt_tokens: 实测的提示词token数，未提供时按通用提示词估算
+        
+        Returns:
+            Dict[str, Any]: Ollama参数（已去掉未设置的项），关闭时为空字典
+        """
+        if not self.config.get("enabled", True):
+            return {}
+        profile = self.get_profile(model_name)
+        prompt_tokens = prompt_tokens if prompt_tokens is not None else self.typical_prompt_tokens()
+        num_ctx = self._size_context(prompt_tokens, profile.get("num_predict"), profile.get("max_ctx", 8192))
+        
+        with self._lock:
+            current = self._ctx_sizes.get(model_name, 0)
+            stats = self.stats.setdefault(model_name, {"calls": 0, "ctx_growths": 0})
+            if num_ctx > current:
+                if current:
+                    stats["ctx_growths"] += 1
+                self._ctx_sizes[model_name] = num_ctx
+            else:
+                num_ctx = current
+        return {
+            name: value for name, value in {**profile, "num_ctx": num_ctx}.items()
+            if name in self.OPTION_NAMES and value is not None
+        }
+    
+    def record(self, model_name: str, options: Dict[str, Any], prompt_tokens: Optional[int]):
+        """记录一次模型调用实际使用的生成参数"""
+        with self._lock:
+            stats = self.stats.setdefault(model_name, {"calls": 0, "ctx_growths": 0})
+            stats["calls"] += 1
+            stats["last_prompt_tokens"] = prompt_tokens
+            stats["options"] = dict(options)
+    
+    def get_stats(self, model_name: Optional[str] = None) -> Dict[str, Any]:
+        """获取各模型的调用次数、上下文扩大次数和最近一次使用的参数"""
+        with self._lock:
+            if model_name:
+                return dict(self.stats.get(model_name, {}))
+            return {name: dict(stats) for name, stats in self.stats.items()}
+
+
+# 全局生成参数管理器实例
+generation_profiles = GenerationProfileManager()
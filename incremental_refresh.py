@@ -0,0 +1,242 @@
+"""
+增量刷新模块 - 重复执行的单表明细查询只拉取水位之后的新行并合并到缓存结果
+"""
+
+import re
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, List, Dict, Any
+from sqlalchemy import text
+from config import INCREMENTAL_REFRESH_CONFIG, CACHE_CONFIG
+from database import database_manager
+from utils.sql_analyzer import sql_analyzer
+
+
+class IncrementalQueryCache:
+    """
+    增量刷新缓存
+    
+    支持两种水位：
+    - key: 自增主键水位，在同一事务中读取 MAX(主键) 和增量行，结果精确
+    - date: 日期水位，重新拉取水位当天的行并替换缓存中同一天的行（日期列需出现在结果中）
+    两种水位都只能发现新增的行，只适用于只追加的表；已有行的修改和删除要等到下一次完整执行才可见，
+    完整执行间隔不超过结果缓存的有效期，陈旧程度与普通结果缓存相同
+    """
+    
+    # 含有这些结构的查询不满足"新行只追加"的前提，回退到完整执行
+    INELIGIBLE_PATTERNS = (
+        r'\bJOIN\b', r'\bGROUP\s+BY\b', r'\bHAVING\b', r'\bDISTINCT\b', r'\bUNION\b',
+        r'\bLIMIT\b', r'\bOFFSET\b', r'\(\s*SELECT\b', r'\bNOW\s*\(', r'\bCURRENT_TIMESTAMP\b',
+        r'\bSYSDATE\s*\(', r'\bCURTIME\s*\(', r'\bRAND\s*\(', r'\bUUID\s*\('
+    )
+    
+    # 含有当天日期函数的查询在日期变化后需要完整执行
+    DAY_RELATIVE_PATTERN = r'\b(CURDATE\s*\(|CURRENT_DATE\b)'
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or INCREMENTAL_REFRESH_CONFIG
+        self.db_manager = database_manager
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"full": 0, "incremental": 0, "delta_rows": 0, "ineligible": 0}
+    
+    def is_enabled(self) -> bool:
+        """增量刷新是否启用"""
+        return bool(self.config.get("enabled"))
+    
+    def analyze(self, sql: str) -> Optional[Dict[str, Any]]:
+        """
+        分析查询是否满足增量刷新条件
+        
+        Returns:
+            Optional[Dict[str, Any]]: 查询形态信息（表、水位列、排序方向等），不满足返回None
+        """
+        if not sql_analyzer.is_read_only(sql) or sql_analyzer.is_aggregate_query(sql):
+            return None
+        
+        tables = sql_analyzer.extract_tables(sql)
+        if len(tables) != 1:
+            return None
+        table_name = next(iter(tables))
+        table_config = self.config["tables"].get(table_name)
+        if not table_config:
+            return None
+        
+        statement = sql_analyzer.strip_comments(sql).strip().rstrip(';').strip()
+        keyword_text = sql_analyzer.strip_literals(statement).upper()
+        if not keyword_text.startswith('SELECT'):
+            return None
+        if any(re.search(pattern, keyword_text) for pattern in self.INELIGIBLE_PATTERNS):
+            return None
+        
+        mode = table_config.get("mode", "key")
+        watermark_column = table_config["key"] if mode == "key" else table_config["date"]
+        
+        # 只允许按水位列排序，合并时才能保持顺序
+        base_sql, order_direction = statement, None
+        order_match = re.search(r'\bORDER\s+BY\s+(.+)$', statement, flags=re.IGNORECASE | re.DOTALL)
+        if order_match:
+            order_items = order_match.group(1).strip().split()
+            column = order_items[0].split('.')[-1].strip('`')
+            direction = order_items[1].upper() if len(order_items) > 1 else 'ASC'
+            if len(order_items) > 2 or column.lower() != watermark_column.lower() or direction not in ('ASC', 'DESC'):
+                return None
+            base_sql, order_direction = statement[:order_match.start()].rstrip(), direction
+        
+        return {
+            "table": table_name,
+            "mode": mode,
+            "watermark_column": watermark_column,
+            "base_sql": base_sql,
+            "order_by": order_match.group(0) if order_match else "",
+            "order_direction": order_direction,
+            "day_relative": bool(re.search(self.DAY_RELATIVE_PATTERN, keyword_text))
+        }
+    
+    @staticmethod
+    def _add_condition(base_sql: str, condition: str) -> str:
+        """向单表查询追加过滤条件"""
+        if re.search(r'\bWHERE\b', sql_analyzer.strip_literals(base_sql), flags=re.IGNORECASE):
+            where_match = re.search(r'\bWHERE\b', base_sql, flags=re.IGNORECASE)
+            return f"{base_sql[:where_match.end()]} ({base_sql[where_match.end():].strip()}) AND {condition}"
+        return f"{base_sql} WHERE {condition}"
+    
+    def _run_in_snapshot(self, shape: Dict[str, Any], sql: str, params: Dict[str, Any]):
+        """在同一事务（一致性快照）中读取水位上限并执行查询"""
+        engine = self.db_manager.get_read_engine(sql)
+        with engine.begin() as connection:
+            high = connection.execute(text(
+                f"SELECT MAX({shape['watermark_column']}) FROM {shape['table']}"
+            )).scalar()
+            result = connection.execute(text(sql), {**params, "_wm_high": high})
+            columns = list(result.keys())
+            rows = [tuple(row) for row in result.fetchall()]
+        return high, columns, rows
+    
+    def _full_execute(self, shape: Dict[str, Any], sql: str) -> Dict[str, Any]:
+        """完整执行查询并建立水位"""
+        if shape["mode"] == "key":
+            # 完整结果截止到同一快照内的主键上限，保证后续增量不重不漏
+            full_sql = self._add_condition(
+                shape["base_sql"], f"({shape['watermark_column']} <= :_wm_high OR :_wm_high IS NULL)"
+            )
+            high, columns, rows = self._run_in_snapshot(shape, f"{full_sql} {shape['order_by']}".strip(), {})
+        else:
+            high, columns, rows = self._run_in_snapshot(shape, sql, {})
+        
+        date_index = None
+        if shape["mode"] == "date":
+            lowered = [column.lower() for column in columns]
+            if shape["watermark_column"].lower() not in lowered:
+                # 结果中没有日期列，无法按水位替换，不建立增量缓存
+                return {"columns": columns, "rows": rows, "cacheable": False}
+            date_index = lowered.index(shape["watermark_column"].lower())
+        
+        self.stats["full"] += 1
+        return {
+            "columns": columns,
+            "rows": rows,
+            "cacheable": len(rows) <= self.config.get("max_rows_per_entry", 200000),
+            "watermark": high,
+            "date_index": date_index,
+            "created_at": time.time(),
+            "created_day": datetime.date.today(),
+            "shape": shape
+        }
+    
+    def _incremental_execute(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """只拉取水位之后的行并合并"""
+        shape = entry["shape"]
+        low = entry["watermark"]
+        column = shape["watermark_column"]
+        
+        if shape["mode"] == "key":
+            condition = (
+                f"{column} <= :_wm_high" if low is None else f"{column} > :_wm_low AND {column} <= :_wm_high"
+            )
+        else:
+            # 日期粒度为天，水位当天可能仍有新行写入，需要重新拉取当天数据
+            condition = "1 = 1" if low is None else f"{column} >= :_wm_low"
+        delta_sql = f"{self._add_condition(shape['base_sql'], condition)} {shape['order_by']}".strip()
+        
+        high, _, delta_rows = self._run_in_snapshot(shape, delta_sql, {"_wm_low": low})
+        if shape["mode"] == "key" and high is not None and low is not None and high < low:
+            # 主键水位回退（数据被清理或重建），需要完整执行
+            return self._full_execute(shape, f"{shape['base_sql']} {shape['order_by']}".strip())
+        
+        kept_rows = entry["rows"]
+        if shape["mode"] == "date" and low is not None:
+            kept_rows = [row for row in kept_rows if row[entry["date_index"]] is None or row[entry["date_index"]] < low]
+        
+        if shape["order_direction"] == "DESC":
+            rows = delta_rows + kept_rows
+        else:
+            rows = kept_rows + delta_rows
+        
+        self.stats["incremental"] += 1
+        self.stats["delta_rows"] += len(delta_rows)
+        return {
+            **entry,
+            "rows": rows,
+            "cacheable": len(rows) <= self.config.get("max_rows_per_entry", 200000),
+            "watermark": high if high is not None else low
+        }
+    
+    def _needs_full_refresh(self, entry: Dict[str, Any]) -> bool:
+        """判断缓存条目是否需要完整执行"""
+        interval = min(self.config.get("full_refresh_interval", 300), CACHE_CONFIG["result_ttl"])
+        if time.time() - entry["created_at"] > interval:
+            # 定期完整执行，纠正更新和删除带来的偏差
+            return True
+        return entry["shape"]["day_relative"] and entry["created_day"] != datetime.date.today()
+    
+    def execute(self, sql: str) -> Optional[Tuple[List[str], List[tuple], bool]]:
+        """
+        以增量方式执行查询
+        
+        Returns:
+            Optional[Tuple[List[str], List[tuple], bool]]: (列名, 行数据, 是否增量刷新)，
+            查询形态不满足条件返回None，由调用方完整执行
+        """
+        if not self.is_enabled():
+            return None
+        shape = self.analyze(sql)
+        if shape is None:
+            self.stats["ineligible"] += 1
+            return None
+        
+        cache_key = sql_analyzer.normalize_sql(sql)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+        
+        if entry is None or self._needs_full_refresh(entry):
+            entry, incremental = self._full_execute(shape, sql), False
+        else:
+            entry, incremental = self._incremental_execute(entry), True
+        
+        with self._lock:
+            if entry.get("cacheable"):
+                self._entries[cache_key] = entry
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.config.get("max_entries", 64):
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.pop(cache_key, None)
+        return entry["columns"], entry["rows"], incremental
+    
+    def invalidate_tables(self, tables):
+        """写操作后清除涉及相关表的缓存条目"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry["shape"]["table"] in tables]:
+                del self._entries[key]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取增量刷新统计"""
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
+
+
+# 全局增量刷新缓存实例
+incremental_cache = IncrementalQueryCache()
@@ -0,0 +1,675 @@
+"""
+索引建议模块 - 汇总查询历史中的过滤条件、连接键、排序/分组列和执行计划，按估算收益给出建索引DDL
+
+- 查询来自查询历史（自然语言生成的SQL与直接SQL按指纹合并），只分析只读查询
+- 谓词通过词法分析提取：等值/IN/IS NULL、范围/BETWEEN/前缀LIKE、跨表列相等（连接键）、ORDER BY/GROUP BY
+- 每个(查询, 表)按“等值列 → 排序列 → 范围列”组成候选索引，收益 = 执行次数 × 扫描行数（EXPLAIN）× 用法权重
+- 已被现有索引（含主键）最左前缀覆盖的候选被剔除，互为前缀的候选合并到较长的一个
+- 建议只输出为 .sql/.json 供审阅，从不在数据库上执行；--verify 只在本地SQLite测试库的副本上验证
+
+使用方法:
+    python index_advisor.py                                          # 分析MySQL上的查询历史
+    python index_advisor.py --sqlite data/index_fixture.sqlite3 --build-fixture --verify   # 本地SQLite测试库
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import date, datetime
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple
+
+# 添加当前目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from config import INDEX_ADVISOR_CONFIG, TABLE_COLUMNS
+from database import database_manager
+from query_history import query_history
+from utils.sql_analyzer import sql_analyzer
+from utils.fixture_data import generate_fixture_rows
+
+# 列引用：[表或别名.]列名
+_REF = r'(?:(\w+)\s*\.\s*)?(\w+)'
+
+# 列与值/列的比较：列 运算符 右侧
+_PREDICATE = re.compile(
+    rf'(?<![\w.]){_REF}\s*'
+    r'(<=>|<>|!=|<=|>=|=|<|>|\bNOT\s+IN\b|\bIN\b|\bIS\s+NOT\s+NULL\b|\bIS\s+NULL\b'
+    r'|\bNOT\s+LIKE\b|\bLIKE\b|\bNOT\s+BETWEEN\b|\bBETWEEN\b)'
+    rf'\s*(?:{_REF}\b(?!\s*\()|(\'%\'))?',
+    re.IGNORECASE
+)
+
+# 被函数包裹的列参与比较，如 YEAR(OrderDate) = ?
+_WRAPPED_PREDICATE = re.compile(
+    rf'\b(\w+)\s*\(\s*{_REF}\s*\)\s*(<=>|<>|!=|<=|>=|=|<|>|\bIN\b|\bBETWEEN\b)',
+    re.IGNORECASE
+)
+
+# WHERE/ON条件的结束位置（不按括号截断，子查询中的条件一并计入）
+_CLAUSE_END = r'\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\bUNION\b|\bWINDOW\b|;|$'
+
+# 不可能是表别名的关键字
+_NON_ALIAS = {
+    'WHERE', 'ON', 'USING', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'OUTER', 'CROSS', 'NATURAL', 'STRAIGHT_JOIN',
+    'GROUP', 'ORDER', 'LIMIT', 'HAVING', 'UNION', 'WINDOW', 'FOR', 'LOCK', 'SET', 'AS'
+}
+
+_EQUALITY_OPERATORS = ('=', '<=>', 'IN', 'IS NULL')
+_RANGE_OPERATORS = ('<', '>', '<=', '>=', 'BETWEEN', 'LIKE')
+
+
+def _mask_literals(sql: str) -> str:
+    """将字符串字面量替换为占位符：以%开头的（前导通配符）替换为'%'，其余替换为'?'"""
+    return re.sub(
+        r"'((?:[^'\\]|\\.|'')*)'",
+        lambda match: "'%'" if match.group(1).startswith('%') else "'?'",
+        sql
+    )
+
+
+class SQLiteBackend:
+    """
+    本地SQLite测试库
+    
+    MySQL方言通过自定义函数（YEAR/MONTH/DAY/CURDATE/NOW/DATEDIFF/CONCAT）和
+    DATE_SUB/DATE_ADD(x, INTERVAL n UNIT) -> date(x, '∓n unit') 的改写执行
+    """
+    
+    name = "sqlite"
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.create_function("YEAR", 1, lambda value: int(str(value)[:4]) if value else None)
+        self.connection.create_function("MONTH", 1, lambda value: int(str(value)[5:7]) if value else None)
+        self.connection.create_function("DAY", 1, lambda value: int(str(value)[8:10]) if value else None)
+        self.connection.create_function("CURDATE", 0, lambda: date.today().isoformat())
+        self.connection.create_function("NOW", 0, lambda: datetime.now().isoformat(sep=" ", timespec="seconds"))
+        self.connection.create_function(
+            "DATEDIFF", 2,
+            lambda left, right: (date.fromisoformat(str(left)[:10]) - date.fromisoformat(str(right)[:10])).days
+            if left and right else None
+        )
+        self.connection.create_function(
+            "CONCAT", -1, lambda *values: None if None in values else "".join(str(value) for value in values)
+        )
+        self._row_counts = None
+    
+    @staticmethod
+    def translate(sql: str) -> str:
+        """将MySQL日期运算改写为SQLite写法"""
+        def replace_interval(match):
+            sign = "-" if match.group(1).upper() == "SUB" else "+"
+            amount, unit = int(match.group(3)), match.group(4).lower()
+            if unit == "week":
+                amount, unit = amount * 7, "day"
+            return f"date({match.group(2)}, '{sign}{amount} {unit}s')"
+        
+        return re.sub(
+            r'\bDATE_(SUB|ADD)\s*\(\s*(.+?)\s*,\s*INTERVAL\s+(\d+)\s+(DAY|WEEK|MONTH|YEAR)S?\s*\)',
+            replace_interval, sql.replace('`', '"'), flags=re.IGNORECASE
+        )
+    
+    def execute(self, sql: str) -> List[tuple]:
+        """执行查询并返回全部行"""
+        return self.connection.execute(self.translate(sql.strip().rstrip(';'))).fetchall()
+    
+    def explain(self, sql: str) -> Dict[str, Dict[str, Any]]:
+        """
+        获取执行计划中各表（按别名）的访问方式
+        
+        SQLite执行计划不含行数估算（rows为None，按表行数计）；连接时临时建立的自动索引同样需要扫描全表
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: 表别名 -> {"full_scan", "rows", "index"}
+        """
+        plan = {}
+        for row in self.connection.execute(f"EXPLAIN QUERY PLAN {self.translate(sql.strip().rstrip(';'))}"):
+            detail = row[-1]
+            match = re.match(
+                r'(SCAN|SEARCH)\s+(?:TABLE\s+)?(\w+)(?:\s+AS\s+(\w+))?(?:.*?USING\s+(?:COVERING\s+)?INDEX\s+(\w+))?', detail
+            )
+            if not match:
+                continue
+            plan[(match.group(3) or match.group(2)).lower()] = {
+                "full_scan": match.group(1) == "SCAN" or "AUTOMATIC" in detail,
+                "rows": None,
+                "index": match.group(4) or ("PRIMARY" if "PRIMARY KEY" in detail else None)
+            }
+        return plan
+    
+    def table_rows(self) -> Dict[str, int]:
+        """各表行数"""
+        if self._row_counts is None:
+            self._row_counts = {}
+            for table in TABLE_COLUMNS:
+                try:
+                    self._row_counts[table] = self.connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                except sqlite3.Error:
+                    continue
+        return self._row_counts
+    
+    def existing_indexes(self) -> Dict[str, List[List[str]]]:
+        """各表现有索引的列（按索引列顺序）"""
+        indexes = {}
+        for table in TABLE_COLUMNS:
+            for index in self.connection.execute(f'PRAGMA index_list("{table}")').fetchall():
+                columns = [row[2] for row in self.connection.execute(f'PRAGMA index_info("{index[1]}")').fetchall()]
+                indexes.setdefault(table, []).append(columns)
+        return indexes
+    
+    def apply(self, ddl: str):
+        """执行建索引DDL（只用于 --verify 时的测试库副本）"""
+        self.connection.execute(ddl)
+        self.connection.execute("ANALYZE")
+        self.connection.commit()
+    
+    def close(self):
+        self.connection.close()
+
+
+class MySQLBackend:
+    """通过数据库管理器访问的MySQL（只执行EXPLAIN和information_schema查询）"""
+    
+    name = "mysql"
+    
+    def __init__(self, db_manager=None):
+        self.db_manager = db_manager or database_manager
+        self._row_counts = None
+    
+    def explain(self, sql: str) -> Dict[str, Dict[str, Any]]:
+        """获取执行计划中各表（按别名）的访问方式"""
+        columns, rows = self.db_manager.fetch_rows(f"EXPLAIN {sql.strip().rstrip(';')}")
+        plan = {}
+        for row in rows:
+            entry = dict(zip([column.lower() for column in columns], row))
+            if not entry.get("table"):
+                continue
+            plan[str(entry["table"]).lower()] = {
+                # ALL为全表扫描，index为全索引扫描，同样需要读取全部行
+                "full_scan": entry.get("type") in ("ALL", "index"),
+                "rows": int(entry.get("rows") or 0),
+                "index": entry.get("key")
+            }
+        return plan
+    
+    def table_rows(self) -> Dict[str, int]:
+        """各表行数（information_schema中的估算值）"""
+        if self._row_counts is None:
+            _, rows = self.db_manager.fetch_rows(
+                "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"
+            )
+            self._row_counts = {name: int(count or 0) for name, count in rows}
+        return self._row_counts
+    
+    def existing_indexes(self) -> Dict[str, List[List[str]]]:
+        """各表现有索引的列（按索引列顺序）"""
+        _, rows = self.db_manager.fetch_rows(
+            """
+            SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+            """
+        )
+        indexes = {}
+        for table, index_name, column in rows:
+            indexes.setdefault((table, index_name), []).append(column)
+        result = {}
+        for (table, _), columns in indexes.items():
+            result.setdefault(table, []).append(columns)
+        return result
+    
+    def close(self):
+        pass
+
+
+def build_sqlite_fixture(path: str, seed: Optional[int] = None, row_counts: Optional[Dict[str, int]] = None,
+                         days: Optional[int] = None):
+    """按TABLE_INFO生成SQLite测试库（数据与模型评估的DuckDB测试库相同），首列为主键，不建其它索引"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    try:
+        for table_name, (columns, rows) in generate_fixture_rows(seed, row_counts, days).items():
+            column_defs = ", ".join(
+                f"{column_name} {'INTEGER PRIMARY KEY' if position == 0 else column_type}"
+                for position, (column_name, column_type) in enumerate(columns)
+            )
+            connection.execute(f"CREATE TABLE {table_name} ({column_defs})")
+            placeholders = ", ".join("?" for _ in columns)
+            connection.executemany(
+                f"INSERT INTO {table_name} VALUES ({placeholders})",
+                [tuple(value.isoformat() if isinstance(value, date) else value for value in row) for row in rows]
+            )
+        connection.execute("ANALYZE")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temp_path, path)
+
+
+class IndexAdvisor:
+    """索引建议器"""
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or INDEX_ADVISOR_CONFIG
+        self._lock = threading.Lock()
+        self.last_report = None
+        self.known_tables = {name.lower(): name for name in TABLE_COLUMNS}
+        self.table_columns = {
+            table: {column.lower(): column for column in columns} for table, columns in TABLE_COLUMNS.items()
+        }
+    
+    def _aliases(self, text: str) -> Dict[str, str]:
+        """提取FROM/JOIN中的表及别名：别名或表名（小写） -> 表名"""
+        aliases = {}
+        
+        def register(name, alias):
+            table = self.known_tables.get(name.lower())
+            if table is None:
+                return
+            aliases[name.lower()] = table
+            if alias and alias.upper() not in _NON_ALIAS:
+                aliases[alias.lower()] = table
+        
+        for match in re.finditer(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', text, re.IGNORECASE):
+            register(match.group(1), match.group(2))
+        # 逗号分隔的多表FROM子句
+        for from_clause in re.finditer(
+            r'\bFROM\s+(.+?)(?=\bWHERE\b|\bGROUP\b|\bORDER\b|\bLIMIT\b|\bHAVING\b|\bJOIN\b|\bINNER\b|\bLEFT\b|\)|;|$)',
+            text, re.IGNORECASE | re.DOTALL
+        ):
+            for part in from_clause.group(1).split(',')[1:]:
+                words = re.findall(r'\w+', part)
+                if words:
+                    register(words[0], words[-1] if len(words) > 1 else None)
+        return aliases
+    
+    def _resolve(self, qualifier: Optional[str], column: str, aliases: Dict[str, str]) -> Optional[Tuple[str, str]]:
+        """
+        将列引用解析为 (表, 列)
+        
+        带限定符时按别名查找；不带限定符时只有查询中恰好一张表有该列才能确定
+        """
+        if qualifier:
+            table = aliases.get(qualifier.lower())
+            if table and column.lower() in self.table_columns[table]:
+                return table, self.table_columns[table][column.lower()]
+            return None
+        owners = {table for table in aliases.values() if column.lower() in self.table_columns[table]}
+        if len(owners) == 1:
+            table = owners.pop()
+            return table, self.table_columns[table][column.lower()]
+        return None
+    
+    def parse_query(self, sql: str) -> Dict[str, Any]:
+        """
+        词法分析查询中与索引相关的列用法
+        
+        Returns:
+            Dict[str, Any]: {"aliases", "usages": [(表, 列, 用法)], "joins": [((表, 列), (表, 列))], "notes": [(表, 列, 说明)]}
+        """
+        text = _mask_literals(sql_analyzer.strip_comments(sql)).replace('`', '')
+        aliases = self._aliases(text)
+        usages, joins, notes = [], [], []
+        
+        segments = [
+            match.group(1) for match in re.finditer(rf'\bWHERE\b(.*?)(?={_CLAUSE_END})', text, re.IGNORECASE | re.DOTALL)
+        ] + [
+            match.group(1) for match in re.finditer(
+                rf'\bON\b(.*?)(?=\bWHERE\b|\bJOIN\b|\bINNER\b|\bLEFT\b|\bRIGHT\b|\bCROSS\b|{_CLAUSE_END})',
+                text, re.IGNORECASE | re.DOTALL
+            )
+        ]
+        for segment in segments:
+            for match in _WRAPPED_PREDICATE.finditer(segment):
+                function, reference = match.group(1).upper(), self._resolve(match.group(2), match.group(3), aliases)
+                if reference and function not in ('IN', 'AND', 'OR', 'NOT'):
+                    # 函数包裹的列无法使用索引，按范围用法计入候选并提示改写
+                    usages.append((*reference, "range"))
+                    notes.append((*reference, f"{function}({reference[1]}) 无法使用索引，需改写为 {reference[1]} 的范围条件"))
+            
+            for match in _PREDICATE.finditer(segment):
+                reference = self._resolve(match.group(1), match.group(2), aliases)
+                if reference is None:
+                    continue
+                operator = re.sub(r'\s+', ' ', match.group(3).upper())
+                other = self._resolve(match.group(4), match.group(5), aliases) if match.group(5) else None
+                if other is not None:
+                    if operator == '=' and other[0] != reference[0]:
+                        joins.append((reference, other))
+                        usages.append((*reference, "join"))
+                        usages.append((*other, "join"))
+                    continue
+                if operator == 'LIKE' and match.group(6):
+                    notes.append((*reference, f"{reference[1]} LIKE '%...' 前导通配符无法使用索引"))
+                elif operator in _EQUALITY_OPERATORS:
+                    usages.append((*reference, "equality"))
+                elif operator in _RANGE_OPERATORS:
+                    usages.append((*reference, "range"))
+        
+        for keyword, kind in (("ORDER", "order"), ("GROUP", "group")):
+            for clause in re.finditer(
+                rf'\b{keyword}\s+BY\b(.*?)(?=\bLIMIT\b|\bHAVING\b|\bORDER\s+BY\b|\bUNION\b|\)|;|$)',
+                text, re.IGNORECASE | re.DOTALL
+            ):
+                for item in clause.group(1).split(','):
+                    match = re.fullmatch(rf'\s*{_REF}(?:\s+(?:ASC|DESC))?\s*', item, re.IGNORECASE)
+                    reference = self._resolve(match.group(1), match.group(2), aliases) if match else None
+                    if reference:
+                        usages.append((*reference, kind))
+        
+        return {"aliases": aliases, "usages": usages, "joins": joins, "notes": notes}
+    
+    def candidates(self, parsed: Dict[str, Any]) -> Dict[str, Tuple[str, ...]]:
+        """
+        为查询涉及的每张表组成候选索引列：等值/连接列 → 排序/分组列（无时取第一个范围列），按主键等值查找的表除外
+        
+        Returns:
+            Dict[str, Tuple[str, ...]]: 表 -> 候选索引列
+        """
+        max_columns = self.config.get("max_index_columns", 3)
+        by_table = {}
+        for table, column, kind in parsed["usages"]:
+            by_table.setdefault(table, {"equality": [], "order": [], "range": []})
+            bucket = {"join": "equality", "group": "order"}.get(kind, kind)
+            if column not in by_table[table][bucket]:
+                by_table[table][bucket].append(column)
+        
+        candidates = {}
+        for table, buckets in by_table.items():
+            # 主键等值查找最多返回一行，不需要其它索引
+            if TABLE_COLUMNS[table][0] in buckets["equality"]:
+                continue
+            columns = list(buckets["equality"])
+            trailing = [column for column in buckets["order"] if column not in columns] or [
+                column for column in buckets["range"][:1] if column not in columns
+            ]
+            columns.extend(trailing)
+            if columns:
+                candidates[table] = tuple(columns[:max_columns])
+        return candidates
+    
+    def _scanned_rows(self, table: str, parsed: Dict[str, Any], plan: Optional[Dict[str, Dict[str, Any]]],
+                      table_rows: Dict[str, int]) -> Tuple[float, bool]:
+        """按执行计划估算一次执行中该表被扫描的行数，返回 (行数, 是否全表扫描)"""
+        default_rows = table_rows.get(table) or self.config.get("default_table_rows", 1000)
+        if plan is None:
+            return default_rows, False
+        entries = [plan[alias] for alias, name in parsed["aliases"].items() if name == table and alias in plan]
+        if not entries:
+            return default_rows, False
+        full_scan = any(entry["full_scan"] for entry in entries)
+        rows = max(entry["rows"] or default_rows for entry in entries)
+        return (rows if full_scan else rows * self.config.get("indexed_scan_factor", 0.1)), full_scan
+    
+    def _covered(self, table: str, columns: Tuple[str, ...], existing: Dict[str, List[List[str]]]) -> bool:
+        """候选是否已是现有索引（含主键）的最左前缀"""
+        lowered = [column.lower() for column in columns]
+        indexes = existing.get(table, []) + [[TABLE_COLUMNS[table][0]]]
+        return any([column.lower() for column in index[:len(lowered)]] == lowered for index in indexes)
+    
+    def advise(self, workload: Optional[List[Dict[str, Any]]] = None, backend=None) -> Dict[str, Any]:
+        """
+        分析查询并给出索引建议
+        
+        Args:
+            workload: [{"sql_text", "frequency", ...}]，未提供时读取查询历史
+            backend: SQLiteBackend 或 MySQLBackend，默认MySQL
+        
+        Returns:
+            Dict[str, Any]: {"suggestions", "warnings", "analyzed", "skipped", "explain_failures", "backend"}
+        """
+        backend = backend or MySQLBackend()
+        if workload is None:
+            workload = query_history.get_sql_workload(self.config.get("history_days"), self.config.get("max_queries", 500))
+        weights = self.config.get("usage_weights", {})
+        try:
+            table_rows = backend.table_rows()
+        except Exception:
+            table_rows = {}
+        try:
+            existing = backend.existing_indexes()
+        except Exception:
+            existing = {}
+        
+        aggregated = {}
+        warnings = Counter()
+        analyzed = skipped = explain_failures = 0
+        for item in workload:
+            sql = item.get("sql_text")
+            if not sql or not sql_analyzer.is_read_only(sql):
+                skipped += 1
+                continue
+            frequency = item.get("frequency", 1)
+            parsed = self.parse_query(sql)
+            if not parsed["aliases"]:
+                skipped += 1
+                continue
+            analyzed += 1
+            try:
+                plan = backend.explain(sql)
+            except Exception:
+                plan = None
+                explain_failures += 1
+            for table, column, note in parsed["notes"]:
+                warnings[f"{table}.{column}: {note}"] += frequency
+            
+            for table, columns in self.candidates(parsed).items():
+                rows, full_scan = self._scanned_rows(table, parsed, plan, table_rows)
+                kinds = [kind for usage_table, column, kind in parsed["usages"] if usage_table == table and column in columns]
+                weight = max(weights.get(kind, 0.0) for kind in kinds)
+                entry = aggregated.setdefault((table, columns), {
+                    "table": table, "columns": list(columns), "benefit": 0.0, "executions": 0, "queries": 0,
+                    "full_scans": 0, "usage": Counter(), "notes": set(), "samples": []
+                })
+                entry["benefit"] += frequency * rows * weight
+                entry["executions"] += frequency
+                entry["queries"] += 1
+                entry["full_scans"] += frequency if full_scan else 0
+                entry["usage"].update({kind: frequency for kind in kinds})
+                entry["notes"].update(note for note_table, column, note in parsed["notes"]
+                                      if note_table == table and column in columns)
+                entry["samples"].append((frequency, sql))
+        
+        # 互为前缀的候选合并到较长的一个（较长索引同样满足前缀查询）
+        for key in sorted(aggregated, key=lambda key: len(key[1])):
+            table, columns = key
+            longer = [
+                other for other in aggregated
+                if other[0] == table and len(other[1]) > len(columns) and other[1][:len(columns)] == columns
+            ]
+            if longer:
+                target = aggregated[max(longer, key=lambda other: aggregated[other]["benefit"])]
+                source = aggregated.pop(key)
+                for field in ("benefit", "executions", "queries", "full_scans"):
+                    target[field] += source[field]
+                target["usage"].update(source["usage"])
+                target["notes"].update(source["notes"])
+                target["samples"].extend(source["samples"])
+        
+        min_frequency = self.config.get("min_frequency", 1)
+        suggestions = []
+        for (table, columns), entry in aggregated.items():
+            if entry["executions"] < min_frequency or self._covered(table, columns, existing):
+                continue
+            name = f"idx_{table.lower()}_{'_'.join(column.lower() for column in columns)}"[:64]
+            samples = sorted(entry["samples"], key=lambda sample: -sample[0])
+            suggestions.append({
+                "table": table,
+                "columns": entry["columns"],
+                "index_name": name,
+                "ddl": f"CREATE INDEX {name} ON {table} ({', '.join(columns)});",
+                "benefit": round(entry["benefit"], 1),
+                "executions": entry["executions"],
+                "queries": entry["queries"],
+                "full_scans": entry["full_scans"],
+                "usage": dict(entry["usage"]),
+                "notes": sorted(entry["notes"]),
+                # 执行次数最多的几条相关查询，供审阅和 --verify 使用
+                "sample_queries": [sql for _, sql in samples[:5]]
+            })
+        suggestions.sort(key=lambda suggestion: (-suggestion["benefit"], -suggestion["executions"]))
+        
+        report = {
+            "backend": backend.name,
+            "analyzed": analyzed,
+            "skipped": skipped,
+            "explain_failures": explain_failures,
+            "suggestions": suggestions[:self.config.get("max_suggestions", 10)],
+            "warnings": [{"warning": warning, "executions": count} for warning, count in warnings.most_common()]
+        }
+        with self._lock:
+            self.last_report = report
+        return report
+    
+    def verify(self, report: Dict[str, Any], fixture_path: str) -> Dict[str, Any]:
+        """
+        在SQLite测试库的临时副本上逐条验证建议：建索引后执行计划是否使用该索引，以及相关查询的耗时变化
+        
+        原测试库不被修改，每条建议单独验证（验证后丢弃副本）
+        """
+        repeat = self.config.get("verify_repeat", 3)
+        for suggestion in report["suggestions"]:
+            with tempfile.TemporaryDirectory() as directory:
+                copy_path = os.path.join(directory, os.path.basename(fixture_path))
+                shutil.copyfile(fixture_path, copy_path)
+                backend = SQLiteBackend(copy_path)
+                try:
+                    queries = suggestion["sample_queries"]
+                    before_ms = self._time_queries(backend, queries, repeat)
+                    backend.apply(suggestion["ddl"])
+                    used = any(
+                        entry["index"] == suggestion["index_name"]
+                        for sql in queries for entry in backend.explain(sql).values()
+                    )
+                    after_ms = self._time_queries(backend, queries, repeat)
+                    suggestion["verification"] = {
+                        "index_used": used, "before_ms": round(before_ms, 2), "after_ms": round(after_ms, 2),
+                        "speedup": round(before_ms / after_ms, 2) if after_ms else None
+                    }
+                except sqlite3.Error as e:
+                    suggestion["verification"] = {"error": str(e)}
+                finally:
+                    backend.close()
+        return report
+    
+    def _time_queries(self, backend: SQLiteBackend, queries: List[str], repeat: int) -> float:
+        """各查询执行repeat次取最快一次，返回总耗时（毫秒）"""
+        total_ms = 0.0
+        for sql in queries:
+            timings = []
+            for _ in range(repeat):
+                start_time = time.perf_counter()
+                backend.execute(sql)
+                timings.append((time.perf_counter() - start_time) * 1000)
+            total_ms += min(timings)
+        return total_ms
+    
+    def write_report(self, report: Dict[str, Any], output_dir: Optional[str] = None) -> Tuple[str, str]:
+        """写出建议DDL（.sql，只含注释和DDL，供审阅后手动执行）和完整报告（.json）"""
+        output_dir = output_dir or self.config.get("output_dir", "data/index_advice")
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d_%H%M%S')
+        sql_path = os.path.join(output_dir, f"index_advice_{stamp}.sql")
+        json_path = os.path.join(output_dir, f"index_advice_{stamp}.json")
+        with open(sql_path, "w", encoding="utf-8") as f:
+            f.write(f"-- 索引建议（{report['backend']}，分析 {report['analyzed']} 条查询），审阅后手动执行\n")
+            for rank, suggestion in enumerate(report["suggestions"], 1):
+                f.write(
+                    f"\n-- #{rank} 收益 {suggestion['benefit']} | 执行 {suggestion['executions']} 次 | "
+                    f"{suggestion['queries']} 条查询 | 全表扫描 {suggestion['full_scans']} 次\n"
+                )
+                for note in suggestion["notes"]:
+                    f.write(f"-- 注意: {note}\n")
+                f.write(suggestion["ddl"] + "\n")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return sql_path, json_path
+    
+    def get_last_report(self) -> Optional[Dict[str, Any]]:
+        """最近一次分析结果"""
+        with self._lock:
+            return self.last_report
+
+
+# 全局索引建议器实例
+index_advisor = IndexAdvisor()
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="根据查询历史生成索引建议（只输出DDL，不执行）")
+    parser.add_argument("--sqlite", help="在本地SQLite测试库上分析（默认连接MySQL）")
+    parser.add_argument("--build-fixture", action="store_true", help="（重新）生成 --sqlite 指定的测试库")
+    parser.add_argument("--verify", action="store_true", help="在SQLite测试库副本上建索引验证执行计划和耗时")
+    parser.add_argument("--days", type=int, default=INDEX_ADVISOR_CONFIG["history_days"], help="分析最近N天的历史")
+    parser.add_argument("--limit", type=int, default=INDEX_ADVISOR_CONFIG["max_queries"], help="最多分析的不同SQL数")
+    parser.add_argument("--output-dir", default=INDEX_ADVISOR_CONFIG["output_dir"], help="报告输出目录")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """索引建议入口"""
+    args = parse_args(argv)
+    if args.verify and not args.sqlite:
+        print("--verify 只能用于 --sqlite 测试库，不会在MySQL上建索引")
+        return 1
+    if args.sqlite and (args.build_fixture or not os.path.exists(args.sqlite)):
+        build_sqlite_fixture(args.sqlite)
+        print(f"已生成测试库 {args.sqlite}")
+    
+    workload = query_history.get_sql_workload(args.days, args.limit)
+    if not workload:
+        print("查询历史中没有可分析的查询")
+        return 0
+    backend = SQLiteBackend(args.sqlite) if args.sqlite else MySQLBackend()
+    try:
+        report = index_advisor.advise(workload, backend)
+    finally:
+        backend.close()
+    if args.verify:
+        index_advisor.verify(report, args.sqlite)
+    
+    print(
+        f"分析 {report['analyzed']} 条查询（跳过 {report['skipped']} 条，EXPLAIN失败 {report['explain_failures']} 条），"
+        f"建议 {len(report['suggestions'])} 个索引"
+    )
+    for rank, suggestion in enumerate(report["suggestions"], 1):
+        print(
+            f"{rank:>2}. {suggestion['ddl']}\n"
+            f"    收益 {suggestion['benefit']} | 执行 {suggestion['executions']} 次 | {suggestion['queries']} 条查询 | "
+            f"全表扫描 {suggestion['full_scans']} 次 | 用法 {suggestion['usage']}"
+        )
+        for note in suggestion["notes"]:
+            print(f"    注意: {note}")
+        verification = suggestion.get("verification")
+        if verification and "error" not in verification:
+            print(
+                f"    验证: {'使用索引' if verification['index_used'] else '未使用索引'} | "
+                f"{verification['before_ms']}ms -> {verification['after_ms']}ms"
+            )
+        elif verification:
+            print(f"    验证失败: {verification['error']}")
+    for warning in report["warnings"]:
+        print(f"提示: {warning['warning']}（{warning['executions']} 次）")
+    
+    sql_path, json_path = index_advisor.write_report(report, args.output_dir)
+    print(f"建议DDL已写入 {sql_path}（未执行），完整报告 {json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
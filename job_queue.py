@@ -0,0 +1,495 @@
+"""
+后台任务模块 - 将查询作为任务提交到本地任务队列，由工作进程池执行，页面通过任务ID轮询状态、取消任务和获取结果
+
+任务队列保存在SQLite文件中，多台主机挂载同一目录并各自运行工作进程即可共同消费队列
+
+使用方法（在其他主机上启动工作进程）:
+    python job_queue.py --processes 4
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import socket
+import datetime
+import sqlite3
+import logging
+import argparse
+import threading
+import multiprocessing
+from decimal import Decimal
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple
+from config import JOB_QUEUE_CONFIG
+from utils.sql_analyzer import sql_analyzer
+
+logger = logging.getLogger(__name__)
+
+# 结果文件中JSON不支持的值以带类型标记的对象保存
+_RESULT_DECODERS = {
+    "$decimal": Decimal,
+    "$datetime": datetime.datetime.fromisoformat,
+    "$date": datetime.date.fromisoformat,
+    "$time": datetime.time.fromisoformat,
+    "$timedelta": lambda seconds: datetime.timedelta(seconds=seconds),
+    "$bytes": base64.b64decode
+}
+
+
+def _encode_result_value(value):
+    """将结果中JSON不支持的值编码为带类型标记的对象"""
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"$time": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"$timedelta": value.total_seconds()}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$bytes": base64.b64encode(value).decode("ascii")}
+    return str(value)
+
+
+def _decode_result_value(obj: Dict[str, Any]):
+    """还原带类型标记的值"""
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        if tag in _RESULT_DECODERS:
+            return _RESULT_DECODERS[tag](value)
+    return obj
+
+
+class JobQueue:
+    """
+    SQLite任务队列
+    
+    任务状态: queued → running → succeeded / failed / cancelled
+    - 工作进程以写事务原子地领取任务，运行期间定期写心跳
+    - 心跳超时的任务视为工作进程失联：只读的直接SQL任务重新排队（超过最大尝试次数则标记失败），
+      其余任务可能已经执行了写入，标记为失败而不是重复执行（自然语言任务生成的SQL在失联前未知）
+    - 排队中的任务直接取消；运行中的任务设置取消标记，由执行它的工作进程在下次心跳时终止
+    """
+    
+    FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or JOB_QUEUE_CONFIG
+        self.db_path = self.config["database_path"]
+        self._initialized = False
+    
+    @contextmanager
+    def _connect(self):
+        """打开SQLite连接（自动提交模式，需要原子操作时显式开启写事务）"""
+        if not self._initialized:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.execute(f"PRAGMA journal_mode={self.config.get('journal_mode', 'WAL')}")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    session_id TEXT,
+                    status TEXT NOT NULL,
+                    submitted_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    heartbeat_at REAL,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    sql_text TEXT,
+                    row_count INTEGER,
+                    result_path TEXT,
+                    error TEXT
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, submitted_at)")
+            self._initialized = True
+        try:
+            yield connection
+        finally:
+            connection.close()
+    
+    @contextmanager
+    def _transaction(self):
+        """写事务：BEGIN IMMEDIATE 保证多个进程领取任务时互斥"""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+    
+    @staticmethod
+    def _to_job(row) -> Dict[str, Any]:
+        """将数据库行转换为任务字典"""
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+    
+    def submit(self, kind: str, payload: Dict[str, Any], session_id: Optional[str] = None) -> str:
+        """
+        提交任务
+        
+        Args:
+            kind: nl=自然语言查询, sql=直接SQL查询
+            payload: 任务参数，如 {"question": ..., "model": ...} 或 {"sql": ...}
+            session_id: 提交者标识（页面的客户端标识，刷新页面后不变）
+        
+        Returns:
+            str: 任务ID
+        """
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, payload, session_id, status, submitted_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), session_id, time.time())
+            )
+        return job_id
+    
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态"""
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+    
+    def list_jobs(self, limit: int = 20, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取最近提交的任务，可按提交者过滤"""
+        with self._connect() as connection:
+            if session_id:
+                rows = connection.execute(
+                    "SELECT * FROM jobs WHERE session_id = ? ORDER BY submitted_at DESC LIMIT ?", (session_id, limit)
+                ).fetchall()
+            else:
+                rows = connection.execute("SELECT * FROM jobs ORDER BY submitted_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_job(row) for row in rows]
+    
+    def cancel(self, job_id: str) -> bool:
+        """取消任务：排队中的任务立即取消，运行中的任务设置取消标记；已结束的任务返回False"""
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, error = '已取消' WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            if cursor.rowcount:
+                return True
+            cursor = connection.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+            )
+            return cursor.rowcount > 0
+    
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """领取最早提交的排队任务"""
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY submitted_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                """
+                UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1
+                WHERE id = ?
+                """,
+                (worker, now, now, row["id"])
+            )
+        return self._to_job(row)
+    
+    def heartbeat(self, job_id: str) -> bool:
+        """更新任务心跳，返回是否已请求取消"""
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+            row = connection.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+    
+    def finish(self, job_id: str, status: str, sql_text: Optional[str] = None, row_count: Optional[int] = None,
+               result_path: Optional[str] = None, error: Optional[str] = None) -> bool:
+        """
+        记录任务结果（只更新仍在运行的任务，已被取消或重新排队的任务不受影响）
+        
+        Returns:
+            bool: 是否更新成功
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                """
+                UPDATE jobs SET status = ?, finished_at = ?, sql_text = ?, row_count = ?, result_path = ?, error = ?
+                WHERE id = ? AND status = 'running'
+                """,
+                (status, time.time(), sql_text, row_count, result_path, error, job_id)
+            )
+            return cursor.rowcount > 0
+    
+    def save_result(self, job_id: str, columns: List[str], rows: List[tuple]) -> str:
+        """
+        将任务结果以JSON写入结果目录（先写临时文件再重命名，读取方不会看到不完整的文件）
+        
+        结果目录可能在多台主机间共享，只使用纯数据格式，读取时不会执行文件中的代码
+        """
+        result_dir = self.config["result_dir"]
+        os.makedirs(result_dir, exist_ok=True)
+        path = os.path.join(result_dir, f"{job_id}.json")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"columns": columns, "rows": rows}, f, ensure_ascii=False, default=_encode_result_value)
+        os.replace(temp_path, path)
+        return path
+    
+    def get_result(self, job_id: str) -> Optional[Tuple[List[str], List[tuple]]]:
+        """读取已成功任务的结果，返回 (列名, 行数据)"""
+        job = self.get_job(job_id)
+        path = job["result_path"] if job else None
+        if not job or job["status"] != "succeeded" or not path or not path.endswith(".json") or not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            result = json.load(f, object_hook=_decode_result_value)
+        return result["columns"], [tuple(row) for row in result["rows"]]
+    
+    @staticmethod
+    def _is_retryable(job: Dict[str, Any]) -> bool:
+        """工作进程失联后能否安全地重新执行：只有只读的直接SQL任务是幂等的"""
+        return job["kind"] == "sql" and sql_analyzer.is_read_only(job["payload"].get("sql", ""))
+    
+    def requeue_stale(self) -> int:
+        """
+        处理心跳超时的运行中任务：已请求取消的标记为取消，超过最大尝试次数或可能包含写入的标记为失败，
+        其余重新排队
+        
+        Returns:
+            int: 重新排队的任务数
+        """
+        now = time.time()
+        deadline = now - self.config["stale_after"]
+        with self._transaction() as connection:
+            connection.execute(
+                """
+                UPDATE jobs SET status = 'cancelled', finished_at = ?, error = '已取消'
+                WHERE status = 'running' AND heartbeat_at < ? AND cancel_requested = 1
+                """,
+                (now, deadline)
+            )
+            connection.execute(
+                """
+                UPDATE jobs SET status = 'failed', finished_at = ?, error = '工作进程失联，已达到最大尝试次数'
+                WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?
+                """,
+                (now, deadline, self.config["max_attempts"])
+            )
+            rows = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND heartbeat_at < ?", (deadline,)
+            ).fetchall()
+            requeued = 0
+            for row in rows:
+                if self._is_retryable(self._to_job(row)):
+                    connection.execute(
+                        """
+                        UPDATE jobs SET status = 'queued', worker = NULL, started_at = NULL, heartbeat_at = NULL
+                        WHERE id = ?
+                        """,
+                        (row["id"],)
+                    )
+                    requeued += 1
+                else:
+                    connection.execute(
+                        """
+                        UPDATE jobs SET status = 'failed', finished_at = ?,
+                            error = '工作进程失联，任务可能已执行写入，未自动重试'
+                        WHERE id = ?
+                        """,
+                        (now, row["id"])
+                    )
+            return requeued
+    
+    def purge_expired(self) -> int:
+        """删除超过保留时间的已结束任务及其结果文件"""
+        deadline = time.time() - self.config["result_ttl_hours"] * 3600
+        placeholders = ", ".join("?" for _ in self.FINISHED_STATUSES)
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT id, result_path FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?",
+                (*self.FINISHED_STATUSES, deadline)
+            ).fetchall()
+            for row in rows:
+                if row["result_path"] and os.path.exists(row["result_path"]):
+                    os.remove(row["result_path"])
+                connection.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+        return len(rows)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """按状态统计任务数"""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        stats = {status: 0 for status in ("queued", "running") + self.FINISHED_STATUSES}
+        stats.update({row["status"]: row["count"] for row in rows})
+        return stats
+
+
+def _quiet_streamlit_logs():
+    """工作进程中脱离Streamlit运行时调用页面函数会产生大量告警，只保留错误日志"""
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def _execute_job(engine, job: Dict[str, Any]):
+    """在工作进程中执行任务，返回 (是否成功, SQL, 错误信息, 列名, 行数据)"""
+    payload = job["payload"]
+    session_id = f"job-{job['id']}"
+    with engine.bind_session(session_id):
+        if job["kind"] == "nl":
+            success, result_id, sql_query, error_msg = engine.execute_natural_language_query(
+                payload["question"], payload["model"]
+            )
+        else:
+            success, result_id, sql_query, error_msg = engine.execute_direct_sql_query(payload["sql"])
+    columns = engine.result_store.get_columns(result_id) if success else None
+    rows = engine.result_store.get_rows(result_id) if success else None
+    engine.result_store.release_session(session_id)
+    return success, sql_query, error_msg, columns, rows
+
+
+def _watch_job(queue: JobQueue, job_id: str, done: threading.Event):
+    """心跳线程：定期写心跳，发现取消请求时标记任务已取消并结束进程，以中断进行中的模型调用和数据库查询"""
+    while not done.wait(queue.config["heartbeat_interval"]):
+        try:
+            if queue.heartbeat(job_id):
+                queue.finish(job_id, "cancelled", error="已取消")
+                logger.info(f"任务 {job_id} 已取消，工作进程退出")
+                os._exit(0)
+        except Exception as e:
+            logger.warning(f"更新任务心跳失败 {job_id}: {e}")
+
+
+def run_worker():
+    """工作进程主循环：领取任务并执行，直到进程被终止"""
+    from query_engine import query_engine
+    _quiet_streamlit_logs()
+    queue = JobQueue()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    last_maintenance = 0.0
+    while True:
+        if time.time() - last_maintenance > queue.config["stale_after"] / 2:
+            last_maintenance = time.time()
+            try:
+                queue.requeue_stale()
+                queue.purge_expired()
+            except Exception as e:
+                logger.warning(f"任务队列维护失败: {e}")
+        
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(queue.config["poll_interval"])
+            continue
+        
+        done = threading.Event()
+        threading.Thread(target=_watch_job, args=(queue, job["id"], done), name="job-heartbeat", daemon=True).start()
+        try:
+            success, sql_query, error_msg, columns, rows = _execute_job(query_engine, job)
+            if success:
+                path = queue.save_result(job["id"], columns, rows)
+                queue.finish(job["id"], "succeeded", sql_query, len(rows), path)
+            else:
+                queue.finish(job["id"], "failed", sql_query, error=error_msg)
+        except Exception as e:
+            logger.exception(f"任务执行失败 {job['id']}")
+            queue.finish(job["id"], "failed", error=str(e))
+        finally:
+            done.set()
+
+
+class JobWorkerPool:
+    """工作进程池：启动指定数量的工作进程，进程退出（如因取消任务而结束）后自动补充"""
+    
+    def __init__(self, processes: Optional[int] = None, config: Optional[Dict[str, Any]] = None):
+        self.config = config or JOB_QUEUE_CONFIG
+        self.processes = processes if processes is not None else self.config["local_workers"]
+        # 使用spawn启动，避免在多线程的Streamlit进程中fork
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = []
+        self._stop = threading.Event()
+        self._monitor = None
+        self.restarts = 0
+    
+    def _spawn(self, index: int):
+        """启动一个工作进程"""
+        process = self._context.Process(target=run_worker, name=f"job-worker-{index}", daemon=True)
+        process.start()
+        return process
+    
+    def _supervise(self):
+        """补充已退出的工作进程"""
+        while not self._stop.wait(self.config["poll_interval"]):
+            for index, process in enumerate(self._workers):
+                if not process.is_alive():
+                    process.join()
+                    self._workers[index] = self._spawn(index)
+                    self.restarts += 1
+    
+    def start(self):
+        """启动工作进程池（已启动时忽略）"""
+        if self.processes <= 0 or (self._monitor and self._monitor.is_alive()):
+            return
+        self._stop.clear()
+        self._workers = [self._spawn(index) for index in range(self.processes)]
+        self._monitor = threading.Thread(target=self._supervise, name="job-pool-monitor", daemon=True)
+        self._monitor.start()
+    
+    def stop(self):
+        """停止所有工作进程（运行中的任务会在心跳超时后重新排队）"""
+        self._stop.set()
+        for process in self._workers:
+            process.terminate()
+        for process in self._workers:
+            process.join(timeout=10)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """获取工作进程状态"""
+        return {
+            "processes": self.processes,
+            "alive": sum(1 for process in self._workers if process.is_alive()),
+            "restarts": self.restarts
+        }
+
+
+# 全局任务队列实例
+job_queue = JobQueue()
+
+# 全局工作进程池实例
+job_worker_pool = JobWorkerPool()
+
+
+def main(argv=None):
+    """独立运行工作进程池（用于在其他主机上消费共享队列）"""
+    parser = argparse.ArgumentParser(description="运行后台任务工作进程")
+    parser.add_argument("--processes", type=int, default=JOB_QUEUE_CONFIG["local_workers"] or 1, help="工作进程数")
+    args = parser.parse_args(argv)
+    
+    pool = JobWorkerPool(args.processes)
+    pool.start()
+    print(f"已启动 {args.processes} 个工作进程，队列: {os.path.abspath(JOB_QUEUE_CONFIG['database_path'])}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
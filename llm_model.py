@@ -2,10 +2,20 @@
 模型模块 - 处理Ollama模型初始化和管理
 """
 
+import time
+import logging
+import threading
+import requests
 import streamlit as st
 from langchain_ollama import OllamaLLM
-from config import OLLAMA_CONFIG, AVAILABLE_MODELS, MODEL_CATEGORIES
+from config import (
+    OLLAMA_CONFIG, AVAILABLE_MODELS, MODEL_CATEGORIES, RECOMMENDED_SQL_MODELS,
+    MODEL_PRELOAD_CONFIG, TABLE_INFO
+)
 from adapters.sqlcoder_adapter import SQLCoderAdapter
+from generation_profiles import generation_profiles
+
+logger = logging.getLogger(__name__)
 
 
 class LLMManager:
@@ -14,30 +24,51 @@ class LLMManager:
     def __init__(self):
         self.llm = None
         self.current_model = None
+        # 当前模型实例使用的生成参数
+        self.current_options = {}
+        # 模型预加载状态: 模型名 -> {"status", "load_seconds", "size", "size_vram", ...}
+        self.preload_status = {}
+        self._preload_thread = None
         # SQLCoder适配器将在需要时动态创建，以便传递正确的模型名称
         # 不在初始化时连接，而是在需要时连接
     
-    def _initialize_model(self, model_name=None):
-        """初始化Ollama模型"""
+    def _initialize_model(self, model_name=None, prompt_tokens=None):
+        """
+        初始化Ollama模型
+        
+        Args:
+            prompt_tokens: 实测的提示词token数，用于确定num_ctx（未提供时按通用提示词估算）
+        """
         try:
             # 使用传入的模型名称，如果没有则使用配置中的默认模型
             model_to_use = model_name or OLLAMA_CONFIG["model"]
+            options = generation_profiles.select(model_to_use, prompt_tokens)
             
             self.llm = OllamaLLM(
                 model=model_to_use,
                 base_url=OLLAMA_CONFIG["base_url"],
-                temperature=0
+                temperature=0,
+                keep_alive=MODEL_PRELOAD_CONFIG["keep_alive"],
+                **options
             )
             self.current_model = model_to_use
+            self.current_options = options
         except Exception as e:
             st.error(f"模型初始化失败: {str(e)}")
             raise ConnectionError(f"模型初始化失败: {str(e)}")
     
-    def get_model(self, model_name=None):
-        """获取模型实例"""
+    def get_model(self, model_name=None, prompt_tokens=None):
+        """
+        获取模型实例
+        
+        Args:
+            prompt_tokens: 本次调用实测的提示词token数，生成参数随之变化时重新创建模型实例
+        """
         # 如果没有模型实例，或者请求的模型与当前模型不同，则重新初始化
         if self.llm is None or (model_name and model_name != self.current_model):
-            self._initialize_model(model_name)
+            self._initialize_model(model_name, prompt_tokens)
+        elif prompt_tokens is not None and generation_profiles.select(self.current_model, prompt_tokens) != self.current_options:
+            self._initialize_model(self.current_model, prompt_tokens)
         return self.llm
     
     def test_connection(self, model_name=None):
@@ -57,7 +88,8 @@ class LLMManager:
         return {
             "model": self.current_model or OLLAMA_CONFIG["model"],
             "base_url": OLLAMA_CONFIG["base_url"],
-            "temperature": 0
+            "temperature": 0,
+            "options": dict(self.current_options)
         }
     
     def get_available_models(self):
@@ -109,6 +141,104 @@ class LLMManager:
         sqlcoder_adapter = SQLCoderAdapter(model_name=target_model)
         return sqlcoder_adapter.test_connection()
     
+    def get_preload_models(self):
+        """获取需要预加载的模型列表（显式配置优先，否则按推荐优先级）"""
+        models = MODEL_PRELOAD_CONFIG["models"] or RECOMMENDED_SQL_MODELS
+        return models[:MODEL_PRELOAD_CONFIG["max_models"]]
+    
+    def get_static_prompt_prefix(self):
+        """获取所有SQL生成提示词共享的静态schema前缀"""
+        return f"### Database Schema\nThe query will run on a database with the following schema:\n{TABLE_INFO}"
+    
+    def get_running_models(self):
+        """
+        通过 /api/ps 获取当前常驻内存的模型
+        
+        Returns:
+            dict: 模型名 -> {"size": 总占用字节, "size_vram": 显存占用字节, "expires_at": 过期时间}
+        """
+        response = requests.get(f"{OLLAMA_CONFIG['base_url']}/api/ps", timeout=10)
+        response.raise_for_status()
+        return {
+            model["name"]: {
+                "size": model.get("size", 0),
+                "size_vram": model.get("size_vram", 0),
+                "expires_at": model.get("expires_at")
+            }
+            for model in response.json().get("models", [])
+        }
+    
+    def preload_model(self, model_name):
+        """
+        加载并常驻单个模型，可选发送静态提示词前缀进行预热
+        
+        Returns:
+            dict: 预加载结果（状态、加载耗时、内存占用）
+        """
+        self.preload_status[model_name] = {"status": "loading"}
+        payload = {
+            "model": model_name,
+            "keep_alive": MODEL_PRELOAD_CONFIG["keep_alive"],
+            "stream": False
+        }
+        if not self.is_sqlcoder_model(model_name):
+            # 按通用提示词确定的num_ctx等参数加载，避免首个查询因参数不同而重新加载模型
+            # （SQLCoder模型由适配器调用，沿用适配器自身的参数）
+            payload["options"] = {
+                name: value for name, value in generation_profiles.select(model_name).items()
+                if name in ("num_ctx", "num_thread", "num_gpu")
+            }
+        if MODEL_PRELOAD_CONFIG["prime_prompt"]:
+            # 只生成1个token，目的是让服务端缓存静态前缀的计算结果
+            payload["prompt"] = self.get_static_prompt_prefix()
+            payload["options"] = {**payload.get("options", {}), "num_predict": 1, "temperature": 0}
+        
+        start_time = time.time()
+        try:
+            response = requests.post(
+                f"{OLLAMA_CONFIG['base_url']}/api/generate",
+                json=payload,
+                timeout=MODEL_PRELOAD_CONFIG["request_timeout"]
+            )
+            response.raise_for_status()
+            data = response.json()
+            status = {
+                "status": "ready",
+                "elapsed_seconds": time.time() - start_time,
+                # Ollama返回的耗时单位为纳秒
+                "load_seconds": data.get("load_duration", 0) / 1e9,
+                "prompt_eval_seconds": data.get("prompt_eval_duration", 0) / 1e9
+            }
+            try:
+                status.update(self.get_running_models().get(model_name, {}))
+            except Exception as e:
+                logger.warning(f"获取模型内存占用失败: {e}")
+        except Exception as e:
+            status = {"status": "failed", "error": str(e), "elapsed_seconds": time.time() - start_time}
+            logger.warning(f"模型预加载失败 {model_name}: {e}")
+        
+        self.preload_status[model_name] = status
+        return status
+    
+    def preload_models(self, models=None):
+        """按优先级依次预加载模型"""
+        return {model_name: self.preload_model(model_name) for model_name in (models or self.get_preload_models())}
+    
+    def start_preload_in_background(self, models=None):
+        """在后台线程中预加载模型，不阻塞页面渲染"""
+        if not MODEL_PRELOAD_CONFIG["enabled"] or (self._preload_thread and self._preload_thread.is_alive()):
+            return
+        self._preload_thread = threading.Thread(
+            target=self.preload_models, args=(models,), name="model-preload", daemon=True
+        )
+        self._preload_thread.start()
+    
+    def get_preload_status(self, model_name=None):
+        """获取模型预加载状态"""
+        if model_name:
+            return self.preload_status.get(model_name)
+        return dict(self.preload_status)
+    
     def switch_model(self, model_name):
         """切换模型"""
         if model_name in AVAILABLE_MODELS:
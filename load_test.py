@@ -0,0 +1,373 @@
+"""
+压测脚本 - 以多个模拟会话并发驱动查询引擎，逐级增加并发，
+报告每一级的吞吐、延迟分位数、排队时间和错误率
+
+模型请求发往本地Ollama替身服务（按token数模拟耗时），数据库使用配置中的或 --database-uri 指定的本地数据库
+
+使用方法:
+    python load_test.py --steps 1,2,4,8 --duration 20 --nl-ratio 0.7
+    python load_test.py --no-cache              # 关闭各级缓存和请求合并，每个请求都调用模型并执行SQL
+    python load_test.py --app --steps 1,2,4    # 通过Streamlit脚本运行器驱动完整页面
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import threading
+from collections import Counter
+
+# 添加当前目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+import config
+from config import LOAD_TEST_CONFIG, OLLAMA_CONFIG, AVAILABLE_MODELS, AUTO_MODEL, FEW_SHOT_EXAMPLES
+from utils.stub_ollama import StubOllamaServer
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="并发压测查询引擎")
+    parser.add_argument("--steps", default=",".join(str(step) for step in LOAD_TEST_CONFIG["concurrency_steps"]),
+                        help="各级并发会话数，逗号分隔")
+    parser.add_argument("--duration", type=float, default=LOAD_TEST_CONFIG["step_duration"], help="每一级持续时间（秒）")
+    parser.add_argument("--nl-ratio", type=float, default=LOAD_TEST_CONFIG["nl_ratio"], help="自然语言查询占比")
+    parser.add_argument("--think-time", type=float, default=LOAD_TEST_CONFIG["think_time"], help="会话请求间的平均间隔（秒）")
+    parser.add_argument("--model", default=OLLAMA_CONFIG["model"], help="自然语言查询使用的模型")
+    parser.add_argument("--workload", help="工作负载JSON文件，格式同FEW_SHOT_EXAMPLES（[{\"input\", \"query\"}]）")
+    parser.add_argument("--database-uri", help="覆盖配置中的数据库连接串（如本地测试库）")
+    parser.add_argument("--app", action="store_true", help="通过Streamlit脚本运行器驱动app.py，而不是直接调用查询引擎")
+    parser.add_argument("--app-timeout", type=float, default=120, help="页面模式下单次请求的超时（秒）")
+    parser.add_argument("--stub-parallel", type=int, default=LOAD_TEST_CONFIG["stub_parallel"], help="替身Ollama并行槽位")
+    parser.add_argument("--stub-ms-per-token", type=float, default=LOAD_TEST_CONFIG["stub_ms_per_token"],
+                        help="替身Ollama每个输出token的耗时（毫秒）")
+    parser.add_argument("--stub-prompt-ms-per-token", type=float, default=LOAD_TEST_CONFIG["stub_prompt_ms_per_token"],
+                        help="替身Ollama每个提示词token的耗时（毫秒）")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="关闭SQL生成/结果缓存、增量刷新、缓存预热、问题模板和请求合并，测量未命中缓存时的吞吐")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", help="JSON报告路径，默认写入配置的输出目录")
+    return parser.parse_args(argv)
+
+
+def load_workload(path):
+    """读取工作负载，未指定时使用少样本示例"""
+    if not path:
+        return list(FEW_SHOT_EXAMPLES)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def make_responder(workload):
+    """替身模型的应答：返回提示词中最后出现的工作负载问题对应的SQL（提示词中的示例问题出现在前面）"""
+    def respond(model_name, prompt):
+        best, position = workload[0], -1
+        for item in workload:
+            index = prompt.rfind(item["input"])
+            if index > position:
+                best, position = item, index
+        return best["query"]
+    return respond
+
+
+def disable_caches():
+    """关闭查询引擎的各级缓存、问题模板和请求合并，必须在导入查询引擎之前调用"""
+    config.CACHE_CONFIG.update({"generation_cache_size": 0, "result_cache_size": 0, "coalesce_requests": False})
+    config.TEMPLATE_CONFIG["enabled"] = False
+    config.INCREMENTAL_REFRESH_CONFIG["enabled"] = False
+    config.HISTORY_CONFIG["warmup_enabled"] = False
+
+
+def percentile(values, fraction):
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def summarize_latencies(values):
+    """汇总延迟分布（毫秒）"""
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p90": None, "p95": None, "p99": None, "max": None}
+    summary = {"count": len(values), "mean": round(sum(values) / len(values), 1)}
+    for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99)):
+        summary[name] = round(percentile(values, fraction), 1)
+    summary["max"] = round(max(values), 1)
+    return summary
+
+
+class EngineRunner:
+    """直接调用查询引擎的模拟会话"""
+    
+    def __init__(self, engine, session_id, model_name):
+        self.engine = engine
+        self.session_id = session_id
+        self.model_name = model_name
+    
+    def request(self, kind, item):
+        """执行一次请求，返回 (是否成功, 错误信息)"""
+        with self.engine.bind_session(self.session_id):
+            if kind == "nl":
+                success, _, _, error_msg = self.engine.execute_natural_language_query(item["input"], self.model_name)
+            else:
+                success, _, _, error_msg = self.engine.execute_direct_sql_query(item["query"])
+        return success, error_msg
+    
+    def close(self):
+        """释放会话在结果存储中的结果"""
+        self.engine.result_store.release_session(self.session_id)
+
+
+class AppRunner:
+    """通过Streamlit脚本运行器（AppTest）驱动完整页面的模拟会话，每个实例是一个独立的页面会话"""
+    
+    def __init__(self, script_path, model_name, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.app = AppTest.from_file(script_path, default_timeout=timeout)
+        self.app.run()
+        if model_name == AUTO_MODEL:
+            self._widget(self.app.selectbox, "选择模型类别").set_value("自动选择")
+        else:
+            self._widget(self.app.selectbox, "选择模型类别").set_value("全部模型")
+            self.app.run()
+            self._widget(self.app.selectbox, "选择具体模型").set_value(model_name)
+        self.app.run()
+    
+    @staticmethod
+    def _widget(widgets, label):
+        """按标签查找控件"""
+        return next(widget for widget in widgets if widget.label == label)
+    
+    def request(self, kind, item):
+        """在页面中输入并点击执行查询，页面出现异常或错误提示视为失败"""
+        self._widget(self.app.radio, "选择查询方式:").set_value("自然语言查询" if kind == "nl" else "直接SQL查询")
+        self.app.run()
+        if kind == "nl":
+            self.app.text_area(key="natural_language_input").set_value(item["input"])
+        else:
+            self.app.text_area(key="sql_input").set_value(item["query"])
+        self._widget(self.app.button, "🔍 执行查询").click()
+        self.app.run()
+        if self.app.exception:
+            return False, str(self.app.exception[0].message)
+        errors = [str(element.value) for element in self.app.error]
+        return not errors, "; ".join(errors)
+    
+    def close(self):
+        """页面会话随进程结束"""
+        pass
+
+
+class PoolSampler:
+    """后台线程定期采样数据库连接池占用"""
+    
+    def __init__(self, db_manager, interval):
+        self.db_manager = db_manager
+        self.interval = interval
+        self._stop = threading.Event()
+        self._samples = []
+        self._thread = None
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            engine = self.db_manager.engine
+            pool = getattr(engine, "pool", None)
+            if pool is not None and hasattr(pool, "checkedout"):
+                self._samples.append((pool.checkedout(), pool.size(), pool.overflow()))
+    
+    def start(self):
+        """开始采样"""
+        self._stop.clear()
+        self._samples = []
+        self._thread = threading.Thread(target=self._run, name="pool-sampler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止采样并返回汇总：池大小、最大/平均占用连接数、使用溢出连接的采样占比"""
+        self._stop.set()
+        self._thread.join()
+        if not self._samples:
+            return {"pool_size": None, "max_checked_out": None, "avg_checked_out": None, "overflow_ratio": None}
+        return {
+            "pool_size": self._samples[-1][1],
+            "max_checked_out": max(sample[0] for sample in self._samples),
+            "avg_checked_out": round(sum(sample[0] for sample in self._samples) / len(self._samples), 2),
+            "overflow_ratio": round(sum(1 for sample in self._samples if sample[2] > 0) / len(self._samples), 3)
+        }
+
+
+def run_session(runner, workload, nl_ratio, think_time, stop_event, records, rng):
+    """模拟会话：按比例随机发起自然语言或直接SQL请求，直到本级结束"""
+    while not stop_event.is_set():
+        kind = "nl" if rng.random() < nl_ratio else "sql"
+        item = rng.choice(workload)
+        start_time = time.perf_counter()
+        try:
+            success, error_msg = runner.request(kind, item)
+        except Exception as e:
+            success, error_msg = False, str(e)
+        records.append({
+            "kind": kind,
+            "latency_ms": (time.perf_counter() - start_time) * 1000,
+            "success": success,
+            "error": error_msg
+        })
+        if think_time > 0:
+            stop_event.wait(rng.expovariate(1 / think_time))
+
+
+def run_step(concurrency, runners, workload, args, stub, sampler, engine):
+    """运行一级并发，返回本级的统计"""
+    records = []
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(runners[index], workload, args.nl_ratio, args.think_time, stop_event, records,
+                  random.Random(args.seed * 10007 + concurrency * 101 + index)),
+            name=f"load-session-{index}",
+            daemon=True
+        )
+        for index in range(concurrency)
+    ]
+    
+    stub.drain_waits()
+    coalesced_before = engine.single_flight.get_stats()["coalesced"]
+    sampler.start()
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop_event.wait(args.duration)
+    stop_event.set()
+    # 等待进行中的请求完成，其耗时计入本级
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    pool_summary = sampler.stop()
+    
+    errors = [record for record in records if not record["success"]]
+    return {
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 2),
+        "requests": len(records),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(records), 4) if records else 0.0,
+        "throughput_rps": round(len(records) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": summarize_latencies([record["latency_ms"] for record in records]),
+        "nl_latency_ms": summarize_latencies([record["latency_ms"] for record in records if record["kind"] == "nl"]),
+        "sql_latency_ms": summarize_latencies([record["latency_ms"] for record in records if record["kind"] == "sql"]),
+        "llm_queue_wait_ms": summarize_latencies(stub.drain_waits()),
+        "pool": pool_summary,
+        "coalesced": engine.single_flight.get_stats()["coalesced"] - coalesced_before,
+        "top_errors": Counter(record["error"] for record in errors).most_common(3)
+    }
+
+
+def find_saturation(steps, gain):
+    """吞吐增幅首次低于阈值时，上一级的并发数即为饱和点；始终有明显增长时返回None"""
+    for previous, current in zip(steps, steps[1:]):
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 + gain):
+            return previous["concurrency"]
+    return None
+
+
+def _format_ms(value):
+    """格式化毫秒值，无数据显示为 -"""
+    return "-" if value is None else f"{value:.0f}ms"
+
+
+def print_step(step):
+    """打印一级的汇总"""
+    latency = step["latency_ms"]
+    pool = step["pool"]
+    pool_text = "-" if pool["max_checked_out"] is None else f"{pool['max_checked_out']}/{pool['pool_size']}"
+    print(
+        f"并发 {step['concurrency']:>3} | 请求 {step['requests']:>5} | 吞吐 {step['throughput_rps']:6.2f}/s | "
+        f"错误率 {step['error_rate']:6.1%} | P50 {_format_ms(latency['p50'])} P95 {_format_ms(latency['p95'])} "
+        f"P99 {_format_ms(latency['p99'])} | 模型排队P95 {_format_ms(step['llm_queue_wait_ms']['p95'])} | "
+        f"连接池峰值 {pool_text} | 合并 {step['coalesced']}"
+    )
+    for error_msg, count in step["top_errors"]:
+        print(f"    错误 x{count}: {error_msg[:200]}")
+
+
+def _quiet_streamlit_logs():
+    """脱离Streamlit运行时调用页面函数会产生大量告警，压测时只保留错误日志"""
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def main(argv=None):
+    """压测入口"""
+    args = parse_args(argv)
+    started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    steps = [int(step) for step in args.steps.split(",") if step.strip()]
+    workload = load_workload(args.workload)
+    
+    if args.database_uri:
+        # 必须在导入数据库模块之前设置
+        config.DATABASE_URI = args.database_uri
+    if args.no_cache:
+        disable_caches()
+        print("已关闭缓存、问题模板和请求合并")
+    stub = StubOllamaServer(
+        make_responder(workload), models=AVAILABLE_MODELS, parallel=args.stub_parallel,
+        prompt_ms_per_token=args.stub_prompt_ms_per_token, ms_per_token=args.stub_ms_per_token
+    ).start()
+    OLLAMA_CONFIG["base_url"] = stub.base_url
+    print(f"替身Ollama: {stub.base_url}（并行槽位 {args.stub_parallel}）")
+    
+    from query_engine import query_engine
+    _quiet_streamlit_logs()
+    sampler = PoolSampler(query_engine.db_manager, LOAD_TEST_CONFIG["pool_sample_interval"])
+    
+    runners, results = [], []
+    try:
+        for concurrency in steps:
+            # 逐级增加会话，已有会话在后续级别中继续使用
+            while len(runners) < concurrency:
+                if args.app:
+                    runners.append(AppRunner(os.path.join(current_dir, "app.py"), args.model, args.app_timeout))
+                else:
+                    runners.append(EngineRunner(query_engine, f"load-{len(runners)}", args.model))
+            step = run_step(concurrency, runners, workload, args, stub, sampler, query_engine)
+            print_step(step)
+            results.append(step)
+    finally:
+        for runner in runners:
+            runner.close()
+        stub.stop()
+    
+    saturation = find_saturation(results, LOAD_TEST_CONFIG["saturation_gain"])
+    if saturation is None:
+        print("各级吞吐均有明显增长，未达到饱和")
+    else:
+        print(f"吞吐在并发 {saturation} 后不再明显增长")
+    
+    report = {
+        "started_at": started_at,
+        "args": vars(args),
+        "steps": results,
+        "saturation_concurrency": saturation,
+        "stub": stub.stats,
+        "engine": query_engine.get_cache_stats()
+    }
+    output_path = args.output or os.path.join(
+        LOAD_TEST_CONFIG["output_dir"], f"load_test_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"报告已写入 {output_path}")
+    return 0 if results and all(step["error_rate"] < 1 for step in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+物化汇总表模块 - 维护常用聚合的汇总表，并将匹配的SQL透明改写为读取汇总表
+"""
+
+import re
+import time
+import logging
+import threading
+from typing import Optional, Dict, Any
+from sqlalchemy import text
+from config import MATERIALIZED_VIEWS_CONFIG
+from database import database_manager
+from utils.sql_analyzer import sql_analyzer
+
+logger = logging.getLogger(__name__)
+
+
+class MaterializationManager:
+    """汇总表管理器 - 负责建表、增量刷新、查询改写和命中统计"""
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or MATERIALIZED_VIEWS_CONFIG
+        self.db_manager = database_manager
+        self._lock = threading.RLock()
+        self._initialized = False
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+        # 刷新状态缓存: view_name -> {"watermark": int, "refreshed_at": float, "full_refreshed_at": float}
+        self._state = {}
+        self._compiled_rules = [
+            (view_name, re.compile(rule["pattern"]), rule)
+            for view_name, view in self.config["views"].items()
+            for rule in view.get("rewrites", [])
+        ]
+        self.stats = {
+            view_name: {"hits": 0, "stale_misses": 0, "refreshes": 0, "full_refreshes": 0, "errors": 0}
+            for view_name in self.config["views"]
+        }
+        self.stats_total = {"checked": 0, "rewritten": 0}
+    
+    def is_enabled(self) -> bool:
+        """汇总表改写是否启用"""
+        return bool(self.config.get("enabled"))
+    
+    def _ensure_tables(self):
+        """创建状态表和所有汇总表（DDL会隐式提交，单独执行）"""
+        if self._initialized:
+            return
+        state_table = self.config["state_table"]
+        with self.db_manager.get_engine().begin() as connection:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {state_table} ("
+                "ViewName VARCHAR(64) PRIMARY KEY, Watermark BIGINT NOT NULL, "
+                "RefreshedAt DOUBLE NOT NULL, FullRefreshedAt DOUBLE NOT NULL)"
+            ))
+            for view in self.config["views"].values():
+                connection.execute(text(view["ddl"]))
+            for view_name, watermark, refreshed_at, full_refreshed_at in connection.execute(
+                text(f"SELECT ViewName, Watermark, RefreshedAt, FullRefreshedAt FROM {state_table}")
+            ):
+                self._state[view_name] = {
+                    "watermark": watermark,
+                    "refreshed_at": refreshed_at,
+                    "full_refreshed_at": full_refreshed_at
+                }
+        self._initialized = True
+    
+    def refresh_view(self, view_name: str, full: bool = False) -> int:
+        """
+        刷新单个汇总表
+        
+        Args:
+            view_name: 汇总表名称
+            full: 是否强制全量重建
+        
+        Returns:
+            int: 本次处理的源表水位跨度
+        """
+        view = self.config["views"][view_name]
+        state_table = self.config["state_table"]
+        
+        with self._lock:
+            self._ensure_tables()
+            state = self._state.get(view_name)
+            now = time.time()
+            if state and now - state["full_refreshed_at"] > self.config.get("full_refresh_interval", 86400):
+                full = True
+            
+            with self.db_manager.get_engine().begin() as connection:
+                high = connection.execute(text(
+                    f"SELECT COALESCE(MAX({view['watermark_column']}), 0) FROM {view['source_table']}"
+                )).scalar()
+                
+                if state is None or full or high < state["watermark"]:
+                    # 首次刷新、定期重建或源表水位回退（如数据被清理）时全量重建
+                    connection.execute(text(f"DELETE FROM {view_name}"))
+                    for statement in view["full_refresh"]:
+                        connection.execute(text(statement), {"high": high})
+                    low = 0
+                    full_refreshed_at = now
+                    self.stats[view_name]["full_refreshes"] += 1
+                else:
+                    low = state["watermark"]
+                    full_refreshed_at = state["full_refreshed_at"]
+                    if high > low:
+                        for statement in view["incremental_refresh"]:
+                            connection.execute(text(statement), {"low": low, "high": high})
+                    self.stats[view_name]["refreshes"] += 1
+                
+                connection.execute(text(
+                    f"REPLACE INTO {state_table} (ViewName, Watermark, RefreshedAt, FullRefreshedAt) "
+                    "VALUES (:view_name, :watermark, :refreshed_at, :full_refreshed_at)"
+                ), {
+                    "view_name": view_name,
+                    "watermark": high,
+                    "refreshed_at": now,
+                    "full_refreshed_at": full_refreshed_at
+                })
+            
+            self._state[view_name] = {
+                "watermark": high,
+                "refreshed_at": now,
+                "full_refreshed_at": full_refreshed_at
+            }
+            return high - low
+    
+    def refresh_all(self, full: bool = False) -> Dict[str, int]:
+        """刷新所有汇总表，失败的表返回-1"""
+        results = {}
+        for view_name in self.config["views"]:
+            try:
+                results[view_name] = self.refresh_view(view_name, full=full)
+            except Exception as e:
+                self.stats[view_name]["errors"] += 1
+                results[view_name] = -1
+                logger.warning(f"汇总表刷新失败 {view_name}: {e}")
+        return results
+    
+    def start_background_refresh(self):
+        """启动后台周期刷新线程"""
+        if not self.is_enabled() or (self._refresh_thread and self._refresh_thread.is_alive()):
+            return
+        
+        def run():
+            while not self._stop_event.is_set():
+                self.refresh_all()
+                self._stop_event.wait(self.config.get("refresh_interval", 120))
+        
+        self._stop_event.clear()
+        self._refresh_thread = threading.Thread(target=run, name="materialized-views-refresh", daemon=True)
+        self._refresh_thread.start()
+    
+    def stop_background_refresh(self):
+        """停止后台刷新线程"""
+        self._stop_event.set()
+    
+    def get_staleness(self, view_name: str) -> Optional[float]:
+        """获取汇总表的数据延迟（秒），从未刷新返回None"""
+        state = self._state.get(view_name)
+        return None if state is None else time.time() - state["refreshed_at"]
+    
+    def _is_fresh(self, view_name: str) -> bool:
+        """检查汇总表是否在延迟上限内，必要时同步刷新"""
+        staleness = self.get_staleness(view_name)
+        if staleness is not None and staleness <= self.config.get("max_staleness", 300):
+            return True
+        if not self.config.get("refresh_on_stale", True):
+            return False
+        try:
+            self.refresh_view(view_name)
+            return True
+        except Exception as e:
+            self.stats[view_name]["errors"] += 1
+            logger.warning(f"汇总表同步刷新失败 {view_name}: {e}")
+            return False
+    
+    def rewrite(self, sql: str) -> Optional[str]:
+        """
+        尝试将SQL改写为读取汇总表
+        
+        Returns:
+            Optional[str]: 改写后的SQL，不匹配或汇总表过期返回None
+        """
+        if not self.is_enabled():
+            return None
+        
+        self.stats_total["checked"] += 1
+        normalized = sql_analyzer.normalize_sql(sql)
+        for view_name, pattern, rule in self._compiled_rules:
+            match = pattern.fullmatch(normalized)
+            if not match:
+                continue
+            if not self._is_fresh(view_name):
+                self.stats[view_name]["stale_misses"] += 1
+                return None
+            
+            values = dict(rule.get("defaults", {}))
+            values.update({key: value for key, value in match.groupdict().items() if value})
+            values.setdefault("tail", "")
+            if values["tail"]:
+                values["tail"] = " " + values["tail"].strip()
+            self.stats[view_name]["hits"] += 1
+            self.stats_total["rewritten"] += 1
+            return rule["rewrite"].format(**values)
+        return None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计和各汇总表延迟"""
+        return {
+            "total": dict(self.stats_total),
+            "views": {
+                view_name: {**stats, "staleness": self.get_staleness(view_name)}
+                for view_name, stats in self.stats.items()
+            }
+        }
+
+
+# 全局汇总表管理器实例
+materialization_manager = MaterializationManager()
@@ -0,0 +1,180 @@
+"""
+模型路由模块 - "auto"模式下按问题复杂度选择模型，并根据历史成功率和耗时调整选择
+"""
+
+import re
+import time
+import logging
+import threading
+from typing import Optional, Dict, Any, List
+from config import MODEL_ROUTING_CONFIG, TABLE_SYNONYMS
+from query_history import query_history
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRouter:
+    """按问题复杂度和历史表现选择模型"""
+    
+    LEVELS = ("simple", "medium", "complex")
+    
+    # 复杂度特征（中英文关键词）
+    FEATURE_PATTERNS = {
+        "aggregation": r'(统计|总数|总额|总计|合计|平均|最大|最小|最高|最低|数量|多少|\b(count|sum|avg|average|max|min|total)\b)',
+        "grouping": r'(每个|每种|每位|每月|每年|每天|各个|各类|分组|排名|排行|前\s*\d+\s*名|\b(top|each|per|group)\b)',
+        "date_logic": r'(\d{4}\s*年|\d+\s*(天|个月|周)|最近|季度|月份|日期|之前|之后|以来|今天|昨天|本周|上周|本月|上月|今年|去年|\b(date|year|month|week|recent)\b)',
+        "nested": r'(没有|从未|不在|高于平均|低于平均|超过平均|同时|并且都|\b(never|without|above average|below average)\b)'
+    }
+    
+    # 各特征的得分权重
+    FEATURE_WEIGHTS = {"aggregation": 1, "grouping": 1, "date_logic": 1, "nested": 2}
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or MODEL_ROUTING_CONFIG
+        self._lock = threading.Lock()
+        # (级别, 模型) -> {"total", "succeeded", "latency_ms"}，本进程内按级别记录的表现
+        self._level_stats = {}
+        # 模型 -> 查询历史中的整体表现，作为级别内样本不足时的先验
+        self._history_stats = {}
+        self._history_loaded_at = 0.0
+        self.stats = {level: 0 for level in self.LEVELS}
+        self.stats["escalations"] = 0
+    
+    def _mentioned_tables(self, question: str) -> List[str]:
+        """识别问题中提到的表（表名或同义词）"""
+        question_lower = question.lower()
+        tables = []
+        for table_name, synonyms in TABLE_SYNONYMS.items():
+            if table_name.lower() in question_lower or any(synonym in question_lower for synonym in synonyms):
+                tables.append(table_name)
+        # "订单明细"同时包含"订单"，只保留更具体的明细表时不视为两张表
+        if "LineItem" in tables and "SalesOrder" in tables and not re.search(r'订单(?!明细|项)', question):
+            tables.remove("SalesOrder")
+        return tables
+    
+    def classify(self, question: str) -> Dict[str, Any]:
+        """
+        评估问题复杂度
+        
+        Returns:
+            Dict[str, Any]: {"level": simple/medium/complex, "score": 得分, "tables": 提到的表, "features": 命中的特征}
+        """
+        tables = self._mentioned_tables(question)
+        features = {
+            name: bool(re.search(pattern, question, flags=re.IGNORECASE))
+            for name, pattern in self.FEATURE_PATTERNS.items()
+        }
+        # 每多一张表视为一次关联
+        score = max(len(tables) - 1, 0) * 2
+        score += sum(self.FEATURE_WEIGHTS[name] for name, hit in features.items() if hit)
+        
+        thresholds = self.config["thresholds"]
+        if score <= thresholds["simple"]:
+            level = "simple"
+        elif score <= thresholds["medium"]:
+            level = "medium"
+        else:
+            level = "complex"
+        return {"level": level, "score": score, "tables": tables, "features": features}
+    
+    def _refresh_history_stats(self):
+        """定期从查询历史读取各模型的整体表现"""
+        if time.time() - self._history_loaded_at < self.config.get("history_refresh_interval", 300):
+            return
+        self._history_loaded_at = time.time()
+        try:
+            self._history_stats = query_history.get_model_stats(self.config.get("history_days"))
+        except Exception as e:
+            logger.warning(f"读取模型历史表现失败: {e}")
+    
+    def _get_model_stats(self, level: str, model_name: str) -> Optional[Dict[str, Any]]:
+        """获取模型在该级别的表现，级别内样本不足时使用查询历史中的整体表现"""
+        level_stats = self._level_stats.get((level, model_name))
+        if level_stats and level_stats["total"] >= self.config["min_samples"]:
+            return {
+                "total": level_stats["total"],
+                "succeeded": level_stats["succeeded"],
+                "avg_total_ms": level_stats["latency_ms"] / max(level_stats["succeeded"], 1)
+            }
+        history_stats = self._history_stats.get(model_name)
+        if history_stats and history_stats["total"] >= self.config["min_samples"]:
+            return history_stats
+        return None
+    
+    def _rank_models(self, level: str) -> List[str]:
+        """
+        对级别内的候选模型排序：有足够样本且达标的模型按得分排序在前，
+        样本不足的模型保持配置顺序在后，成功率不达标的模型排除
+        """
+        ranked, unsampled = [], []
+        for model_name in self.config["tiers"][level]:
+            stats = self._get_model_stats(level, model_name)
+            if stats is None:
+                unsampled.append(model_name)
+                continue
+            success_rate = stats["succeeded"] / stats["total"]
+            if success_rate < self.config["min_success_rate"]:
+                continue
+            latency_seconds = (stats["avg_total_ms"] or 0) / 1000
+            ranked.append((success_rate - self.config["latency_weight"] * latency_seconds, model_name))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [model_name for _, model_name in ranked] + unsampled
+    
+    def plan(self, question: str) -> Dict[str, Any]:
+        """
+        为问题规划模型尝试顺序：起始级别的最佳模型，之后每次校验失败升级到更高级别的最佳模型
+        
+        Returns:
+            Dict[str, Any]: classify结果，外加 "models": 按尝试顺序排列的 (级别, 模型) 列表
+        """
+        with self._lock:
+            self._refresh_history_stats()
+            classification = self.classify(question)
+            start = self.LEVELS.index(classification["level"])
+            attempts = []
+            for level in self.LEVELS[start:]:
+                candidates = self._rank_models(level)
+                if candidates:
+                    attempts.append((level, candidates[0]))
+            if attempts:
+                # 最高级别仍失败时，依次尝试该级别的其他候选模型
+                last_level = attempts[-1][0]
+                attempts += [(last_level, model_name) for model_name in self._rank_models(last_level)[1:]]
+            else:
+                # 所有模型都不达标时仍使用最高级别配置的首个模型
+                attempts.append(("complex", self.config["tiers"]["complex"][0]))
+            classification["models"] = attempts[:self.config.get("max_escalations", 2) + 1]
+            self.stats[classification["level"]] += 1
+        return classification
+    
+    def record_outcome(self, level: str, model_name: str, success: bool, latency_ms: float):
+        """记录模型在某复杂度级别的一次结果（校验失败或执行失败记为失败）"""
+        with self._lock:
+            stats = self._level_stats.setdefault((level, model_name), {"total": 0, "succeeded": 0, "latency_ms": 0.0})
+            stats["total"] += 1
+            if success:
+                stats["succeeded"] += 1
+                stats["latency_ms"] += latency_ms
+    
+    def record_escalation(self):
+        """记录一次升级"""
+        with self._lock:
+            self.stats["escalations"] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取路由统计：各级别问题数、升级次数和各模型在各级别的表现"""
+        with self._lock:
+            return {
+                **self.stats,
+                "models": {
+                    f"{level}:{model_name}": {
+                        **stats,
+                        "success_rate": stats["succeeded"] / stats["total"] if stats["total"] else 0.0
+                    }
+                    for (level, model_name), stats in self._level_stats.items()
+                }
+            }
+
+
+# 全局模型路由实例
+model_router = ModelRouter()
@@ -0,0 +1,247 @@
+"""
+预处理语句模块 - 将重复执行的直接SQL参数化为模板，并在连接池的每个连接上缓存服务端预处理语句
+"""
+
+import re
+import logging
+import threading
+from decimal import Decimal
+from collections import OrderedDict
+from typing import Optional, Tuple, List, Dict, Any
+from config import PREPARED_STATEMENT_CONFIG
+from database import database_manager
+from utils.sql_analyzer import sql_analyzer
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedStatementExecutor:
+    """
+    服务端预处理语句执行器
+    
+    - 字符串和数字字面量替换为 ? 占位符，相同模板的语句共享一个预处理语句
+    - 每个连接的预处理游标保存在连接池连接的info字典中，连接存活期间复用
+    - 预处理失败的模板（如字面量出现在不允许参数的位置）记入黑名单，之后直接按文本执行；
+      连接中断、锁等待超时等执行错误直接抛出，不记入黑名单，也不会按文本重复执行
+    """
+    
+    # 按出现顺序匹配：注释、反引号标识符、字符串、数字
+    TOKEN_PATTERN = re.compile(
+        r"(?P<comment>--[^\n]*|#[^\n]*|/\*.*?\*/)"
+        r"|(?P<identifier>`(?:[^`]|``)*`)"
+        r"|(?P<string>'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\")"
+        r"|(?P<number>(?<![\w.])\d+(?:\.\d+)?\b)",
+        flags=re.DOTALL
+    )
+    
+    # ORDER BY / GROUP BY 子句的起止：子句内的数字是列序号，表达式须与SELECT列表一致（ONLY_FULL_GROUP_BY）
+    CLAUSE_TOKEN = re.compile(
+        r"[()]|\b(?P<clause>(?:ORDER|GROUP)\s+BY)\b|\b(?P<end>LIMIT|HAVING|WINDOW|FOR|UNION)\b|\b(?P<from>FROM)\b",
+        flags=re.IGNORECASE
+    )
+    
+    CACHE_KEY = "prepared_statements"
+    
+    # 说明模板本身无法预处理的服务端错误：语法错误、参数位置或参数不合法、语句不支持预处理协议、
+    # 占位符使分组表达式与SELECT列表不再一致（ONLY_FULL_GROUP_BY）
+    PREPARE_ERROR_CODES = {1055, 1056, 1064, 1149, 1210, 1295}
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or PREPARED_STATEMENT_CONFIG
+        self.db_manager = database_manager
+        self._lock = threading.Lock()
+        # 模板 -> 执行次数（LRU，限制模板数量）
+        self._template_counts = OrderedDict()
+        self._unpreparable = set()
+        self.stats = {"executions": 0, "prepared_executions": 0, "prepares": 0, "reuses": 0, "fallbacks": 0}
+    
+    def is_enabled(self) -> bool:
+        """预处理语句是否启用"""
+        return bool(self.config.get("enabled"))
+    
+    @staticmethod
+    def _unquote(literal: str) -> str:
+        """还原SQL字符串字面量的值"""
+        quote = literal[0]
+        body = literal[1:-1].replace(quote * 2, quote)
+        return re.sub(r"\\(.)", lambda match: {"n": "\n", "t": "\t", "0": "\0"}.get(match.group(1), match.group(1)), body)
+    
+    def _protected_spans(self, statement: str) -> List[Tuple[int, int]]:
+        """
+        不参数化的区间：外层SELECT列表以及各层的ORDER BY / GROUP BY 子句
+        （SELECT列表中的字面量会成为结果列名，参数化后列名变为"?"；
+        子句中的数字是列序号，其余字面量参数化后分组表达式与SELECT列表不再一致）
+        """
+        # 屏蔽字符串、注释和标识符后按括号深度查找子句边界
+        masked = self.TOKEN_PATTERN.sub(
+            lambda match: match.group(0) if match.lastgroup == "number" else "x" * len(match.group(0)), statement
+        )
+        spans = []
+        # 括号深度 -> 未结束子句的起点
+        open_clauses = {}
+        depth = 0
+        select_list_found = False
+        for match in self.CLAUSE_TOKEN.finditer(masked):
+            token = match.group(0)
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                if depth in open_clauses:
+                    spans.append((open_clauses.pop(depth), match.start()))
+                depth -= 1
+            elif match.lastgroup == "from":
+                if depth == 0 and not select_list_found:
+                    spans.append((0, match.start()))
+                    select_list_found = True
+            else:
+                if depth in open_clauses:
+                    spans.append((open_clauses.pop(depth), match.start()))
+                if match.lastgroup == "clause":
+                    open_clauses[depth] = match.start()
+        spans.extend((start, len(statement)) for start in open_clauses.values())
+        return spans
+    
+    def parameterize(self, sql: str) -> Tuple[str, List[Any]]:
+        """
+        将SQL中的字面量替换为占位符
+        
+        Returns:
+            Tuple[str, List[Any]]: (参数化模板, 参数列表)
+        """
+        statement = sql.strip().rstrip(';').strip()
+        protected = self._protected_spans(statement)
+        
+        parts, params, position = [], [], 0
+        for match in self.TOKEN_PATTERN.finditer(statement):
+            kind = match.lastgroup
+            if kind in ("comment", "identifier"):
+                continue
+            if any(start <= match.start() < end for start, end in protected):
+                continue
+            parts.append(statement[position:match.start()])
+            parts.append("?")
+            literal = match.group(0)
+            if kind == "string":
+                params.append(self._unquote(literal))
+            else:
+                params.append(Decimal(literal) if "." in literal else int(literal))
+            position = match.end()
+        parts.append(statement[position:])
+        return "".join(parts), params
+    
+    def _is_eligible(self, sql: str) -> bool:
+        """只有单条只读语句且驱动支持服务端预处理时才使用预处理语句"""
+        if not self.is_enabled() or not sql_analyzer.is_read_only(sql):
+            return False
+        if "?" in sql_analyzer.strip_literals(sql):
+            return False
+        return self.db_manager.get_engine().dialect.driver == "mysqlconnector"
+    
+    def _count_template(self, template: str) -> int:
+        """记录模板执行次数并返回累计次数"""
+        with self._lock:
+            count = self._template_counts.pop(template, 0) + 1
+            self._template_counts[template] = count
+            while len(self._template_counts) > self.config.get("max_templates", 1000):
+                self._template_counts.popitem(last=False)
+            return count
+    
+    def _get_cursor(self, connection, template: str):
+        """获取连接上缓存的预处理游标，不存在时创建（首次执行时在服务端预处理）"""
+        cache = connection.info.setdefault(self.CACHE_KEY, OrderedDict())
+        cursor = cache.pop(template, None)
+        reused = cursor is not None
+        if cursor is None:
+            cursor = connection.dbapi_connection.cursor(prepared=True)
+        cache[template] = cursor
+        while len(cache) > self.config.get("max_per_connection", 64):
+            # 关闭游标会在服务端释放对应的预处理语句
+            _, evicted = cache.popitem(last=False)
+            try:
+                evicted.close()
+            except Exception:
+                pass
+        return cursor, reused
+    
+    def _discard_cursor(self, connection, template: str):
+        """预处理或执行失败后丢弃缓存的游标"""
+        cursor = connection.info.get(self.CACHE_KEY, {}).pop(template, None)
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+    
+    def _is_prepare_error(self, error: Exception) -> bool:
+        """判断异常是否由预处理或预处理协议导致（而不是执行期间的瞬时错误）"""
+        errno = getattr(error, "errno", None)
+        if errno in self.PREPARE_ERROR_CODES:
+            return True
+        # 没有错误码的驱动异常来自客户端的参数转换或协议处理；其余带错误码的错误（锁等待超时、连接中断等）属于执行错误
+        return (errno is None or errno < 0) and not isinstance(error, (OSError, TimeoutError))
+    
+    def execute(self, sql: str) -> Optional[Tuple[List[str], List[tuple]]]:
+        """
+        以服务端预处理语句执行SQL
+        
+        Returns:
+            Optional[Tuple[List[str], List[tuple]]]: (列名, 行数据)；语句不适用预处理、
+            模板执行次数未达到阈值或预处理失败时返回None，由调用方按文本执行
+        
+        Raises:
+            Exception: 执行期间的错误（连接中断、锁等待超时等），调用方不应再按文本执行
+        """
+        if not self._is_eligible(sql):
+            return None
+        
+        template, params = self.parameterize(sql)
+        with self._lock:
+            self.stats["executions"] += 1
+            if template in self._unpreparable:
+                self.stats["fallbacks"] += 1
+                return None
+        if self._count_template(template) < self.config.get("min_executions", 2):
+            return None
+        
+        engine = self.db_manager.get_read_engine(sql)
+        with engine.connect() as connection:
+            pooled_connection = connection.connection
+            cursor, reused = self._get_cursor(pooled_connection, template)
+            try:
+                cursor.execute(template, tuple(params))
+                rows = [tuple(row) for row in cursor.fetchall()] if cursor.description else []
+                columns = [column[0] for column in cursor.description] if cursor.description else []
+            except Exception as e:
+                self._discard_cursor(pooled_connection, template)
+                if not self._is_prepare_error(e):
+                    raise
+                with self._lock:
+                    self._unpreparable.add(template)
+                    self.stats["fallbacks"] += 1
+                logger.info(f"预处理语句无法预处理，该模板改为文本执行: {e}")
+                return None
+            finally:
+                # 结束只读事务，避免连接归还前保留旧快照
+                pooled_connection.dbapi_connection.rollback()
+        
+        with self._lock:
+            self.stats["prepared_executions"] += 1
+            self.stats["reuses" if reused else "prepares"] += 1
+        return columns, rows
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预处理语句统计：模板数、预处理次数、复用次数和复用率"""
+        with self._lock:
+            prepared_executions = self.stats["prepared_executions"]
+            top_templates = sorted(self._template_counts.items(), key=lambda item: item[1], reverse=True)[:10]
+            return {
+                **self.stats,
+                "templates": len(self._template_counts),
+                "unpreparable": len(self._unpreparable),
+                "reuse_rate": self.stats["reuses"] / prepared_executions if prepared_executions else 0.0,
+                "top_templates": [{"template": template, "executions": count} for template, count in top_templates]
+            }
+
+
+# 全局预处理语句执行器实例
+prepared_executor = PreparedStatementExecutor()
@@ -0,0 +1,195 @@
+"""
+渐进式结果模块 - 耗时较长的只读查询先执行LIMIT或采样预览并显示近似结果，完整结果完成后替换预览
+"""
+
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+from config import PROGRESSIVE_CONFIG
+from utils.sql_analyzer import sql_analyzer
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressiveExecutor:
+    """
+    渐进式执行器
+    
+    预览有两种形式：
+    - limit: 无聚合、排序和去重的明细查询加上较小的LIMIT（结果是完整结果的前几行）
+    - sample: 聚合或排序查询把第一个出现的大表替换为按主键取最近N行的派生表（结果为近似值）
+    完整查询在调用线程中执行，线程池只执行预览查询（线程池排满时只会推迟预览，不会限制完整查询的并发）；
+    完整查询在预览等待时间内完成时不执行预览，避免快查询的结果闪烁
+    """
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or PROGRESSIVE_CONFIG
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = {
+            "runs": 0, "fast": 0, "previews": 0, "late_previews": 0, "no_preview": 0, "preview_failures": 0,
+            "preview_ms": 0.0, "full_ms": 0.0
+        }
+    
+    def is_enabled(self) -> bool:
+        """渐进式结果是否启用"""
+        return bool(self.config.get("enabled"))
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """按需创建执行预览查询的线程池"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.get("max_workers", 4), thread_name_prefix="progressive-preview"
+                )
+            return self._executor
+    
+    @staticmethod
+    def _mask(sql: str) -> str:
+        """将字符串字面量内容替换为空格（保持长度不变，用于在原SQL中定位）"""
+        return re.sub(
+            r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"",
+            lambda match: match.group(0)[0] + " " * (len(match.group(0)) - 2) + match.group(0)[-1],
+            sql
+        )
+    
+    def build_preview(self, sql: str) -> Optional[Dict[str, Any]]:
+        """
+        构造预览查询
+        
+        Returns:
+            Optional[Dict[str, Any]]: {"sql", "kind", "label"}，预览不会比完整查询更快时返回None
+        """
+        if not sql_analyzer.is_read_only(sql):
+            return None
+        statement = sql_analyzer.strip_comments(sql).strip().rstrip(';').strip()
+        masked = self._mask(statement)
+        keyword_text = masked.upper()
+        if not keyword_text.startswith('SELECT'):
+            return None
+        
+        preview_rows = self.config.get("preview_rows", 100)
+        limit_match = re.search(r'\bLIMIT\s+(\d+)(?:\s*(?:,|\bOFFSET\b)\s*(\d+))?\s*$', keyword_text)
+        detail_only = not (
+            sql_analyzer.is_aggregate_query(statement)
+            or re.search(r'\bORDER\s+BY\b|\bDISTINCT\b|\bUNION\b', keyword_text)
+        )
+        if detail_only:
+            limit_clause = f"LIMIT {preview_rows}"
+            if limit_match:
+                # LIMIT 偏移, 行数 / LIMIT 行数 OFFSET 偏移，预览保留偏移
+                if ',' in limit_match.group(0):
+                    offset, row_count = limit_match.group(1), int(limit_match.group(2))
+                    limit_clause = f"LIMIT {offset}, {preview_rows}"
+                else:
+                    offset, row_count = limit_match.group(2), int(limit_match.group(1))
+                    limit_clause += f" OFFSET {offset}" if offset else ""
+                if row_count <= preview_rows:
+                    return None
+                statement = statement[:limit_match.start()].rstrip()
+            return {
+                "sql": f"{statement} {limit_clause}",
+                "kind": "limit",
+                "label": f"前 {preview_rows} 行"
+            }
+        
+        sample_rows = self.config.get("sample_rows", 5000)
+        # 取查询中最先出现的大表
+        candidates = []
+        for table, key in self.config.get("sample_tables", {}).items():
+            match = re.search(
+                rf'\b(FROM|JOIN)\s+`?{table}\b`?(?:\s+(?:AS\s+)?(?!(?:WHERE|ON|USING|JOIN|INNER|LEFT|RIGHT|CROSS|'
+                rf'STRAIGHT_JOIN|GROUP|ORDER|LIMIT|HAVING|UNION)\b)(\w+))?',
+                masked, re.IGNORECASE
+            )
+            if match:
+                candidates.append((match, table, key))
+        if not candidates:
+            return None
+        match, table, key = min(candidates, key=lambda candidate: candidate[0].start())
+        alias = match.group(2) or table
+        derived = f"{match.group(1)} (SELECT * FROM {table} ORDER BY {key} DESC LIMIT {sample_rows}) AS {alias}"
+        return {
+            "sql": statement[:match.start()] + derived + statement[match.end():],
+            "kind": "sample",
+            "label": f"近似结果，只统计 {table} 最近 {sample_rows} 行"
+        }
+    
+    def run(self, sql: str, full_fn: Callable[[], Any], fetch_fn: Callable[[str], Any],
+            on_preview: Callable[[list, list, Dict[str, Any]], None], timings: dict) -> Any:
+        """
+        渐进式执行
+        
+        Args:
+            full_fn: 执行完整查询（在调用线程中执行）
+            fetch_fn: 执行预览SQL并返回 (列名, 行数据)，在线程池中调用，与完整查询各占一个连接
+            on_preview: 完整查询仍未完成时以 (列名, 行数据, 预览信息) 调用，用于显示预览（在线程池中调用）
+        
+        Returns:
+            Any: full_fn 的返回值
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + self.config.get("preview_delay_ms", 500) / 1000
+        done = threading.Event()
+        show_lock = threading.Lock()
+        self._get_executor().submit(self._preview, sql, fetch_fn, on_preview, timings, deadline, done, show_lock)
+        try:
+            return full_fn()
+        finally:
+            # 在显示锁内标记完成：之后不会再显示预览，调用方清除预览占位后不会被覆盖
+            with show_lock:
+                done.set()
+            finished = time.perf_counter()
+            with self._lock:
+                self.stats["runs"] += 1
+                if finished < deadline:
+                    self.stats["fast"] += 1
+                else:
+                    self.stats["full_ms"] += (finished - start_time) * 1000
+    
+    def _preview(self, sql: str, fetch_fn: Callable[[str], Any], on_preview: Callable, timings: dict,
+                 deadline: float, done: threading.Event, show_lock: threading.Lock):
+        """等到预览时间点，完整查询仍未完成时执行预览查询并显示（排队时间计入等待，不会再额外等待）"""
+        if done.wait(max(deadline - time.perf_counter(), 0)):
+            return
+        preview = self.build_preview(sql)
+        if preview is None:
+            with self._lock:
+                self.stats["no_preview"] += 1
+            return
+        
+        preview_start = time.perf_counter()
+        try:
+            columns, rows = fetch_fn(preview["sql"])
+        except Exception as e:
+            logger.warning(f"预览查询失败: {e}")
+            with self._lock:
+                self.stats["preview_failures"] += 1
+            return
+        preview["ms"] = (time.perf_counter() - preview_start) * 1000
+        with show_lock:
+            shown = not done.is_set()
+            if shown:
+                timings["preview"] = preview["ms"]
+                on_preview(columns, rows, preview)
+        with self._lock:
+            self.stats["previews" if shown else "late_previews"] += 1
+            self.stats["preview_ms"] += preview["ms"]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预览次数及预览/完整查询的平均耗时"""
+        with self._lock:
+            slow_runs = self.stats["runs"] - self.stats["fast"]
+            previews = self.stats["previews"] + self.stats["late_previews"]
+            return {
+                **self.stats,
+                "avg_preview_ms": self.stats["preview_ms"] / previews if previews else 0.0,
+                "avg_full_ms": self.stats["full_ms"] / slow_runs if slow_runs else 0.0
+            }
+
+
+# 全局渐进式执行器实例
+progressive_executor = ProgressiveExecutor()
@@ -2,14 +2,49 @@
 查询引擎模块 - 整合LLM和数据库查询功能
 """
 
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
 import streamlit as st
-from typing import Optional, Tuple, Any
+from contextlib import contextmanager
+from typing import Optional, Tuple, List, Any, Callable
+from config import CACHE_CONFIG, HISTORY_CONFIG, MODEL_ROUTING_CONFIG, AUTO_MODEL, TABLE_INFO, FEW_SHOT_EXAMPLES, SPECULATION_CONFIG
 from database import database_manager
 from llm_model import llm_manager
 from prompts.base_prompts import prompt_manager
 from utils.sql_processor import sql_processor
 from utils.data_formatter import data_formatter
 from utils.schema_converter import SchemaConverter
+from analytics_mirror import analytics_mirror
+from materialized_views import materialization_manager
+from query_history import query_history
+from model_router import model_router
+from template_matcher import template_matcher
+from query_refiner import query_refiner
+from prepared_statements import prepared_executor
+from query_profiler import query_profiler
+from job_queue import job_queue
+from incremental_refresh import incremental_cache
+from progressive_results import progressive_executor
+from batch_executor import batch_executor
+from utils.sql_analyzer import sql_analyzer
+from utils.query_cache import QueryCache
+from utils.single_flight import SingleFlight
+from utils.speculative_generation import SpeculativeGenerator
+from utils.result_store import result_store
+from utils.prompt_budget import prompt_budget
+from generation_profiles import generation_profiles
+
+logger = logging.getLogger(__name__)
+
+# schema版本标识，schema变化后合并键随之变化
+SCHEMA_VERSION = hashlib.sha1(TABLE_INFO.encode("utf-8")).hexdigest()[:8]
+
+# 非Streamlit线程（压测会话、后台任务）显式绑定的会话ID
+_session_local = threading.local()
 
 
 class QueryEngine:
@@ -22,116 +57,839 @@ class QueryEngine:
         self.sql_processor = sql_processor
         self.data_formatter = data_formatter
         self.schema_converter = SchemaConverter()
+        self.analytics_mirror = analytics_mirror
+        self.materialization_manager = materialization_manager
+        self.query_history = query_history
+        self.model_router = model_router
+        self.template_matcher = template_matcher
+        self.query_refiner = query_refiner
+        self.prepared_executor = prepared_executor
+        self.profiler = query_profiler
+        self.job_queue = job_queue
+        self.incremental_cache = incremental_cache
+        self.progressive = progressive_executor
+        self.batch_executor = batch_executor
+        self.result_store = result_store
+        self.prompt_budget = prompt_budget
+        self.generation_profiles = generation_profiles
+        # 输入问题时的预测生成
+        self.speculator = SpeculativeGenerator(self._generate_speculative, SPECULATION_CONFIG)
+        # SQL生成缓存: (模型, 问题) -> 清理后的SQL
+        self.generation_cache = QueryCache(CACHE_CONFIG["generation_cache_size"])
+        # 查询结果缓存: SQL规范化文本 -> (结果ID, 行数)
+        self.result_cache = QueryCache(CACHE_CONFIG["result_cache_size"], CACHE_CONFIG["result_ttl"])
+        # 并发相同请求合并器（跨会话共享）
+        self.single_flight = SingleFlight()
+    
+    @staticmethod
+    def _get_session_id() -> str:
+        """获取当前会话ID：优先使用线程绑定的会话ID，其次是Streamlit会话ID，后台线程中返回默认值"""
+        bound_session_id = getattr(_session_local, "session_id", None)
+        if bound_session_id:
+            return bound_session_id
+        try:
+            from streamlit.runtime.scriptrunner import get_script_run_ctx
+            ctx = get_script_run_ctx()
+            return ctx.session_id if ctx else "default"
+        except Exception:
+            return "default"
+    
+    @staticmethod
+    def _get_client_id() -> str:
+        """获取浏览器客户端标识（保存在URL参数client中，刷新页面后不变），用于归属后台任务；不在Streamlit页面中时返回会话ID"""
+        try:
+            client_id = st.query_params.get("client")
+            if not client_id or not re.fullmatch(r"[0-9a-f]{32}", client_id):
+                client_id = uuid.uuid4().hex
+                st.query_params["client"] = client_id
+            return client_id
+        except Exception:
+            return QueryEngine._get_session_id()
+    
+    @staticmethod
+    @contextmanager
+    def bind_session(session_id: str):
+        """在当前线程内以指定会话ID执行查询（结果存储按该会话计算配额）"""
+        previous = getattr(_session_local, "session_id", None)
+        _session_local.session_id = session_id
+        try:
+            yield
+        finally:
+            _session_local.session_id = previous
+    
+    def _worker_binding(self) -> Callable:
+        """
+        捕获当前会话ID和Streamlit脚本上下文，返回在线程池线程中恢复二者的上下文管理器：
+        结果计入本会话的存储配额，执行中的提示仍显示在页面上
+        """
+        session_id = self._get_session_id()
+        try:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+            ctx = get_script_run_ctx()
+        except Exception:
+            ctx = None
+        
+        @contextmanager
+        def binding():
+            thread = threading.current_thread()
+            if ctx is not None:
+                add_script_run_ctx(thread, ctx)
+            try:
+                with self.bind_session(session_id):
+                    yield
+            finally:
+                if ctx is not None:
+                    add_script_run_ctx(thread, None)
+        
+        return binding
+    
+    def _execute_sql(self, cleaned_sql: str, prepared: bool = False,
+                     errors: Optional[List[str]] = None) -> Optional[Tuple[List[str], List[tuple]]]:
+        """
+        执行已清理的SQL：命中汇总表的查询改写为读取汇总表，
+        其余只读聚合查询在镜像足够新时路由到分析镜像
+        
+        Args:
+            prepared: 是否尝试以服务端预处理语句执行（用于重复执行的直接SQL）
+            errors: 执行失败时追加数据库错误信息（用于批量执行报告）
+        
+        Returns:
+            Optional[Tuple[List[str], List[tuple]]]: (列名, 行数据)，失败返回None
+        """
+        rewritten_sql = self.materialization_manager.rewrite(cleaned_sql)
+        if rewritten_sql:
+            try:
+                return self.db_manager.fetch_rows(rewritten_sql)
+            except Exception as e:
+                logger.warning(f"汇总表查询失败，改为执行原始SQL: {e}")
+        
+        if self.analytics_mirror.can_serve(cleaned_sql):
+            try:
+                return self.analytics_mirror.execute(cleaned_sql)
+            except Exception as e:
+                # 方言转换不完整等情况，回退到MySQL执行
+                self.analytics_mirror.record_fallback()
+                st.warning(f"分析镜像查询失败，已回退到MySQL: {e}")
+        
+        if prepared:
+            try:
+                outcome = self.prepared_executor.execute(cleaned_sql)
+            except Exception as e:
+                # 执行期间的错误（连接中断、锁等待超时等），不再按文本重复执行
+                st.error(f"查询执行失败: {str(e)}")
+                if errors is not None:
+                    errors.append(str(e))
+                return None
+            if outcome is not None:
+                return outcome
+        
+        try:
+            return self.db_manager.fetch_rows(cleaned_sql)
+        except Exception as e:
+            st.error(f"查询执行失败: {str(e)}")
+            if errors is not None:
+                errors.append(str(e))
+            return None
+    
+    def _execute_and_store(self, cleaned_sql: str, session_id: str, prepared: bool = False,
+                           errors: Optional[List[str]] = None) -> Tuple[Optional[str], int]:
+        """执行SQL并将结果保存到结果存储，返回 (结果ID, 行数)"""
+        outcome = self._execute_sql(cleaned_sql, prepared, errors)
+        if outcome is None:
+            return None, 0
+        columns, rows = outcome
+        return self.result_store.put(columns, rows, session_id), len(rows)
+    
+    def _execute_sql_cached(self, cleaned_sql: str, timings: dict, prepared: bool = False,
+                            errors: Optional[List[str]] = None) -> Tuple[Optional[str], int]:
+        """
+        执行SQL，只读查询优先读取结果缓存，并记录执行耗时
+        
+        Args:
+            prepared: 是否尝试以服务端预处理语句执行
+            errors: 执行失败时追加数据库错误信息（合并到其它请求的执行时不追加）
+        
+        Returns:
+            Tuple[Optional[str], int]: (结果存储中的结果ID, 行数)，失败结果ID为None
+        """
+        start_time = time.perf_counter()
+        read_only = sql_analyzer.is_read_only(cleaned_sql)
+        cache_key = sql_analyzer.normalize_sql(cleaned_sql)
+        session_id = self._get_session_id()
+        
+        cached = self.result_cache.get(cache_key) if read_only else None
+        if cached is not None and not self.result_store.contains(cached[0]):
+            # 缓存的结果已被结果存储淘汰
+            self.result_cache.invalidate(cache_key)
+            cached = None
+        incremental = self._execute_incremental(cleaned_sql, cache_key, session_id) if read_only and cached is None else None
+        if incremental is not None:
+            # 单表明细查询按水位增量刷新，不进入普通结果缓存
+            result_id, row_count, refreshed = incremental
+            if refreshed:
+                timings["incremental_refresh"] = 1
+        elif cached is not None:
+            timings["result_cache_hit"] = 1
+            result_id, row_count = cached
+        else:
+            if read_only and CACHE_CONFIG["coalesce_requests"]:
+                # 相同只读SQL的并发执行只访问一次数据库，结果共享同一个结果ID
+                (result_id, row_count), coalesced = self.single_flight.do(
+                    ("execute", cache_key), self._execute_and_store, cleaned_sql, session_id, prepared, errors
+                )
+                if coalesced:
+                    timings["execution_coalesced"] = 1
+            else:
+                result_id, row_count = self._execute_and_store(cleaned_sql, session_id, prepared, errors)
+            if read_only and result_id is not None:
+                self.result_cache.set(cache_key, (result_id, row_count))
+            elif not read_only:
+                # 写操作后缓存的查询结果可能失效
+                self.result_cache.clear()
+                self.incremental_cache.invalidate_tables(sql_analyzer.extract_tables(cleaned_sql))
+        
+        timings["execution"] = (time.perf_counter() - start_time) * 1000
+        return result_id, row_count
+    
+    def _execute_progressive(self, cleaned_sql: str, timings: dict, on_preview: Optional[Callable],
+                             prepared: bool = False) -> Tuple[Optional[str], int]:
+        """
+        渐进式执行：完整查询在当前线程执行，超过预览等待时间仍未完成时在线程池中执行预览查询并通过on_preview显示
+        
+        未要求预览、写操作或结果已缓存时与 _execute_sql_cached 相同
+        """
+        if (
+            on_preview is None or not self.progressive.is_enabled() or not sql_analyzer.is_read_only(cleaned_sql)
+            or self.result_cache.contains(sql_analyzer.normalize_sql(cleaned_sql))
+        ):
+            return self._execute_sql_cached(cleaned_sql, timings, prepared)
+        
+        binding = self._worker_binding()
+        
+        def show_preview(columns, rows, preview):
+            # 在预览线程中显示，需要恢复页面的脚本上下文
+            with binding():
+                on_preview(columns, rows, preview)
+        
+        return self.progressive.run(
+            cleaned_sql, lambda: self._execute_sql_cached(cleaned_sql, timings, prepared),
+            self.db_manager.fetch_rows, show_preview, timings
+        )
     
-    def execute_natural_language_query(self, user_question: str, model_name: str) -> Tuple[bool, Any, str, str]:
+    def _execute_incremental(self, cleaned_sql: str, cache_key: str,
+                             session_id: str) -> Optional[Tuple[str, int, bool]]:
+        """
+        尝试以增量刷新方式执行查询
+        
+        Returns:
+            Optional[Tuple[str, int, bool]]: (结果ID, 行数, 是否增量刷新)，查询形态不满足条件返回None
+        """
+        try:
+            if CACHE_CONFIG["coalesce_requests"]:
+                outcome, _ = self.single_flight.do(
+                    ("incremental", cache_key), self.incremental_cache.execute, cleaned_sql
+                )
+            else:
+                outcome = self.incremental_cache.execute(cleaned_sql)
+        except Exception as e:
+            logger.warning(f"增量刷新失败，改为完整执行: {e}")
+            return None
+        if outcome is None:
+            return None
+        columns, rows, refreshed = outcome
+        return self.result_store.put(columns, rows, session_id), len(rows), refreshed
+    
+    def _generate_sql(self, user_question: str, model_name: str, db,
+                      prompt_info: Optional[dict] = None) -> Optional[str]:
+        """
+        调用模型生成原始SQL（SQLCoder模型使用专用适配器，其余使用通用提示词链）
+        
+        Args:
+            prompt_info: 可选，用于回传本次提示词的token统计和schema编码
+        """
+        if self.llm_manager.is_sqlcoder_model(model_name):
+            # 获取schema信息，超出模型预算时改用紧凑编码
+            choice = self.prompt_budget.choose_schema(
+                model_name, user_question,
+                candidates=[("sqlcoder", self.schema_converter.get_sqlcoder_schema())]
+            )
+            if prompt_info is not None:
+                prompt_info.update(choice)
+            
+            # 使用SQLCoder适配器生成SQL
+            return self.llm_manager.generate_sql_with_sqlcoder(
+                user_question, choice["schema"], "MySQL", model_name
+            )
+        
+        # 通用提示词链自行组装schema和示例，这里只统计规模，并据此确定num_ctx等生成参数
+        measured = self.prompt_budget.measure(model_name, {
+            "question": user_question,
+            "schema": TABLE_INFO,
+            "examples": "\n".join(f"{example['input']}\n{example['query']}" for example in FEW_SHOT_EXAMPLES)
+        })
+        llm = self.llm_manager.get_model(model_name, measured["sections"]["total"])
+        if not llm:
+            return None
+        
+        if prompt_info is not None:
+            prompt_info.update(measured)
+            prompt_info["generation_options"] = dict(self.llm_manager.current_options)
+        
+        # 创建SQL查询链并生成SQL查询
+        sql_chain = self.prompt_manager.create_sql_chain(llm, db)
+        response = sql_chain.invoke({"question": user_question})
+        return response if isinstance(response, str) else str(response)
+    
+    def _generate_sql_coalesced(self, user_question: str, model_name: str, db, timings: dict) -> Optional[str]:
+        """生成SQL，同一模型和schema下并发的相同问题共享一次模型调用，并记录提示词规模与耗时"""
+        prompt_info = {}
+        generation_start = time.perf_counter()
+        if not CACHE_CONFIG["coalesce_requests"]:
+            sql_query = self._generate_sql(user_question, model_name, db, prompt_info)
+        else:
+            key = ("generate", model_name, SCHEMA_VERSION, user_question.strip())
+            sql_query, coalesced = self.single_flight.do(
+                key, self._generate_sql, user_question, model_name, db, prompt_info
+            )
+            if coalesced:
+                timings["generation_coalesced"] = 1
+        
+        if prompt_info:
+            # 合并的请求由首个调用方统计，这里只记录实际发起模型调用的请求
+            timings["prompt_tokens"] = prompt_info["sections"]["total"]
+            timings["schema_tokens"] = prompt_info["sections"].get("schema", 0)
+            if "generation_options" in prompt_info:
+                options = prompt_info["generation_options"]
+                for name in ("num_ctx", "num_predict"):
+                    if name in options:
+                        timings[name] = options[name]
+                self.generation_profiles.record(model_name, options, prompt_info["sections"]["total"])
+            self.prompt_budget.record(model_name, prompt_info, (time.perf_counter() - generation_start) * 1000)
+            if not prompt_info["fits"]:
+                logger.warning(
+                    f"提示词超出模型预算 {model_name}: {prompt_info['sections']['total']} > {prompt_info['budget']} tokens"
+                )
+        return sql_query
+    
+    def _record_history(self, source: str, question: Optional[str], model_name: Optional[str],
+                        sql_query: str, timings: dict, start_time: float, row_count: Optional[int],
+                        success: bool, error_msg: str):
+        """写入查询历史，历史存储异常不影响查询本身"""
+        if not HISTORY_CONFIG["enabled"]:
+            return
+        timings["total"] = (time.perf_counter() - start_time) * 1000
+        try:
+            self.query_history.record(
+                source, question, model_name, sql_query or None,
+                sql_analyzer.fingerprint(sql_query) if sql_query else None,
+                timings, row_count, success, error_msg
+            )
+        except Exception as e:
+            logger.warning(f"写入查询历史失败: {e}")
+    
+    def execute_natural_language_query(self, user_question: str, model_name: str, profile: bool = False,
+                                       conversation: bool = False,
+                                       on_preview: Optional[Callable] = None) -> Tuple[bool, Any, str, str]:
         """
         执行自然语言查询
         
+        Args:
+            profile: 是否剖析本次请求（未指定时按采样率决定）
+            conversation: 对话模式，本会话已有上一轮查询且问题是追问时在上一轮SQL基础上修改，否则开始新对话
+            on_preview: 渐进式结果，查询较慢时以 (列名, 行数据, 预览信息) 调用以先显示预览
+        
         Returns:
-            Tuple[bool, Any, str, str]: (成功标志, 查询结果, SQL语句, 错误信息)
+            Tuple[bool, Any, str, str]: (成功标志, 查询结果ID, SQL语句, 错误信息)
         """
+        start_time = time.perf_counter()
+        timings = {}
+        with self.speculator.foreground(), self.profiler.profile("nl", force=profile) as profile_run:
+            success, result, sql_query, error_msg, row_count, resolved_model = self._run_natural_language_query(
+                user_question, model_name, timings, conversation, on_preview
+            )
+        if success and conversation:
+            if timings.get("new_conversation"):
+                self.query_refiner.reset(self._get_session_id())
+            method = "edit" if timings.get("refine_edit") else "model" if timings.get("refine_model") else "generate"
+            self.query_refiner.add_turn(self._get_session_id(), user_question, sql_query, method)
+        self._record_history("nl", user_question, resolved_model, sql_query, timings, start_time,
+                             row_count, success, error_msg)
+        self.profiler.check_slow_query("nl", user_question, resolved_model, sql_query, timings, start_time,
+                                       success, error_msg, profile_run)
+        return success, result, sql_query, error_msg
+    
+    def _refine_follow_up(self, follow_up: str, model_name: str, turns: list, timings: dict) -> Optional[dict]:
+        """
+        在上一轮SQL基础上修改：能识别的追问直接改写，否则只把增量提示词发给模型
+        
+        Returns:
+            Optional[dict]: {"method", "sql", "model", ...}，修改失败或未通过校验时返回None
+        """
+        refine_start = time.perf_counter()
+        refinement = self.query_refiner.apply_edit(turns[-1]["sql"], follow_up)
+        if refinement:
+            timings["refine_edit"] = 1
+        else:
+            if model_name == AUTO_MODEL:
+                model_name = self.model_router.plan(follow_up)["models"][0][1]
+            prompt = self.query_refiner.build_delta_prompt(turns, follow_up)
+            prompt_tokens = self.prompt_budget.count_tokens(prompt)
+            timings["refine_model"] = 1
+            timings["prompt_tokens"] = prompt_tokens
+            try:
+                with st.spinner("正在修改上一轮SQL..."):
+                    llm = self.llm_manager.get_model(model_name, prompt_tokens)
+                    response = llm.invoke(prompt)
+                sql_query = self.sql_processor.clean_sql_query(response if isinstance(response, str) else str(response))
+            except Exception as e:
+                logger.warning(f"追问修改SQL失败: {e}")
+                sql_query = ""
+            latency_ms = (time.perf_counter() - refine_start) * 1000
+            self.prompt_budget.record(model_name, {"sections": {"total": prompt_tokens}, "encoding": "delta"}, latency_ms)
+            refinement = {"method": "model", "sql": sql_query, "model": model_name} if sql_query else None
+        
+        error_msg = self._validate_sql(refinement["sql"]) if refinement else "无法修改上一轮SQL"
+        timings["generation"] = (time.perf_counter() - refine_start) * 1000
+        if error_msg:
+            self.query_refiner.record("fallbacks")
+            st.warning(f"追问未能在上一轮SQL基础上修改（{error_msg}），合并上下文重新生成")
+            return None
+        self.query_refiner.record("edits" if refinement["method"] == "edit" else "model_refinements",
+                                  refinement.get("edit"))
+        return refinement
+    
+    def _run_natural_language_query(self, user_question: str, model_name: str, timings: dict,
+                                    conversation: bool = False, on_preview: Optional[Callable] = None):
+        """自然语言查询主流程，额外返回行数和实际使用的模型供历史记录使用"""
+        route_level = None
         try:
             # 获取数据库实例
             db = self.db_manager.get_database()
             if not db:
-                return False, None, "", "数据库未正确初始化"
+                return False, None, "", "数据库未正确初始化", None, model_name
             
-            # 检查是否为SQLCoder模型
-            if self.llm_manager.is_sqlcoder_model(model_name):
-                # 使用SQLCoder专用适配器
-                st.info(f"🔧 检测到SQLCoder模型: {model_name}，使用专用提示词")
-                
-                # 获取schema信息
-                schema = self.schema_converter.get_sqlcoder_schema()
-                
-                # 使用SQLCoder适配器生成SQL
-                with st.spinner("正在使用SQLCoder生成SQL查询..."):
-                    sql_query = self.llm_manager.generate_sql_with_sqlcoder(
-                        user_question, schema, "MySQL", model_name
-                    )
+            refinement = None
+            turns = self.query_refiner.get_turns(self._get_session_id()) if conversation else []
+            if turns and not self.query_refiner.is_follow_up(user_question):
+                # 与上一轮无关的新问题：完整生成，成功后开始新对话
+                st.info("💬 问题与上一轮无关，将重新生成并开始新对话")
+                self.query_refiner.record("new_conversations")
+                timings["new_conversation"] = 1
+                turns = []
+            if turns:
+                refinement = self._refine_follow_up(user_question, model_name, turns, timings)
+                if refinement is None:
+                    # 无法修改时合并各轮问题重新完整生成
+                    user_question = self.query_refiner.merge_question(turns, user_question)
+            
+            generation_key = (model_name, user_question.strip())
+            template_start = time.perf_counter()
+            template_hit = None if refinement else self.template_matcher.match(user_question)
+            speculative = None
+            if not (refinement or template_hit or turns):
+                speculative = self.speculator.take(self._get_session_id(), model_name, user_question)
+            if refinement:
+                cleaned_sql = refinement["sql"]
+            elif speculative:
+                cleaned_sql = speculative["sql"]
+            else:
+                cleaned_sql = template_hit["sql"] if template_hit else self.generation_cache.get(generation_key)
+            
+            if refinement:
+                if refinement["method"] == "edit":
+                    st.info("✏️ 已按追问直接修改上一轮SQL，跳过模型调用")
+                else:
+                    model_name = refinement["model"]
+                    st.info(f"✏️ 已由 {model_name} 在上一轮SQL基础上修改")
+            elif speculative:
+                st.info("⚡ 使用输入问题时预先生成的SQL，跳过模型调用")
+                timings["speculative_hit"] = 1
+                timings["speculative_ms"] = speculative["ms"]
+                self.generation_cache.set(generation_key, cleaned_sql)
+            elif template_hit:
+                st.info(f"⚡ 命中问题模板（{template_hit['template']}），跳过模型调用")
+                timings["template_hit"] = 1
+                timings["generation"] = (time.perf_counter() - template_start) * 1000
+            elif cleaned_sql:
+                st.info("⚡ 命中SQL生成缓存，跳过模型调用")
+                timings["generation_cache_hit"] = 1
+            elif model_name == AUTO_MODEL:
+                # 自动路由：按问题复杂度选择模型，校验失败时升级
+                cleaned_sql, model_name, route_level, error_msg = self._generate_with_routing(
+                    user_question, db, timings
+                )
+                if not cleaned_sql:
+                    return False, None, "", error_msg, None, model_name
                 
-                if not sql_query:
-                    return False, None, "", "SQLCoder无法生成有效的SQL查询"
-                    
+                self.generation_cache.set(generation_key, cleaned_sql)
             else:
-                # 使用通用LLM模型和提示词
-                st.info(f"🤖 使用通用模型: {model_name}，使用标准提示词")
+                is_sqlcoder = self.llm_manager.is_sqlcoder_model(model_name)
+                if is_sqlcoder:
+                    # 使用SQLCoder专用适配器
+                    st.info(f"🔧 检测到SQLCoder模型: {model_name}，使用专用提示词")
+                    spinner_text = "正在使用SQLCoder生成SQL查询..."
+                else:
+                    # 使用通用LLM模型和提示词
+                    st.info(f"🤖 使用通用模型: {model_name}，使用标准提示词")
+                    spinner_text = "正在生成SQL查询..."
                 
-                llm = self.llm_manager.get_model(model_name)
-                if not llm:
-                    return False, None, "", "LLM模型未正确初始化"
+                generation_start = time.perf_counter()
+                with st.spinner(spinner_text):
+                    sql_query = self._generate_sql_coalesced(user_question, model_name, db, timings)
+                timings["generation"] = (time.perf_counter() - generation_start) * 1000
                 
-                # 创建SQL查询链
-                sql_chain = self.prompt_manager.create_sql_chain(llm, db)
+                if not sql_query:
+                    if is_sqlcoder:
+                        return False, None, "", "SQLCoder无法生成有效的SQL查询", None, model_name
+                    return False, None, "", "LLM模型未正确初始化", None, model_name
                 
-                # 生成SQL查询
-                with st.spinner("正在生成SQL查询..."):
-                    response = sql_chain.invoke({"question": user_question})
-                    sql_query = response if isinstance(response, str) else str(response)
-            
-            # 清理SQL查询
-            cleaned_sql = self.sql_processor.clean_sql_query(sql_query)
-            
-            if not cleaned_sql:
-                return False, None, sql_query, "无法生成有效的SQL查询"
+                # 清理SQL查询
+                cleaning_start = time.perf_counter()
+                cleaned_sql = self.sql_processor.clean_sql_query(sql_query)
+                timings["cleaning"] = (time.perf_counter() - cleaning_start) * 1000
+                
+                if not cleaned_sql:
+                    return False, None, sql_query, "无法生成有效的SQL查询", None, model_name
+                
+                self.generation_cache.set(generation_key, cleaned_sql)
             
             # 执行SQL查询
             with st.spinner("正在执行查询..."):
-                result = self.db_manager.execute_query(cleaned_sql)
+                result, row_count = self._execute_progressive(cleaned_sql, timings, on_preview)
+                
+                if route_level:
+                    self.model_router.record_outcome(
+                        route_level, model_name, result is not None,
+                        timings.get("generation", 0) + timings.get("execution", 0)
+                    )
                 
                 if result is None:
-                    return False, None, cleaned_sql, "查询执行失败"
+                    return False, None, cleaned_sql, "查询执行失败", None, model_name
                 
-                return True, result, cleaned_sql, ""
+                return True, result, cleaned_sql, "", row_count, model_name
                 
         except Exception as e:
             error_msg = f"查询执行错误: {str(e)}"
             st.error(error_msg)
-            return False, None, "", error_msg
+            return False, None, "", error_msg, None, model_name
     
-    def execute_direct_sql_query(self, sql_query: str) -> Tuple[bool, Any, str, str]:
+    def _validate_sql(self, cleaned_sql: str) -> str:
+        """
+        校验生成的SQL：只能引用已知表，只读查询需通过EXPLAIN
+        
+        Returns:
+            str: 错误信息，校验通过返回空字符串
+        """
+        unknown_tables = [
+            table for table in sql_analyzer.extract_tables(cleaned_sql)
+            if table.lower() not in sql_analyzer.known_tables
+        ]
+        if unknown_tables:
+            return f"引用了不存在的表: {', '.join(sorted(unknown_tables))}"
+        
+        if MODEL_ROUTING_CONFIG.get("validate_with_explain") and sql_analyzer.is_read_only(cleaned_sql):
+            try:
+                self.db_manager.fetch_rows(f"EXPLAIN {cleaned_sql.strip().rstrip(';')}")
+            except Exception as e:
+                return f"EXPLAIN失败: {e}"
+        return ""
+    
+    def _generate_with_routing(self, user_question: str, db, timings: dict) -> Tuple[str, str, str, str]:
+        """
+        按模型路由计划依次尝试模型，直到生成的SQL通过校验
+        
+        Returns:
+            Tuple[str, str, str, str]: (清理后的SQL, 使用的模型, 复杂度级别, 错误信息)，全部失败时SQL为空
+        """
+        route = self.model_router.plan(user_question)
+        timings["complexity_score"] = route["score"]
+        level_names = {"simple": "简单", "medium": "中等", "complex": "复杂"}
+        
+        generation_start = time.perf_counter()
+        model_name, level, error_msg = AUTO_MODEL, route["level"], "无法生成有效的SQL查询"
+        for attempt, (level, model_name) in enumerate(route["models"]):
+            if attempt:
+                self.model_router.record_escalation()
+                timings["escalations"] = attempt
+            st.info(f"🧭 自动选择模型: 问题复杂度{level_names[level]}，使用 {model_name}")
+            
+            attempt_start = time.perf_counter()
+            try:
+                with st.spinner("正在生成SQL查询..."):
+                    sql_query = self._generate_sql_coalesced(user_question, model_name, db, timings)
+                cleaned_sql = self.sql_processor.clean_sql_query(sql_query) if sql_query else ""
+                error_msg = self._validate_sql(cleaned_sql) if cleaned_sql else "无法生成有效的SQL查询"
+            except Exception as e:
+                cleaned_sql, error_msg = "", f"模型调用失败: {e}"
+            
+            if not error_msg:
+                timings["generation"] = (time.perf_counter() - generation_start) * 1000
+                return cleaned_sql, model_name, level, ""
+            
+            self.model_router.record_outcome(level, model_name, False, (time.perf_counter() - attempt_start) * 1000)
+            st.warning(f"模型 {model_name} 生成的SQL未通过校验（{error_msg}），尝试更大的模型")
+        
+        timings["generation"] = (time.perf_counter() - generation_start) * 1000
+        return "", model_name, level, error_msg
+    
+    def execute_direct_sql_query(self, sql_query: str, profile: bool = False,
+                                 on_preview: Optional[Callable] = None) -> Tuple[bool, Any, str, str]:
         """
         直接执行SQL查询
         
+        Args:
+            profile: 是否剖析本次请求（未指定时按采样率决定）
+            on_preview: 渐进式结果，查询较慢时以 (列名, 行数据, 预览信息) 调用以先显示预览
+        
         Returns:
-            Tuple[bool, Any, str, str]: (成功标志, 查询结果, 清理后的SQL, 错误信息)
+            Tuple[bool, Any, str, str]: (成功标志, 查询结果ID, 清理后的SQL, 错误信息)
         """
+        start_time = time.perf_counter()
+        timings = {}
+        with self.profiler.profile("sql", force=profile) as profile_run:
+            success, result, cleaned_sql, error_msg, row_count = self._run_direct_sql_query(sql_query, timings, on_preview)
+        self._record_history("sql", None, None, cleaned_sql, timings, start_time,
+                             row_count, success, error_msg)
+        self.profiler.check_slow_query("sql", None, None, cleaned_sql, timings, start_time,
+                                       success, error_msg, profile_run)
+        return success, result, cleaned_sql, error_msg
+    
+    def _run_direct_sql_query(self, sql_query: str, timings: dict, on_preview: Optional[Callable] = None):
+        """直接SQL查询主流程，额外返回行数供历史记录使用"""
         try:
             # 清理SQL查询
+            cleaning_start = time.perf_counter()
             cleaned_sql = self.sql_processor.clean_sql_query(sql_query)
+            timings["cleaning"] = (time.perf_counter() - cleaning_start) * 1000
             
             if not cleaned_sql:
-                return False, None, sql_query, "SQL查询为空或无效"
+                return False, None, sql_query, "SQL查询为空或无效", None
             
-            # 执行查询
+            # 执行查询（重复执行的语句使用服务端预处理语句）
             with st.spinner("正在执行SQL查询..."):
-                result = self.db_manager.execute_query(cleaned_sql)
+                result, row_count = self._execute_progressive(cleaned_sql, timings, on_preview, prepared=True)
                 
                 if result is None:
-                    return False, None, cleaned_sql, "查询执行失败"
+                    return False, None, cleaned_sql, "查询执行失败", None
                 
-                return True, result, cleaned_sql, ""
+                return True, result, cleaned_sql, "", row_count
                 
         except Exception as e:
             error_msg = f"SQL查询执行错误: {str(e)}"
             st.error(error_msg)
-            return False, None, sql_query, error_msg
+            return False, None, sql_query, error_msg, None
+    
+    def execute_sql_batch(self, script: str) -> dict:
+        """
+        执行多语句SQL脚本：相互独立的只读语句在连接池的多个连接上并行执行，写语句和有依赖的语句保持顺序，
+        含会话状态的脚本在同一个连接上顺序执行；每条语句单独记录查询历史
+        
+        Returns:
+            dict: 批量执行报告（见 BatchExecutor.run），每条语句附带结果ID、行数和耗时
+        """
+        binding = self._worker_binding()
+        session_id = self._get_session_id()
+        
+        def execute(sql, timings):
+            # 线程池中执行，复用结果缓存、汇总表改写和分析镜像路由
+            start_time = time.perf_counter()
+            errors = []
+            with binding():
+                result_id, row_count = self._execute_sql_cached(sql, timings, errors=errors)
+                error = "" if result_id is not None else (errors[-1] if errors else "查询执行失败")
+                self._record_history("sql", None, None, sql, timings, start_time, row_count, result_id is not None, error)
+            if result_id is None:
+                # 与顺序执行一致，报告中显示数据库返回的错误
+                raise RuntimeError(error)
+            return result_id, row_count
+        
+        @contextmanager
+        def single_connection():
+            with self.db_manager.single_connection() as fetch:
+                def execute_on_connection(sql, timings):
+                    start_time = time.perf_counter()
+                    try:
+                        columns, rows = fetch(sql)
+                    except Exception as e:
+                        timings["execution"] = (time.perf_counter() - start_time) * 1000
+                        self._record_history("sql", None, None, sql, timings, start_time, None, False, str(e))
+                        raise
+                    timings["execution"] = (time.perf_counter() - start_time) * 1000
+                    if not sql_analyzer.is_read_only(sql):
+                        self.result_cache.clear()
+                        self.incremental_cache.invalidate_tables(sql_analyzer.extract_tables(sql))
+                    self._record_history("sql", None, None, sql, timings, start_time, len(rows), True, "")
+                    return self.result_store.put(columns, rows, session_id), len(rows)
+                
+                yield execute_on_connection
+        
+        return self.batch_executor.run(script, execute, single_connection)
+    
+    def warm_up_caches(self, top_n: Optional[int] = None) -> dict:
+        """
+        重放历史中最高频的查询，预先填充SQL生成缓存和查询结果缓存
+        
+        Returns:
+            dict: 预热统计（generated=生成的SQL数, executed=执行的查询数, failed=失败数）
+        """
+        top_n = top_n or HISTORY_CONFIG["warmup_top_n"]
+        stats = {"generated": 0, "executed": 0, "failed": 0}
+        
+        for entry in self.query_history.get_top_queries(top_n, HISTORY_CONFIG["warmup_days"]):
+            start_time = time.perf_counter()
+            timings = {}
+            cleaned_sql = ""
+            try:
+                if entry["source"] == "nl":
+                    generation_key = (entry["model"], entry["question"].strip())
+                    cleaned_sql = self.generation_cache.get(generation_key)
+                    if not cleaned_sql:
+                        generation_start = time.perf_counter()
+                        # 自动路由的记录按路由计划的首选模型预热
+                        model_name = entry["model"]
+                        if model_name == AUTO_MODEL:
+                            model_name = self.model_router.plan(entry["question"])["models"][0][1]
+                        raw_sql = self._generate_sql_coalesced(
+                            entry["question"], model_name, self.db_manager.get_database(), timings
+                        )
+                        timings["generation"] = (time.perf_counter() - generation_start) * 1000
+                        cleaned_sql = self.sql_processor.clean_sql_query(raw_sql) if raw_sql else ""
+                        if not cleaned_sql:
+                            raise ValueError("无法生成有效的SQL查询")
+                        self.generation_cache.set(generation_key, cleaned_sql)
+                        stats["generated"] += 1
+                else:
+                    cleaned_sql = entry["sql_text"]
+                
+                # 只预热只读查询的结果，避免重放写操作
+                row_count = None
+                if sql_analyzer.is_read_only(cleaned_sql):
+                    result, row_count = self._execute_sql_cached(cleaned_sql, timings)
+                    if result is None:
+                        raise ValueError("查询执行失败")
+                    stats["executed"] += 1
+                self._record_history("warmup", entry["question"], entry["model"], cleaned_sql,
+                                     timings, start_time, row_count, True, "")
+            except Exception as e:
+                stats["failed"] += 1
+                self._record_history("warmup", entry["question"], entry["model"], cleaned_sql,
+                                     timings, start_time, None, False, str(e))
+        
+        return stats
+    
+    def get_cache_stats(self) -> dict:
+        """获取生成缓存、结果缓存和请求合并的统计信息"""
+        return {
+            "generation": self.generation_cache.get_stats(),
+            "result": self.result_cache.get_stats(),
+            "coalescing": self.single_flight.get_stats(),
+            "incremental": self.incremental_cache.get_stats(),
+            "result_store": self.result_store.get_stats(),
+            "routing": self.model_router.get_stats(),
+            "templates": self.template_matcher.get_stats(),
+            "prepared": self.prepared_executor.get_stats(),
+            "profiling": self.profiler.get_stats(),
+            "generation_profiles": self.generation_profiles.get_stats(),
+            "conversation": self.query_refiner.get_stats(),
+            "speculation": self.speculator.get_stats(),
+            "progressive": self.progressive.get_stats(),
+            "batch": self.batch_executor.get_stats()
+        }
+    
+    def speculate(self, user_question: str, model_name: str):
+        """
+        问题输入变化时在后台预生成SQL
+        
+        自动选择模型时不预生成（路由需要按校验结果逐级升级），模板可直接生成或已缓存的问题无需预生成
+        """
+        if model_name == AUTO_MODEL or self.template_matcher.match(user_question, record_stats=False):
+            return
+        if self.generation_cache.contains((model_name, user_question.strip())):
+            return
+        self.speculator.submit(self._get_session_id(), model_name, user_question)
+    
+    def _generate_speculative(self, user_question: str, model_name: str) -> Optional[Tuple[str, str]]:
+        """后台预生成：返回 (清理并校验后的SQL, 模型)，失败或未通过校验返回None"""
+        db = self.db_manager.get_database()
+        if not db:
+            return None
+        # 与前台生成使用相同的合并键，提交时若仍在生成，前台请求直接等待本次结果
+        sql_query = self._generate_sql_coalesced(user_question, model_name, db, {})
+        cleaned_sql = self.sql_processor.clean_sql_query(sql_query) if sql_query else ""
+        if not cleaned_sql or self._validate_sql(cleaned_sql):
+            return None
+        return cleaned_sql, model_name
+    
+    def get_conversation(self) -> list:
+        """获取当前会话的对话轮次"""
+        return self.query_refiner.get_turns(self._get_session_id())
+    
+    def reset_conversation(self):
+        """清空当前会话的对话上下文"""
+        self.query_refiner.reset(self._get_session_id())
+    
+    def submit_natural_language_job(self, user_question: str, model_name: str) -> str:
+        """将自然语言查询提交到后台任务队列，返回任务ID"""
+        return self.job_queue.submit(
+            "nl", {"question": user_question, "model": model_name}, self._get_client_id()
+        )
+    
+    def submit_direct_sql_job(self, sql_query: str) -> str:
+        """将直接SQL查询提交到后台任务队列，返回任务ID"""
+        return self.job_queue.submit("sql", {"sql": sql_query}, self._get_client_id())
+    
+    def list_jobs(self, limit: int = 10) -> List[dict]:
+        """获取当前客户端最近提交的后台任务（刷新页面后仍可见）"""
+        return self.job_queue.list_jobs(limit, self._get_client_id())
+    
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """获取后台任务状态，不属于当前客户端的任务返回None"""
+        job = self.job_queue.get_job(job_id)
+        return job if job and job["session_id"] == self._get_client_id() else None
+    
+    def cancel_job(self, job_id: str) -> bool:
+        """取消当前客户端提交的后台任务"""
+        if self.get_job(job_id) is None:
+            return False
+        return self.job_queue.cancel(job_id)
+    
+    def load_job_result(self, job_id: str) -> Tuple[Optional[str], int]:
+        """
+        将已完成任务的结果载入当前会话的结果存储
+        
+        Returns:
+            Tuple[Optional[str], int]: (结果ID, 行数)，任务不属于当前客户端、未成功或结果已过期时结果ID为None
+        """
+        if self.get_job(job_id) is None:
+            return None, 0
+        outcome = self.job_queue.get_result(job_id)
+        if outcome is None:
+            return None, 0
+        columns, rows = outcome
+        return self.result_store.put(columns, rows, self._get_session_id()), len(rows)
     
     def format_and_display_result(self, result: Any, sql_query: str, display_format: str = "表格"):
-        """格式化并显示查询结果"""
+        """
+        格式化并显示查询结果
+        
+        Args:
+            result: 结果存储中的结果ID
+        """
         try:
+            if not self.result_store.contains(result):
+                st.warning("查询结果已因内存预算被释放，请重新执行查询")
+                return
+            
             if display_format == "表格":
-                # 提取列名
-                columns = self.sql_processor.extract_column_names(sql_query)
-                
-                # 格式化为DataFrame
-                df = self.data_formatter.format_query_result(result, columns)
+                # 从列式存储构建DataFrame（列名来自数据库游标）
+                df = self.result_store.to_dataframe(result)
                 
                 # 显示DataFrame
                 self.data_formatter.display_dataframe(df, "查询结果")
                 
             else:  # 原始格式
-                self.data_formatter.display_raw_result(result, "原始查询结果")
+                rows = self.result_store.get_rows(result)
+                self.data_formatter.display_raw_result(self.db_manager.format_rows(rows), "原始查询结果")
                 
         except Exception as e:
             st.error(f"显示结果时出错: {e}")
@@ -0,0 +1,196 @@
+"""
+查询历史模块 - 使用本地SQLite持久化记录每次查询的问题、SQL指纹、阶段耗时和行数
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+from config import HISTORY_CONFIG
+
+
+class QueryHistoryStore:
+    """查询历史存储"""
+    
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or HISTORY_CONFIG["database_path"]
+        self._lock = threading.Lock()
+        self._initialized = False
+    
+    @contextmanager
+    def _connect(self):
+        """打开SQLite连接（每次操作独立连接，便于多线程使用），退出时提交并关闭"""
+        if not self._initialized:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    source TEXT NOT NULL,
+                    question TEXT,
+                    model TEXT,
+                    sql_text TEXT,
+                    fingerprint TEXT,
+                    timings TEXT,
+                    total_ms REAL,
+                    row_count INTEGER,
+                    success INTEGER NOT NULL,
+                    error TEXT
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_history_fingerprint ON query_history(fingerprint)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_history_created_at ON query_history(created_at)")
+            self._initialized = True
+        try:
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+    
+    def record(self, source: str, question: Optional[str], model: Optional[str], sql_text: Optional[str],
+               fingerprint: Optional[str], timings: Dict[str, float], row_count: Optional[int],
+               success: bool, error: str = ""):
+        """
+        记录一次查询
+        
+        Args:
+            source: 查询来源（nl=自然语言, sql=直接SQL, warmup=预热）
+            timings: 各阶段耗时（毫秒），如 {"generation": 1200.5, "execution": 35.2}
+        """
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                """
+                INSERT INTO query_history
+                    (created_at, source, question, model, sql_text, fingerprint, timings, total_ms, row_count, success, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    time.time(), source, question, model, sql_text, fingerprint,
+                    json.dumps(timings), timings.get("total"), row_count, int(success), error
+                )
+            )
+            self._prune(connection)
+    
+    def _prune(self, connection):
+        """超过保留上限时删除最旧的记录"""
+        max_rows = HISTORY_CONFIG.get("max_rows")
+        if max_rows:
+            connection.execute(
+                "DELETE FROM query_history WHERE id <= (SELECT MAX(id) FROM query_history) - ?", (max_rows,)
+            )
+    
+    def get_top_queries(self, limit: int = 10, days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        获取执行频率最高的成功查询
+        
+        自然语言查询按 (问题, 模型) 聚合，直接SQL按SQL指纹聚合
+        """
+        since = time.time() - days * 86400 if days else 0
+        with self._connect() as connection:
+            rows = connection.execute(
+                """
+                SELECT source, question, model, fingerprint,
+                       (SELECT h2.sql_text FROM query_history h2
+                         WHERE h2.fingerprint = h.fingerprint ORDER BY h2.id DESC LIMIT 1) AS sql_text,
+                       COUNT(*) AS frequency,
+                       AVG(total_ms) AS avg_total_ms,
+                       MAX(created_at) AS last_run
+                FROM query_history h
+                WHERE success = 1 AND source IN ('nl', 'sql') AND created_at >= ?
+                GROUP BY source,
+                         CASE WHEN source = 'nl' THEN question ELSE fingerprint END,
+                         CASE WHEN source = 'nl' THEN model ELSE '' END
+                ORDER BY frequency DESC, last_run DESC
+                LIMIT ?
+                """,
+                (since, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def get_sql_workload(self, days: Optional[int] = None, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        按SQL指纹汇总成功执行的查询（自然语言生成的SQL与直接SQL合并统计），用于索引建议
+        
+        Returns:
+            List[Dict[str, Any]]: [{"fingerprint", "sql_text", "frequency", "avg_total_ms", "sum_total_ms"}]，按执行次数降序
+        """
+        since = time.time() - days * 86400 if days else 0
+        with self._connect() as connection:
+            rows = connection.execute(
+                """
+                SELECT fingerprint,
+                       (SELECT h2.sql_text FROM query_history h2
+                         WHERE h2.fingerprint = h.fingerprint ORDER BY h2.id DESC LIMIT 1) AS sql_text,
+                       COUNT(*) AS frequency,
+                       AVG(total_ms) AS avg_total_ms,
+                       SUM(total_ms) AS sum_total_ms
+                FROM query_history h
+                WHERE success = 1 AND source IN ('nl', 'sql') AND fingerprint IS NOT NULL AND created_at >= ?
+                GROUP BY fingerprint
+                ORDER BY frequency DESC, sum_total_ms DESC
+                LIMIT ?
+                """,
+                (since, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def get_recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """获取最近的查询记录"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM query_history ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        records = []
+        for row in rows:
+            record = dict(row)
+            record["timings"] = json.loads(record["timings"] or "{}")
+            records.append(record)
+        return records
+    
+    def get_model_stats(self, days: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        按模型汇总自然语言查询的成功率和平均耗时
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: 模型 -> {"total", "succeeded", "avg_total_ms"}
+        """
+        since = time.time() - days * 86400 if days else 0
+        with self._connect() as connection:
+            rows = connection.execute(
+                """
+                SELECT model, COUNT(*) AS total, COALESCE(SUM(success), 0) AS succeeded,
+                       AVG(CASE WHEN success = 1 THEN total_ms END) AS avg_total_ms
+                FROM query_history
+                WHERE source = 'nl' AND model IS NOT NULL AND created_at >= ?
+                GROUP BY model
+                """,
+                (since,)
+            ).fetchall()
+        return {row["model"]: dict(row) for row in rows}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取历史统计：查询次数、成功率和平均耗时"""
+        with self._connect() as connection:
+            row = connection.execute(
+                """
+                SELECT COUNT(*) AS total, COALESCE(SUM(success), 0) AS succeeded,
+                       AVG(total_ms) AS avg_total_ms, COUNT(DISTINCT fingerprint) AS distinct_sql
+                FROM query_history
+                """
+            ).fetchone()
+        return dict(row)
+
+
+# 全局查询历史实例
+query_history = QueryHistoryStore()
@@ -0,0 +1,234 @@
+"""
+性能剖析模块 - 按请求或按采样率剖析查询，输出火焰图折叠栈和cProfile数据，并记录慢查询日志
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import cProfile
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+from config import PROFILING_CONFIG
+from database import database_manager
+from utils.sql_analyzer import sql_analyzer
+
+logger = logging.getLogger(__name__)
+
+
+class _StackSampler:
+    """栈采样器：后台线程定期采样目标线程的调用栈，按折叠栈计数"""
+    
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                # 折叠栈格式以分号分隔栈帧，帧名中不能出现分号
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ","))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+    
+    def start(self):
+        """开始采样"""
+        self._thread.start()
+    
+    def stop(self):
+        """停止采样"""
+        self._stop.set()
+        self._thread.join()
+
+
+class ProfileRun:
+    """一次请求的剖析数据"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.sampler = None
+        self.profiler = None
+        # 剖析文件路径: 类型 -> 路径
+        self.paths = {}
+
+
+class QueryProfiler:
+    """
+    查询性能剖析器
+    
+    - sampling: 栈采样，输出Brendan Gregg折叠栈格式（flamegraph.pl、speedscope可直接读取）
+    - cprofile: 确定性剖析，输出pstats格式的.prof文件（snakeviz、flameprof可读取）
+    """
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or PROFILING_CONFIG
+        self.db_manager = database_manager
+        self._lock = threading.Lock()
+        # 同一时刻只能有一个cProfile处于启用状态（Python 3.12起为进程级限制）
+        self._cprofile_active = False
+        self.stats = {"profiled": 0, "slow_queries": 0, "last_profile": None}
+    
+    def should_profile(self, force: bool = False) -> bool:
+        """显式要求或按采样率命中时剖析本次请求"""
+        return force or random.random() < self.config.get("sample_rate", 0.0)
+    
+    def _start(self, name: str) -> ProfileRun:
+        """启动剖析"""
+        run = ProfileRun(name)
+        profilers = self.config.get("profilers", ["sampling"])
+        if "sampling" in profilers:
+            run.sampler = _StackSampler(threading.get_ident(), self.config.get("sampling_interval_ms", 5) / 1000)
+            run.sampler.start()
+        if "cprofile" in profilers:
+            with self._lock:
+                available = not self._cprofile_active
+                self._cprofile_active = self._cprofile_active or available
+            if available:
+                run.profiler = cProfile.Profile()
+                try:
+                    run.profiler.enable()
+                except ValueError:
+                    # 其他剖析工具（如调试器）已占用
+                    run.profiler = None
+                    with self._lock:
+                        self._cprofile_active = False
+        return run
+    
+    def _stop(self, run: ProfileRun):
+        """停止剖析并写入剖析文件"""
+        if run.profiler is not None:
+            run.profiler.disable()
+            with self._lock:
+                self._cprofile_active = False
+        if run.sampler is not None:
+            run.sampler.stop()
+        
+        output_dir = self.config.get("output_dir", "data/profiles")
+        os.makedirs(output_dir, exist_ok=True)
+        base_path = os.path.join(output_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{run.name}_{uuid.uuid4().hex[:8]}")
+        try:
+            if run.sampler is not None and run.sampler.counts:
+                run.paths["folded"] = f"{base_path}.folded"
+                with open(run.paths["folded"], "w", encoding="utf-8") as f:
+                    for stack, count in run.sampler.counts.most_common():
+                        f.write(f"{stack} {count}\n")
+            if run.profiler is not None:
+                run.paths["prof"] = f"{base_path}.prof"
+                run.profiler.dump_stats(run.paths["prof"])
+        except OSError as e:
+            logger.warning(f"写入剖析文件失败: {e}")
+        
+        with self._lock:
+            self.stats["profiled"] += 1
+            self.stats["last_profile"] = run.paths.get("folded") or run.paths.get("prof")
+        self._prune(output_dir)
+    
+    def _prune(self, output_dir: str):
+        """只保留最新的剖析文件"""
+        max_profiles = self.config.get("max_profiles", 200)
+        try:
+            paths = [os.path.join(output_dir, name) for name in os.listdir(output_dir)]
+            paths.sort(key=os.path.getmtime, reverse=True)
+            for path in paths[max_profiles:]:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"清理剖析文件失败: {e}")
+    
+    @contextmanager
+    def profile(self, name: str, force: bool = False):
+        """
+        剖析代码块，未被选中时不产生任何开销
+        
+        Yields:
+            Optional[ProfileRun]: 被选中时为剖析数据（退出后paths中为剖析文件路径），否则为None
+        """
+        run = self._start(name) if self.should_profile(force) else None
+        try:
+            yield run
+        finally:
+            if run is not None:
+                self._stop(run)
+    
+    def _explain(self, sql_query: str) -> Optional[List[Dict[str, Any]]]:
+        """获取只读查询的执行计划"""
+        if not sql_query or not sql_analyzer.is_read_only(sql_query):
+            return None
+        try:
+            columns, rows = self.db_manager.fetch_rows(f"EXPLAIN {sql_query.strip().rstrip(';')}")
+            return [dict(zip(columns, (str(value) if value is not None else None for value in row))) for row in rows]
+        except Exception as e:
+            return [{"error": str(e)}]
+    
+    def _write_slow_query(self, entry: Dict[str, Any]):
+        """补充执行计划后追加到慢查询日志"""
+        if self.config.get("explain_slow_queries", True):
+            entry["explain"] = self._explain(entry["sql"])
+        path = self.config.get("slow_query_log", "data/slow_queries.jsonl")
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._lock, open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"写入慢查询日志失败: {e}")
+    
+    def check_slow_query(self, source: str, question: Optional[str], model_name: Optional[str],
+                         sql_query: str, timings: dict, start_time: float, success: bool,
+                         error_msg: str, run: Optional[ProfileRun] = None) -> bool:
+        """
+        总耗时超过阈值时写入慢查询日志（执行计划在后台线程获取，不阻塞本次请求）
+        
+        Returns:
+            bool: 是否为慢查询
+        """
+        total_ms = (time.perf_counter() - start_time) * 1000
+        if total_ms < self.config.get("slow_query_ms", 5000):
+            return False
+        
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "source": source,
+            "question": question,
+            "model": model_name,
+            "sql": sql_query,
+            "total_ms": round(total_ms, 1),
+            "timings": {name: round(value, 1) if isinstance(value, float) else value for name, value in timings.items()},
+            "success": success,
+            "error": error_msg or None,
+            "profile": dict(run.paths) if run is not None else None
+        }
+        with self._lock:
+            self.stats["slow_queries"] += 1
+        threading.Thread(target=self._write_slow_query, args=(entry,), name="slow-query-log", daemon=True).start()
+        return True
+    
+    def get_slow_queries(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """读取最近的慢查询日志（新的在前）"""
+        path = self.config.get("slow_query_log", "data/slow_queries.jsonl")
+        if not os.path.exists(path):
+            return []
+        with self._lock, open(path, encoding="utf-8") as f:
+            lines = f.readlines()[-limit:]
+        return [json.loads(line) for line in reversed(lines) if line.strip()]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取剖析统计"""
+        with self._lock:
+            return dict(self.stats)
+
+
+# 全局性能剖析器实例
+query_profiler = QueryProfiler()
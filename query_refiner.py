@@ -0,0 +1,346 @@
+"""
+对话式修改模块 - 对话模式下的追问在上一轮SQL基础上修改：能识别的追问直接改写SQL子句，
+其余只把上一轮SQL和追问组成的增量提示词发给模型，不再发送完整schema重新生成
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from config import CONVERSATION_CONFIG, TABLE_SYNONYMS, TABLE_DATE_COLUMNS
+from template_matcher import TemplateMatcher, template_matcher
+from utils.sql_analyzer import sql_analyzer
+from utils.prompt_budget import prompt_budget
+
+
+class QueryRefiner:
+    """对话上下文管理与SQL修改"""
+    
+    # 顶层子句及其在SQL中的顺序
+    CLAUSES = (
+        ("where", "WHERE", r"\bWHERE\b"),
+        ("group", "GROUP BY", r"\bGROUP\s+BY\b"),
+        ("having", "HAVING", r"\bHAVING\b"),
+        ("order", "ORDER BY", r"\bORDER\s+BY\b"),
+        ("limit", "LIMIT", r"\bLIMIT\b")
+    )
+    
+    # 紧跟在表名后但不是别名的关键字
+    NON_ALIAS_KEYWORDS = {
+        "ON", "USING", "JOIN", "INNER", "LEFT", "RIGHT", "CROSS", "FULL", "OUTER", "NATURAL", "STRAIGHT_JOIN",
+        "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT"
+    }
+    
+    PREFIX = r"(?:那|那么|再|然后)?(?:只看|只要|只显示|只保留|仅看|仅显示|只查|限定为?|筛选|改为|改成|换成)?"
+    NUMBER = r"(?P<number>\d+|[零一二两三四五六七八九十]+)"
+    SUFFIX = r"(?:的)?(?:数据|记录|结果)?(?:吧|呢)?"
+    
+    # 可直接改写的追问句式（对规范化后的追问整句匹配）
+    EDIT_PATTERNS = (
+        ("year", PREFIX + r"(?P<year>\d{4})年" + SUFFIX),
+        ("recent", PREFIX + r"最近" + NUMBER + r"?(?P<unit>天|日|周|星期|个月|月|年)" + SUFFIX),
+        ("limit", PREFIX + r"(?:前|top)" + NUMBER + r"(?:个|条|名|位|家|行)?" + SUFFIX),
+        # 必须以排序方向或"排序"结尾，避免把"按类别统计销售额"之类的新问题当作排序追问
+        ("order", r"(?:再|然后)?按(?:照)?(?=.+(?:降序|升序|倒序|正序|从高到低|从低到高|从大到小|从小到大|排序|排列|排)$)(?P<term>.+?)"
+                  r"(?P<direction>降序|升序|倒序|正序|从高到低|从低到高|从大到小|从小到大)?(?P<sort>排序|排列|排)?")
+    )
+    
+    # 承接上一轮的指代词和句首承接词（短问题包含这些词时视为追问）；
+    # "按""只""改"等也常用于独立问题的句首（如"按类别统计销售额"），不作为承接词
+    ANAPHORA_PATTERN = re.compile(
+        r"^(?:那|那么|再|然后|另外|还有|并且|而且|去掉|排除|加上|同时|以及)"
+        r"|这些|那些|这个|那个|它们|他们|它的|他们的|其中|上面|上述|刚才|上一|之前|以上|同样|也|呢$|吧$"
+        r"|\b(?:them|those|these|that|it|same|instead|only|also|what about|how about|and)\b"
+    )
+    
+    # 多表连接时时间条件默认作用的交易表
+    TRANSACTION_TABLE = "SalesOrder"
+    
+    DIRECTIONS = {
+        "降序": "DESC", "倒序": "DESC", "从高到低": "DESC", "从大到小": "DESC",
+        "升序": "ASC", "正序": "ASC", "从低到高": "ASC", "从小到大": "ASC"
+    }
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or CONVERSATION_CONFIG
+        self._lock = threading.Lock()
+        # 会话ID -> 对话轮次 [{"question", "sql", "method"}]，按最近使用排序
+        self._conversations = OrderedDict()
+        self.edit_patterns = [(name, re.compile(pattern)) for name, pattern in self.EDIT_PATTERNS]
+        self.stats = {
+            "follow_ups": 0, "edits": 0, "model_refinements": 0, "fallbacks": 0, "new_conversations": 0,
+            "by_edit": {name: 0 for name, _ in self.EDIT_PATTERNS}
+        }
+    
+    def get_turns(self, session_id: str) -> List[Dict[str, Any]]:
+        """获取会话的对话轮次"""
+        with self._lock:
+            turns = self._conversations.get(session_id)
+            if turns is None:
+                return []
+            self._conversations.move_to_end(session_id)
+            return list(turns)
+    
+    def add_turn(self, session_id: str, question: str, sql_query: str, method: str = "generate"):
+        """记录一轮成功的查询"""
+        with self._lock:
+            turns = self._conversations.setdefault(session_id, [])
+            self._conversations.move_to_end(session_id)
+            turns.append({"question": question, "sql": sql_query, "method": method})
+            del turns[:-self.config.get("max_turns", 10)]
+            while len(self._conversations) > self.config.get("max_sessions", 1000):
+                self._conversations.popitem(last=False)
+    
+    def reset(self, session_id: str):
+        """开始新对话"""
+        with self._lock:
+            self._conversations.pop(session_id, None)
+    
+    def is_follow_up(self, question: str) -> bool:
+        """
+        判断问题是否为对上一轮的追问：匹配可直接改写的句式，或者是包含指代/承接词的短问题；
+        其余视为与上一轮无关的新问题，应重新生成并开始新对话
+        """
+        normalized = TemplateMatcher.normalize_question(question)
+        if any(regex.fullmatch(normalized) for _, regex in self.edit_patterns):
+            return True
+        if len(normalized) > self.config.get("follow_up_max_chars", 20):
+            return False
+        return bool(self.ANAPHORA_PATTERN.search(normalized) or self.ANAPHORA_PATTERN.search(question.strip().lower()))
+    
+    def merge_question(self, turns: List[Dict[str, Any]], follow_up: str) -> str:
+        """无法在上一轮SQL基础上修改时，合并各轮问题作为完整问题重新生成"""
+        return "；".join([turn["question"] for turn in turns] + [follow_up])
+    
+    @staticmethod
+    def _mask(sql: str) -> str:
+        """将字符串字面量和括号内的内容替换为占位字符（长度不变），只保留顶层结构用于查找子句"""
+        masked = []
+        depth = 0
+        quote = None
+        for char in sql:
+            if quote:
+                masked.append("_")
+                if char == quote:
+                    quote = None
+            elif char in ("'", '"'):
+                quote = char
+                masked.append("_")
+            elif char == "(":
+                depth += 1
+                masked.append("(" if depth == 1 else "_")
+            elif char == ")":
+                depth -= 1
+                masked.append(")" if depth == 0 else "_")
+            else:
+                masked.append(char if depth == 0 else "_")
+        return "".join(masked)
+    
+    def _split(self, sql_query: str) -> Optional[Dict[str, str]]:
+        """
+        将单条SELECT语句按顶层子句拆分
+        
+        Returns:
+            Optional[Dict[str, str]]: {"head": SELECT...FROM...JOIN, "where", "group", "having", "order", "limit"}，
+            不是单条SELECT（或含UNION、子句重复）时返回None
+        """
+        sql = sql_analyzer.strip_comments(sql_query).strip().rstrip(";").strip()
+        if not sql_analyzer.is_read_only(sql) or not re.match(r"SELECT\b", sql, re.IGNORECASE):
+            return None
+        masked = self._mask(sql)
+        if re.search(r"\bUNION\b", masked, re.IGNORECASE):
+            return None
+        
+        positions = []
+        for name, _, pattern in self.CLAUSES:
+            matches = list(re.finditer(pattern, masked, re.IGNORECASE))
+            if len(matches) > 1:
+                return None
+            if matches:
+                positions.append((matches[0].start(), matches[0].end(), name))
+        if sorted(positions) != positions:
+            return None
+        
+        head_end = positions[0][0] if positions else len(sql)
+        parts = {"head": sql[:head_end].strip(), "masked_head": masked[:head_end]}
+        for index, (start, end, name) in enumerate(positions):
+            stop = positions[index + 1][0] if index + 1 < len(positions) else len(sql)
+            parts[name] = sql[end:stop].strip()
+        return parts
+    
+    def _join(self, parts: Dict[str, str]) -> str:
+        """按子句顺序重新拼接SQL"""
+        sql = parts["head"]
+        for name, keyword, _ in self.CLAUSES:
+            if parts.get(name):
+                sql += f"\n{keyword} {parts[name]}"
+        return sql + ";"
+    
+    def _tables(self, masked_head: str) -> List[Tuple[str, str]]:
+        """FROM/JOIN中的表: [(表名, 引用名)]，引用名为别名或表名"""
+        tables = []
+        pattern = r"\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?"
+        for match in re.finditer(pattern, masked_head, re.IGNORECASE):
+            table_name = sql_analyzer.known_tables.get(match.group(1).lower())
+            if not table_name:
+                continue
+            alias = match.group(2)
+            if alias and alias.upper() in self.NON_ALIAS_KEYWORDS:
+                alias = None
+            tables.append((table_name, alias or table_name))
+        return tables
+    
+    @staticmethod
+    def _qualify(reference: str, column: str, tables: List[Tuple[str, str]]) -> str:
+        """多表查询时为列名加上表名或别名"""
+        return f"{reference}.{column}" if len(tables) > 1 else column
+    
+    def _date_column(self, tables: List[Tuple[str, str]]) -> Optional[str]:
+        """查询中有日期列的表的日期列；多个表有日期列时使用交易表的日期列，没有交易表时无法确定返回None"""
+        candidates = [(table_name, reference) for table_name, reference in tables if table_name in TABLE_DATE_COLUMNS]
+        if len(candidates) > 1:
+            candidates = [candidate for candidate in candidates if candidate[0] == self.TRANSACTION_TABLE]
+        if len(candidates) != 1:
+            return None
+        table_name, reference = candidates[0]
+        return self._qualify(reference, TABLE_DATE_COLUMNS[table_name], tables)
+    
+    def _add_condition(self, parts: Dict[str, str], condition: str, replace_pattern: str):
+        """追加WHERE条件；已有同类条件时替换"""
+        where = parts.get("where", "")
+        if where and re.search(replace_pattern, where, re.IGNORECASE):
+            parts["where"] = re.sub(replace_pattern, lambda match: condition, where, count=1, flags=re.IGNORECASE)
+        elif where:
+            if re.search(r"\bOR\b", self._mask(where), re.IGNORECASE):
+                where = f"({where})"
+            parts["where"] = f"{where} AND {condition}"
+        else:
+            parts["where"] = condition
+    
+    def _order_target(self, parts: Dict[str, str], tables: List[Tuple[str, str]], term: str) -> Optional[str]:
+        """将追问中的排序对象解析为SELECT别名或列"""
+        select_list = re.sub(r"^\s*SELECT\s+(?:DISTINCT\s+)?", "", parts["head"], flags=re.IGNORECASE)
+        masked_list = self._mask(select_list)
+        from_match = re.search(r"\bFROM\b", masked_list, re.IGNORECASE)
+        if from_match:
+            select_list, masked_list = select_list[:from_match.start()], masked_list[:from_match.start()]
+        
+        # 带AS别名的SELECT项: [(表达式, 别名)]
+        aliased = []
+        start = 0
+        for index in [match.start() for match in re.finditer(",", masked_list)] + [len(select_list)]:
+            item = select_list[start:index].strip()
+            start = index + 1
+            match = re.match(r"(.+?)\s+AS\s+`?(\w+)`?$", item, re.IGNORECASE | re.DOTALL)
+            if match:
+                aliased.append((match.group(1), match.group(2)))
+        
+        for _, alias in aliased:
+            if alias.lower() == term:
+                return alias
+        
+        for table_name, reference in tables:
+            columns = template_matcher.column_lookup.get(table_name, {}).get(term)
+            if not columns or len(columns) != 1:
+                continue
+            column = columns[0]
+            for expression, alias in aliased:
+                if re.search(rf"\b{column}\b", expression):
+                    return alias
+            if not parts.get("group") and not sql_analyzer.is_aggregate_query(parts["head"]):
+                return self._qualify(reference, column, tables)
+        return None
+    
+    def apply_edit(self, previous_sql: str, follow_up: str) -> Optional[Dict[str, Any]]:
+        """
+        将能识别的追问直接改写为SQL子句修改
+        
+        Returns:
+            Optional[Dict[str, Any]]: {"method": "edit", "edit": 改写类型, "sql": 修改后的SQL}，无法改写返回None
+        """
+        if not self.config.get("deterministic_edits", True):
+            return None
+        parts = self._split(previous_sql)
+        if parts is None:
+            return None
+        normalized = TemplateMatcher.normalize_question(follow_up)
+        tables = self._tables(parts["masked_head"])
+        if not tables:
+            return None
+        
+        for name, regex in self.edit_patterns:
+            match = regex.fullmatch(normalized)
+            if not match:
+                continue
+            groups = {key: value for key, value in match.groupdict().items() if value is not None}
+            
+            if name in ("year", "recent"):
+                date_column = self._date_column(tables)
+                if not date_column:
+                    return None
+                escaped = re.escape(date_column)
+                if name == "year":
+                    condition = f"YEAR({date_column}) = {groups['year']}"
+                    replace_pattern = rf"YEAR\(\s*{escaped}\s*\)\s*=\s*\d{{4}}"
+                else:
+                    number = template_matcher.parse_number(groups["number"]) if "number" in groups else 1
+                    if not number:
+                        return None
+                    condition = f"{date_column} >= DATE_SUB(CURDATE(), INTERVAL {number} {TemplateMatcher.UNITS[groups['unit']]})"
+                    replace_pattern = (
+                        rf"{escaped}\s*>=\s*DATE_SUB\(\s*(?:CURDATE\(\)|NOW\(\)|CURRENT_DATE(?:\(\))?)\s*,"
+                        rf"\s*INTERVAL\s+\d+\s+\w+\s*\)"
+                    )
+                self._add_condition(parts, condition, replace_pattern)
+            elif name == "limit":
+                number = template_matcher.parse_number(groups["number"])
+                if not number or number > self.config.get("max_limit", 1000):
+                    return None
+                parts["limit"] = str(number)
+            else:
+                if "direction" not in groups and "sort" not in groups:
+                    return None
+                target = self._order_target(parts, tables, groups["term"])
+                if not target:
+                    return None
+                direction = self.DIRECTIONS.get(groups.get("direction"), self.config.get("default_order", "DESC"))
+                parts["order"] = f"{target} {direction}"
+            return {"method": "edit", "edit": name, "sql": self._join(parts)}
+        return None
+    
+    def build_delta_prompt(self, turns: List[Dict[str, Any]], follow_up: str) -> str:
+        """增量提示词：相关表的紧凑schema、历次问题、上一轮SQL和追问"""
+        previous_sql = turns[-1]["sql"]
+        tables = set(sql_analyzer.extract_tables(previous_sql))
+        follow_up_lower = follow_up.lower()
+        for table_name, synonyms in TABLE_SYNONYMS.items():
+            if table_name.lower() in follow_up_lower or any(synonym in follow_up_lower for synonym in synonyms):
+                tables.add(table_name)
+        schema = prompt_budget.encode_schema(self.config.get("delta_schema_encoding", "compact"), follow_up, sorted(tables))
+        questions = "\n".join(f"- {turn['question']}" for turn in turns)
+        return (
+            f"### Database Schema (tables involved)\n{schema}\n\n"
+            f"### Previous Questions\n{questions}\n\n"
+            f"### Current SQL\n{previous_sql}\n\n"
+            f"### Follow-up\n{follow_up}\n\n"
+            "Modify the current MySQL query so that it also satisfies the follow-up. "
+            "Return only the complete SQL statement."
+        )
+    
+    def record(self, outcome: str, edit: Optional[str] = None):
+        """记录一次追问的处理方式（edits/model_refinements/fallbacks），new_conversations表示问题不是追问"""
+        with self._lock:
+            if outcome != "new_conversations":
+                self.stats["follow_ups"] += 1
+            self.stats[outcome] += 1
+            if edit:
+                self.stats["by_edit"][edit] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取追问处理统计"""
+        with self._lock:
+            return {**self.stats, "by_edit": dict(self.stats["by_edit"]), "sessions": len(self._conversations)}
+
+
+# 全局对话式修改实例
+query_refiner = QueryRefiner()
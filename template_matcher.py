@@ -0,0 +1,230 @@
+"""
+问题模板模块 - 将固定句式的问题直接映射为SQL，命中时跳过模型调用
+"""
+
+import re
+import threading
+from typing import Optional, Dict, Any, List
+from config import (
+    TEMPLATE_CONFIG, QUESTION_TEMPLATES, TABLE_COLUMNS, TABLE_SYNONYMS, COLUMN_SYNONYMS,
+    MULTI_COLUMN_SYNONYMS, TABLE_LABEL_COLUMNS, TABLE_DATE_COLUMNS, TABLE_INFO
+)
+
+
+class TemplateMatcher:
+    """问题模板匹配器"""
+    
+    VERB_PATTERN = r"(?:请|帮我)?(?:查询|查找|查看|显示|列出|找出|获取|给出|统计)?(?:一下)?"
+    
+    # 比较运算（长词在前，避免"不超过"被"超过"截断）
+    OPERATORS = {
+        "不低于": ">=", "不少于": ">=", "至少": ">=", "不超过": "<=", "不高于": "<=", "至多": "<=",
+        "超过": ">", "大于": ">", "高于": ">", "多于": ">", "低于": "<", "小于": "<", "少于": "<",
+        "不足": "<", "等于": "=", ">=": ">=", "<=": "<=", ">": ">", "<": "<", "=": "="
+    }
+    
+    ORDERS = {"最高": "DESC", "最大": "DESC", "最多": "DESC", "最贵": "DESC",
+              "最低": "ASC", "最小": "ASC", "最少": "ASC", "最便宜": "ASC"}
+    
+    UNITS = {"天": "DAY", "日": "DAY", "周": "WEEK", "星期": "WEEK", "个月": "MONTH", "月": "MONTH", "年": "YEAR"}
+    
+    CHINESE_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+    
+    COLUMN_SEPARATORS = r"和|及|以及|与|、|,"
+    
+    # 可与数字比较的列类型
+    NUMERIC_TYPES = ("INT", "TINYINT", "SMALLINT", "MEDIUMINT", "BIGINT", "DECIMAL", "NUMERIC", "FLOAT", "DOUBLE")
+    
+    # 表同义词中表示度量而非实体的词，不能作为"查询某表"的表名
+    MEASURE_TERMS = ("销售额", "销量")
+    
+    def __init__(self, templates: Optional[List[Dict[str, Any]]] = None, config: Optional[Dict[str, Any]] = None):
+        self.config = config or TEMPLATE_CONFIG
+        self._lock = threading.Lock()
+        
+        # 表同义词 -> 表名
+        self.table_lookup = {name.lower(): name for name in TABLE_COLUMNS}
+        for table_name, synonyms in TABLE_SYNONYMS.items():
+            for synonym in synonyms:
+                if synonym not in self.MEASURE_TERMS:
+                    self.table_lookup.setdefault(synonym.lower(), table_name)
+        
+        # 表 -> {列同义词: [列名]}
+        self.column_lookup = {}
+        for table_name, columns in TABLE_COLUMNS.items():
+            lookup = {column.lower(): [column] for column in columns}
+            for column, synonyms in COLUMN_SYNONYMS.get(table_name, {}).items():
+                for synonym in synonyms:
+                    lookup.setdefault(synonym.lower(), [column])
+            for synonym, multi_columns in MULTI_COLUMN_SYNONYMS.items():
+                if all(column in columns for column in multi_columns):
+                    lookup.setdefault(synonym, list(multi_columns))
+            self.column_lookup[table_name] = lookup
+        
+        # 表 -> 数值列（比较模板只允许数值列与数字比较）
+        self.numeric_columns = {}
+        for match in re.finditer(r'^-\s*(\w+)\((.*)\)\s*$', TABLE_INFO, flags=re.MULTILINE):
+            self.numeric_columns[match.group(1)] = {
+                name for name, column_type in re.findall(r'(\w+)\s+(\w+)', match.group(2))
+                if column_type.upper() in self.NUMERIC_TYPES
+            }
+        
+        all_column_terms = {term for lookup in self.column_lookup.values() for term in lookup}
+        slots = {
+            "verb": self.VERB_PATTERN,
+            "table": f"(?P<table>{self._alternation(self.table_lookup)})",
+            "column": f"(?P<column>{self._alternation(all_column_terms)})",
+            "columns": (
+                f"(?P<columns>(?:{self._alternation(all_column_terms)})"
+                f"(?:(?:{self.COLUMN_SEPARATORS})(?:{self._alternation(all_column_terms)}))*)"
+            ),
+            "number": r"(?P<number>\d+|[零一二两三四五六七八九十]+)",
+            "year": r"(?P<year>\d{4})",
+            "unit": f"(?P<unit>{self._alternation(self.UNITS)})",
+            "op": f"(?P<op>{self._alternation(self.OPERATORS)})",
+            "order": f"(?P<order>{self._alternation(self.ORDERS)})"
+        }
+        self.templates = [
+            {**template, "regex": re.compile(self._expand(template["pattern"], slots))}
+            for template in (templates or QUESTION_TEMPLATES)
+        ]
+        self.stats = {"checked": 0, "hits": 0, "by_template": {template["name"]: 0 for template in self.templates}}
+    
+    @staticmethod
+    def _alternation(terms) -> str:
+        """生成正则多选分支，长词优先"""
+        return "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    
+    @staticmethod
+    def _expand(pattern: str, slots: Dict[str, str]) -> str:
+        """将模式中的占位符替换为命名分组"""
+        return re.sub(r"\{(\w+)\}", lambda match: slots[match.group(1)], pattern)
+    
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """规范化问题：小写，去掉空白和标点（保留列分隔用的顿号和逗号）"""
+        normalized = question.strip().lower()
+        normalized = normalized.replace("，", ",")
+        normalized = re.sub(r"[\s。？！?!；;：:“”\"'（）()]+", "", normalized)
+        return normalized.rstrip(",、")
+    
+    def parse_number(self, text: str) -> Optional[int]:
+        """解析阿拉伯数字或不超过两位的中文数字"""
+        if text.isdigit():
+            return int(text)
+        if "十" in text:
+            tens, _, ones = text.partition("十")
+            if len(tens) > 1 or len(ones) > 1:
+                return None
+            tens_value = self.CHINESE_DIGITS.get(tens, 1 if not tens else None)
+            ones_value = self.CHINESE_DIGITS.get(ones, 0 if not ones else None)
+            if tens_value is None or ones_value is None:
+                return None
+            return tens_value * 10 + ones_value
+        return self.CHINESE_DIGITS.get(text) if len(text) == 1 else None
+    
+    def _resolve_columns(self, table_name: str, text: str) -> Optional[List[str]]:
+        """将列同义词（可能是列表）解析为表中的列名，有无法解析的列返回None"""
+        lookup = self.column_lookup[table_name]
+        columns = []
+        for term in re.split(self.COLUMN_SEPARATORS, text):
+            resolved = lookup.get(term)
+            if not resolved:
+                return None
+            columns.extend(column for column in resolved if column not in columns)
+        return columns
+    
+    def _build_values(self, template: Dict[str, Any], match) -> Optional[Dict[str, Any]]:
+        """根据匹配结果构建SQL模板参数，参数与表结构不符时返回None"""
+        groups = {key: value for key, value in match.groupdict().items() if value is not None}
+        values = dict(template.get("defaults", {}))
+        table_name = self.table_lookup[groups["table"]]
+        values["table"] = table_name
+        
+        if "column" in groups:
+            columns = self._resolve_columns(table_name, groups["column"])
+            if not columns or len(columns) != 1:
+                return None
+            values["column"] = columns[0]
+            label_columns = [column for column in TABLE_LABEL_COLUMNS.get(table_name, []) if column != columns[0]]
+            values["select_list"] = ", ".join(label_columns + columns) if label_columns else "*"
+        if "columns" in groups:
+            columns = self._resolve_columns(table_name, groups["columns"])
+            if not columns:
+                return None
+            values["columns"] = ", ".join(columns)
+        if "number" in groups:
+            number = self.parse_number(groups["number"])
+            if number is None:
+                return None
+            values["number"] = number
+        if "number" in values and "LIMIT {number}" in template["sql"]:
+            if not 0 < values["number"] <= self.config.get("max_limit", 1000):
+                return None
+        if "year" in groups:
+            values["year"] = int(groups["year"])
+        if "unit" in groups:
+            values["unit"] = self.UNITS[groups["unit"]]
+        if "op" in groups:
+            if values.get("column") not in self.numeric_columns.get(table_name, ()):
+                return None
+            values["op"] = self.OPERATORS[groups["op"]]
+        if "order" in groups:
+            values["order"] = self.ORDERS[groups["order"]]
+        if "{date_column}" in template["sql"]:
+            if table_name not in TABLE_DATE_COLUMNS:
+                return None
+            values["date_column"] = TABLE_DATE_COLUMNS[table_name]
+        return values
+    
+    def match(self, question: str, record_stats: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        将问题与模板匹配
+        
+        Args:
+            record_stats: 是否计入命中统计（仅用于预判时不计入）
+        
+        Returns:
+            Optional[Dict[str, Any]]: {"template": 模板名, "sql": 生成的SQL}，未命中返回None
+        """
+        if not self.config.get("enabled"):
+            return None
+        
+        normalized = self.normalize_question(question)
+        result = None
+        for template in self.templates:
+            match = template["regex"].fullmatch(normalized)
+            if not match:
+                continue
+            values = self._build_values(template, match)
+            if values is None:
+                continue
+            try:
+                result = {"template": template["name"], "sql": template["sql"].format(**values)}
+            except KeyError:
+                continue
+            break
+        
+        if not record_stats:
+            return result
+        with self._lock:
+            self.stats["checked"] += 1
+            if result:
+                self.stats["hits"] += 1
+                self.stats["by_template"][result["template"]] += 1
+        return result
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取模板命中统计"""
+        with self._lock:
+            checked = self.stats["checked"]
+            return {
+                "checked": checked,
+                "hits": self.stats["hits"],
+                "hit_rate": self.stats["hits"] / checked if checked else 0.0,
+                "by_template": dict(self.stats["by_template"])
+            }
+
+
+# 全局问题模板匹配器实例
+template_matcher = TemplateMatcher()
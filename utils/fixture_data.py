@@ -0,0 +1,83 @@
+"""
+测试库数据工具 - 按TABLE_INFO生成确定性的测试数据，供模型评估（DuckDB）和索引建议验证（SQLite）的本地测试库使用
+"""
+
+import re
+import random
+from datetime import date, timedelta
+from typing import Optional, Dict, List, Tuple
+from config import EVALUATION_CONFIG
+from utils.prompt_budget import prompt_budget
+
+# 测试库中取值受限的列
+FIXTURE_CHOICES = {
+    "Status": ["Completed", "Pending", "Shipped", "Cancelled"],
+    "Position": ["Sales", "Engineer", "Manager", "Support"],
+    "PaymentMethod": ["Card", "Cash", "Transfer"],
+    "ContactTitle": ["Owner", "Sales Manager", "Buyer"]
+}
+
+# 测试库中数值列的取值范围
+FIXTURE_RANGES = {
+    "UnitPrice": (5, 500), "Salary": (3000, 30000), "TotalPrice": (5, 5000),
+    "Quantity": (1, 10), "StockQuantity": (0, 200), "ReorderLevel": (10, 50), "QuantityChange": (-20, 20)
+}
+
+
+def base_type(column_type: str) -> str:
+    """去掉长度参数的大写列类型，如 VARCHAR(50) -> VARCHAR"""
+    return re.sub(r'\(.*\)', '', column_type).strip().upper()
+
+
+def fixture_value(rng, table_name, column_name, column_type, index, row_counts, today, days):
+    """生成测试库中一个单元格的值"""
+    column_base_type = base_type(column_type)
+    target = column_name[:-2] if column_name.endswith("ID") else None
+    if target and target != table_name and target in row_counts:
+        return rng.randint(1, row_counts[target])
+    if column_name in FIXTURE_CHOICES:
+        return rng.choice(FIXTURE_CHOICES[column_name])
+    if column_name == "Discount":
+        return rng.choice([0, round(rng.uniform(0.05, 0.2), 2)])
+    if column_name in FIXTURE_RANGES:
+        low, high = FIXTURE_RANGES[column_name]
+        return round(rng.uniform(low, high), 2) if column_base_type == "DECIMAL" else rng.randint(low, high)
+    if column_name == "Email":
+        # 部分供应商没有邮箱，使 IS NULL 条件有意义
+        return None if table_name == "Supplier" and rng.random() < 0.2 else f"{table_name.lower()}{index}@example.com"
+    if column_base_type == "DATE":
+        return today - timedelta(days=rng.randint(0, days))
+    if column_base_type == "TINYINT":
+        return int(rng.random() < 0.7)
+    if column_base_type == "INT":
+        return rng.randint(0, 100)
+    if column_base_type == "DECIMAL":
+        return round(rng.uniform(0, 1000), 2)
+    return f"{column_name} {index}"
+
+
+def generate_fixture_rows(seed: Optional[int] = None, row_counts: Optional[Dict[str, int]] = None,
+                          days: Optional[int] = None) -> Dict[str, Tuple[List[Tuple[str, str]], List[tuple]]]:
+    """
+    生成各表的测试数据：首列为自增主键，<表名>ID列引用对应表，日期分布在最近N天内
+    
+    Returns:
+        Dict[str, Tuple[List[Tuple[str, str]], List[tuple]]]: 表名 -> ([(列名, MySQL类型)], 行数据)
+    """
+    rng = random.Random(seed if seed is not None else EVALUATION_CONFIG["fixture_seed"])
+    row_counts = row_counts or EVALUATION_CONFIG["fixture_rows"]
+    days = days or EVALUATION_CONFIG["fixture_days"]
+    today = date.today()
+    
+    tables = {}
+    for table_name, columns in prompt_budget.tables.items():
+        rows = [
+            tuple(
+                index if position == 0 else
+                fixture_value(rng, table_name, column_name, column_type, index, row_counts, today, days)
+                for position, (column_name, column_type) in enumerate(columns)
+            )
+            for index in range(1, row_counts.get(table_name, 20) + 1)
+        ]
+        tables[table_name] = (columns, rows)
+    return tables
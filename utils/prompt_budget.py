@@ -0,0 +1,224 @@
+"""
+提示词预算工具 - 统计提示词各部分的token数，提供紧凑的schema编码，并按模型预算选择合适的编码
+"""
+
+import re
+import threading
+from typing import Optional, List, Dict, Any, Tuple
+from config import PROMPT_BUDGET_CONFIG, TABLE_INFO
+
+
+class PromptBudgetManager:
+    """
+    提示词token预算管理器
+    
+    schema编码从详细到紧凑依次为：
+    - full: TABLE_INFO原文
+    - compact: 缩写类型（INT→i、VARCHAR→s等），外键以 →表名 标注
+    - minimal: 省略类型，只保留外键标注，并省略与问题无关的长文本列
+    """
+    
+    # 类型缩写
+    TYPE_ABBREVIATIONS = {
+        "INT": "i", "BIGINT": "i", "SMALLINT": "i", "TINYINT": "b",
+        "VARCHAR": "s", "CHAR": "s", "TEXT": "t",
+        "DATE": "d", "DATETIME": "dt", "TIMESTAMP": "dt",
+        "DECIMAL": "n", "FLOAT": "f", "DOUBLE": "f"
+    }
+    
+    # 长文本列（minimal编码下省略，问题中提到列名时保留）
+    FREE_TEXT_TYPES = ("TEXT",)
+    
+    ENCODINGS = ("full", "compact", "minimal")
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None, table_info: str = TABLE_INFO):
+        self.config = config or PROMPT_BUDGET_CONFIG
+        self.table_info = table_info
+        self.tables = self._parse_table_info(table_info)
+        self._lock = threading.Lock()
+        # 模型 -> 记录列表: {"prompt_tokens", "schema_encoding", "latency_ms"}
+        self._records = {}
+    
+    @staticmethod
+    def _parse_table_info(table_info: str) -> Dict[str, List[Tuple[str, str]]]:
+        """解析TABLE_INFO为 {表名: [(列名, 类型), ...]}"""
+        tables = {}
+        for match in re.finditer(r'^-\s*(\w+)\((.*)\)\s*$', table_info, flags=re.MULTILINE):
+            columns = []
+            for column_def in re.split(r',\s*(?![^()]*\))', match.group(2)):
+                parts = column_def.strip().split(None, 1)
+                if parts:
+                    columns.append((parts[0], parts[1] if len(parts) > 1 else ""))
+            tables[match.group(1)] = columns
+        return tables
+    
+    def _foreign_key_target(self, table_name: str, column_name: str) -> Optional[str]:
+        """按命名约定推断外键：列名为 <表名>ID 且不是本表主键"""
+        if not column_name.endswith("ID"):
+            return None
+        target = column_name[:-2]
+        if target == table_name or target not in self.tables:
+            return None
+        return target
+    
+    def _abbreviate_type(self, column_type: str) -> str:
+        """缩写列类型，去掉长度参数"""
+        base_type = re.sub(r'\(.*\)', '', column_type).strip().upper()
+        return self.TYPE_ABBREVIATIONS.get(base_type, base_type.lower())
+    
+    def encode_schema(self, encoding: str, question: str = "", tables: Optional[List[str]] = None) -> str:
+        """
+        按指定编码生成schema文本
+        
+        Args:
+            encoding: full/compact/minimal
+            question: 用户问题，minimal编码据此保留被提到的长文本列
+            tables: 只编码这些表（full编码不支持，始终为完整schema）
+        """
+        if encoding == "full":
+            return self.table_info
+        
+        question_lower = question.lower()
+        lines = []
+        for table_name, columns in self.tables.items():
+            if tables is not None and table_name not in tables:
+                continue
+            parts = []
+            for column_name, column_type in columns:
+                base_type = re.sub(r'\(.*\)', '', column_type).strip().upper()
+                target = self._foreign_key_target(table_name, column_name)
+                if encoding == "minimal":
+                    if base_type in self.FREE_TEXT_TYPES and column_name.lower() not in question_lower:
+                        continue
+                    parts.append(f"{column_name}→{target}" if target else column_name)
+                else:
+                    part = f"{column_name} {self._abbreviate_type(column_type)}"
+                    parts.append(f"{part}→{target}" if target else part)
+            lines.append(f"{table_name}({','.join(parts)})")
+        
+        legend = "i=int b=bool s=str t=text d=date dt=datetime n=decimal f=float →=FK\n"
+        return (legend if encoding == "compact" else "→=FK\n") + "\n".join(lines)
+    
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        """
+        估算token数：中日韩字符按每字1个token，其余按单词/符号切分，长单词按每4个字符1个token
+        """
+        if not text:
+            return 0
+        cjk_count = len(re.findall(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]', text))
+        tokens = cjk_count
+        for piece in re.findall(r'[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]', text):
+            tokens += max(1, (len(piece) + 3) // 4) if piece[0].isalnum() or piece[0] == '_' else 1
+        return tokens
+    
+    def count_sections(self, sections: Dict[str, str]) -> Dict[str, int]:
+        """统计提示词各部分的token数"""
+        counts = {name: self.count_tokens(text) for name, text in sections.items()}
+        counts["total"] = sum(counts.values())
+        return counts
+    
+    def get_budget(self, model_name: str) -> int:
+        """获取模型的提示词token预算（按模型名前缀匹配，未配置使用默认值）"""
+        model_budgets = self.config.get("model_budgets", {})
+        if model_name in model_budgets:
+            return model_budgets[model_name]
+        matches = [prefix for prefix in model_budgets if model_name.startswith(prefix)]
+        if matches:
+            return model_budgets[max(matches, key=len)]
+        return self.config.get("default_budget", 4096)
+    
+    def choose_schema(self, model_name: str, question: str,
+                      fixed_sections: Optional[Dict[str, str]] = None,
+                      candidates: Optional[List[Tuple[str, str]]] = None) -> Dict[str, Any]:
+        """
+        选择能放入模型预算的schema表示
+        
+        按从详细到紧凑的顺序尝试，返回第一个能放入预算的编码（只做必要的压缩）；
+        都放不下时使用最紧凑的编码
+        
+        Args:
+            fixed_sections: 除schema外的固定部分（问题、指令、示例等）
+            candidates: 额外的候选schema [(名称, 文本)]，优先于内置编码尝试
+        
+        Returns:
+            Dict[str, Any]: {"encoding", "schema", "sections", "budget", "fits"}
+        """
+        sections = dict(fixed_sections or {})
+        sections.setdefault("question", question)
+        budget = self.get_budget(model_name) - self.config.get("reserve_for_output", 0)
+        
+        options = list(candidates or [])
+        if self.config.get("enabled", True):
+            options += [(encoding, None) for encoding in self.ENCODINGS]
+        else:
+            options += [("full", None)]
+        
+        chosen = None
+        for encoding, schema in options:
+            schema = schema if schema is not None else self.encode_schema(encoding, question)
+            counts = self.count_sections({**sections, "schema": schema})
+            chosen = {
+                "encoding": encoding,
+                "schema": schema,
+                "sections": counts,
+                "budget": budget,
+                "fits": counts["total"] <= budget
+            }
+            if chosen["fits"]:
+                break
+        return chosen
+    
+    def measure(self, model_name: str, sections: Dict[str, str], encoding: str = "full") -> Dict[str, Any]:
+        """统计由外部模板构建的提示词（不改变schema表示），返回与choose_schema相同结构"""
+        counts = self.count_sections(sections)
+        budget = self.get_budget(model_name) - self.config.get("reserve_for_output", 0)
+        return {
+            "encoding": encoding,
+            "schema": sections.get("schema", ""),
+            "sections": counts,
+            "budget": budget,
+            "fits": counts["total"] <= budget
+        }
+    
+    def record(self, model_name: str, choice: Dict[str, Any], latency_ms: float):
+        """记录一次生成的提示词规模和耗时"""
+        with self._lock:
+            records = self._records.setdefault(model_name, [])
+            records.append({
+                "prompt_tokens": choice["sections"]["total"],
+                "schema_encoding": choice["encoding"],
+                "latency_ms": latency_ms
+            })
+            del records[:-self.config.get("max_records_per_model", 500)]
+    
+    def get_report(self) -> List[Dict[str, Any]]:
+        """
+        按模型和schema编码汇总提示词规模与生成耗时
+        
+        Returns:
+            List[Dict[str, Any]]: 每项包含模型、编码、次数、平均token数、平均耗时和每千token耗时
+        """
+        with self._lock:
+            groups = {}
+            for model_name, records in self._records.items():
+                for record in records:
+                    groups.setdefault((model_name, record["schema_encoding"]), []).append(record)
+        
+        report = []
+        for (model_name, encoding), records in sorted(groups.items()):
+            avg_tokens = sum(record["prompt_tokens"] for record in records) / len(records)
+            avg_latency = sum(record["latency_ms"] for record in records) / len(records)
+            report.append({
+                "model": model_name,
+                "schema_encoding": encoding,
+                "count": len(records),
+                "avg_prompt_tokens": round(avg_tokens),
+                "avg_latency_ms": round(avg_latency),
+                "ms_per_1k_tokens": round(avg_latency / avg_tokens * 1000) if avg_tokens else None
+            })
+        return report
+
+
+# 全局提示词预算管理器实例
+prompt_budget = PromptBudgetManager()
@@ -0,0 +1,74 @@
+"""
+查询缓存工具 - 线程安全的LRU缓存，支持可选的过期时间
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Hashable, Dict
+
+
+class QueryCache:
+    """带TTL的LRU缓存"""
+    
+    def __init__(self, max_size: int = 128, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，不存在或已过期返回None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def contains(self, key: Hashable) -> bool:
+        """检查是否存在未过期的缓存条目（不计入命中统计）"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (self.ttl is None or time.time() - entry[1] <= self.ttl)
+    
+    def set(self, key: Hashable, value: Any):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def invalidate(self, key: Hashable):
+        """删除指定缓存条目"""
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
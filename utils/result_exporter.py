@@ -0,0 +1,237 @@
+"""
+结果导出工具 - 从数据库游标分批流式导出查询结果为CSV/Parquet/Arrow文件
+"""
+
+import os
+import csv
+import time
+import tempfile
+from decimal import Decimal
+from typing import Iterator, List, Tuple, Optional, Dict, Any
+from config import EXPORT_CONFIG
+from database import database_manager
+from utils.sql_analyzer import sql_analyzer
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = pq = ipc = None
+    PYARROW_AVAILABLE = False
+
+
+class ResultExporter:
+    """流式结果导出器，内存占用只与批大小有关"""
+    
+    FORMATS = {
+        "csv": {"extension": ".csv", "mime": "text/csv"},
+        "parquet": {"extension": ".parquet", "mime": "application/vnd.apache.parquet"},
+        "arrow": {"extension": ".arrow", "mime": "application/vnd.apache.arrow.file"}
+    }
+    
+    def __init__(self):
+        self.db_manager = database_manager
+        self.batch_size = EXPORT_CONFIG["batch_size"]
+    
+    def get_supported_formats(self) -> List[str]:
+        """获取当前环境支持的导出格式"""
+        if PYARROW_AVAILABLE:
+            return list(self.FORMATS)
+        return ["csv"]
+    
+    def iter_batches(self, sql_query: str, batch_size: Optional[int] = None) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """
+        逐批读取查询结果
+        
+        Yields:
+            Tuple[List[str], List[tuple]]: (列名列表, 当前批次行数据)
+        """
+        batch_size = batch_size or self.batch_size
+        # 导出为只读操作，启用副本时优先使用副本
+        engine = self.db_manager.get_read_engine(sql_query)
+        with engine.connect() as connection:
+            # no_parameters避免驱动对LIKE '%...%'中的百分号做参数替换
+            connection = connection.execution_options(no_parameters=True)
+            # 支持服务端游标的驱动使用流式结果，避免驱动层一次性缓冲全部行
+            if getattr(engine.dialect, "supports_server_side_cursors", False):
+                connection = connection.execution_options(stream_results=True, max_row_buffer=batch_size)
+            result = connection.exec_driver_sql(sql_query)
+            if not result.returns_rows:
+                return
+            columns = list(result.keys())
+            has_rows = False
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                has_rows = True
+                yield columns, [tuple(row) for row in rows]
+            if not has_rows:
+                # 空结果也返回列名，保证导出文件带表头
+                yield columns, []
+    
+    def _write_csv(self, path: str, batches) -> Tuple[int, int]:
+        """写入CSV文件"""
+        total_rows = 0
+        batch_count = 0
+        with open(path, "w", newline="", encoding=EXPORT_CONFIG["csv_encoding"]) as f:
+            writer = csv.writer(f)
+            header_written = False
+            for columns, rows in batches:
+                if not header_written:
+                    writer.writerow(columns)
+                    header_written = True
+                writer.writerows(rows)
+                total_rows += len(rows)
+                batch_count += 1 if rows else 0
+        return total_rows, batch_count
+    
+    @staticmethod
+    def _infer_schema(columns: List[str], rows: List[tuple]):
+        """根据首个批次推断Arrow schema，空列降级为字符串、Decimal放宽精度"""
+        fields = []
+        for index, name in enumerate(columns):
+            values = [row[index] for row in rows]
+            data_type = pa.array(values).type
+            if pa.types.is_null(data_type):
+                data_type = pa.string()
+            elif pa.types.is_decimal(data_type):
+                data_type = pa.decimal128(38, data_type.scale)
+            fields.append(pa.field(name, data_type))
+        return pa.schema(fields)
+    
+    @staticmethod
+    def _to_record_batch(schema, rows: List[tuple]):
+        """按列转换一批行数据为RecordBatch"""
+        arrays = []
+        for index, field in enumerate(schema):
+            values = [row[index] for row in rows]
+            if pa.types.is_string(field.type):
+                values = [None if value is None else str(value) for value in values]
+            elif pa.types.is_floating(field.type):
+                values = [float(value) if isinstance(value, Decimal) else value for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+    
+    def _write_arrow_format(self, path: str, batches, file_format: str) -> Tuple[int, int]:
+        """写入Parquet或Arrow IPC文件"""
+        if not PYARROW_AVAILABLE:
+            raise ImportError("导出Parquet/Arrow需要安装pyarrow")
+        
+        writer = None
+        total_rows = 0
+        batch_count = 0
+        try:
+            for columns, rows in batches:
+                if writer is None:
+                    schema = self._infer_schema(columns, rows)
+                    if file_format == "parquet":
+                        writer = pq.ParquetWriter(path, schema)
+                    else:
+                        writer = ipc.new_file(path, schema)
+                record_batch = self._to_record_batch(schema, rows)
+                if file_format == "parquet":
+                    writer.write_batch(record_batch)
+                else:
+                    writer.write(record_batch)
+                total_rows += len(rows)
+                batch_count += 1 if rows else 0
+        finally:
+            if writer is not None:
+                writer.close()
+        
+        if writer is None:
+            # 非查询语句没有结果集，同样生成合法的空文件
+            if file_format == "parquet":
+                pq.write_table(pa.table({}), path)
+            else:
+                with ipc.new_file(path, pa.schema([])):
+                    pass
+        return total_rows, batch_count
+    
+    def export(self, sql_query: str, output_path: str, file_format: str = "csv",
+               batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        流式导出查询结果到文件
+        
+        Args:
+            sql_query: 要导出的SQL查询
+            output_path: 输出文件路径
+            file_format: 导出格式 csv/parquet/arrow
+            batch_size: 每批读取的行数
+        
+        Returns:
+            Dict[str, Any]: 导出统计（路径、行数、批次数、耗时）
+        """
+        if file_format not in self.FORMATS:
+            raise ValueError(f"不支持的导出格式: {file_format}")
+        if not sql_analyzer.is_read_only(sql_query):
+            # 导出连接不提交事务，写入语句执行后会被回滚，直接拒绝而不是静默丢弃
+            raise ValueError("只能导出只读查询，写入语句不会执行")
+        
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        start_time = time.time()
+        batches = self.iter_batches(sql_query, batch_size)
+        if file_format == "csv":
+            total_rows, batch_count = self._write_csv(output_path, batches)
+        else:
+            total_rows, batch_count = self._write_arrow_format(output_path, batches, file_format)
+        
+        return {
+            "path": output_path,
+            "format": file_format,
+            "rows": total_rows,
+            "batches": batch_count,
+            "elapsed": time.time() - start_time
+        }
+    
+    def export_to_tempfile(self, sql_query: str, file_format: str = "csv") -> Dict[str, Any]:
+        """导出到临时文件，供Streamlit下载按钮读取；调用方不再使用时应调用discard删除"""
+        directory = EXPORT_CONFIG["temp_dir"] or None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._prune_tempfiles(directory or tempfile.gettempdir())
+        fd, path = tempfile.mkstemp(suffix=self.FORMATS[file_format]["extension"], prefix="query_export_", dir=directory)
+        os.close(fd)
+        try:
+            return self.export(sql_query, path, file_format)
+        except Exception:
+            os.remove(path)
+            raise
+    
+    def discard(self, export_file: Optional[Dict[str, Any]]):
+        """删除export_to_tempfile生成的临时文件"""
+        if export_file:
+            try:
+                os.remove(export_file["path"])
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _prune_tempfiles(directory: str):
+        """清理超过保留时间的临时导出文件（会话结束后未被discard的文件）"""
+        cutoff = time.time() - EXPORT_CONFIG.get("temp_max_age", 3600)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                if name.startswith("query_export_") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+    
+    def get_mime_type(self, file_format: str) -> str:
+        """获取导出格式对应的MIME类型"""
+        return self.FORMATS[file_format]["mime"]
+
+
+# 全局结果导出器实例
+result_exporter = ResultExporter()
@@ -0,0 +1,337 @@
+"""
+结果存储工具 - 以列式缓冲区保存查询结果，按会话和全局内存预算溢写到内存映射文件并按LRU淘汰
+
+st.session_state 中只保存结果ID（轻量句柄），实际数据由本模块统一管理
+"""
+
+import os
+import time
+import uuid
+import shutil
+import logging
+import threading
+from decimal import Decimal
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any
+import numpy as np
+import pandas as pd
+from config import RESULT_STORE_CONFIG
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = ipc = None
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class ResultStore:
+    """
+    列式结果存储
+    
+    - 安装pyarrow时使用Arrow表保存，溢写为Arrow IPC文件并以内存映射方式零拷贝读取
+    - 未安装时使用NumPy列数组保存，溢写为.npy文件，数值列以内存映射方式读取
+    """
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or RESULT_STORE_CONFIG
+        # result_id -> 结果条目，按最近访问顺序排列（最久未访问在前）
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {"stored": 0, "spilled": 0, "evicted": 0, "spill_reads": 0, "expired_handles": 0}
+    
+    def _convert_decimal_column(self, values: List[Any]):
+        """Decimal列转换：默认转为float64，否则保留为定点数"""
+        if self.config.get("decimal_as_float", True):
+            return np.fromiter(
+                (np.nan if value is None else float(value) for value in values), dtype=np.float64, count=len(values)
+            )
+        if PYARROW_AVAILABLE:
+            scale = max((-value.as_tuple().exponent for value in values if value is not None), default=0)
+            return pa.array(values, type=pa.decimal128(38, max(scale, 0)))
+        return np.array(values, dtype=object)
+    
+    def _build_columns(self, columns: List[str], rows: List[tuple]) -> List[Any]:
+        """将行数据按列转换为类型化数组"""
+        arrays = []
+        for index in range(len(columns)):
+            values = [row[index] for row in rows]
+            sample = next((value for value in values if value is not None), None)
+            if isinstance(sample, Decimal):
+                arrays.append(self._convert_decimal_column(values))
+            elif PYARROW_AVAILABLE:
+                try:
+                    arrays.append(pa.array(values))
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    # 混合类型列降级为字符串
+                    arrays.append(pa.array([None if value is None else str(value) for value in values], type=pa.string()))
+            else:
+                arrays.append(self._to_numpy(values, sample))
+        return arrays
+    
+    @staticmethod
+    def _to_numpy(values: List[Any], sample: Any) -> np.ndarray:
+        """无pyarrow时的列转换：数值列使用定长dtype，其余使用object数组"""
+        has_null = any(value is None for value in values)
+        if isinstance(sample, bool) and not has_null:
+            return np.array(values, dtype=np.bool_)
+        if isinstance(sample, int) and not isinstance(sample, bool):
+            if not has_null and all(isinstance(value, int) for value in values):
+                return np.array(values, dtype=np.int64)
+            return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        if isinstance(sample, float):
+            return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        return np.array(values, dtype=object)
+    
+    def _make_table(self, columns: List[str], rows: List[tuple]):
+        """构建列式表，返回 (表, 内存字节数)"""
+        arrays = self._build_columns(columns, rows)
+        if PYARROW_AVAILABLE:
+            arrays = [array if isinstance(array, pa.Array) else pa.array(array) for array in arrays]
+            names = self._unique_names(columns)
+            table = pa.Table.from_arrays(arrays, names=names) if arrays else pa.table({})
+            return table, table.nbytes
+        table = dict(zip(self._unique_names(columns), arrays))
+        return table, self._numpy_nbytes(table)
+    
+    @staticmethod
+    def _unique_names(columns: List[str]) -> List[str]:
+        """重复列名（如多表同名列）追加序号"""
+        seen = {}
+        names = []
+        for name in columns:
+            count = seen.get(name, 0)
+            seen[name] = count + 1
+            names.append(name if count == 0 else f"{name}_{count}")
+        return names
+    
+    @staticmethod
+    def _numpy_nbytes(table: Dict[str, np.ndarray]) -> int:
+        """估算NumPy列表的内存占用（object列按元素估算）"""
+        total = 0
+        for array in table.values():
+            total += array.nbytes
+            if array.dtype == object:
+                total += sum(len(str(value)) + 49 for value in array)
+        return total
+    
+    def _spill_path(self, result_id: str) -> str:
+        """溢写文件路径"""
+        directory = self.config["spill_dir"]
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, result_id + (".arrow" if PYARROW_AVAILABLE else ""))
+    
+    def _spill(self, entry: Dict[str, Any]):
+        """将内存中的结果写入磁盘并改为内存映射访问"""
+        if entry["table"] is None:
+            return
+        path = self._spill_path(entry["id"])
+        if PYARROW_AVAILABLE:
+            with ipc.new_file(path, entry["table"].schema) as writer:
+                writer.write_table(entry["table"])
+            disk_bytes = os.path.getsize(path)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for index, array in enumerate(entry["table"].values()):
+                np.save(os.path.join(path, f"{index}.npy"), array, allow_pickle=array.dtype == object)
+            disk_bytes = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        entry.update({"table": None, "path": path, "disk_bytes": disk_bytes})
+        self.stats["spilled"] += 1
+    
+    def _load_spilled(self, entry: Dict[str, Any]):
+        """以内存映射方式读取溢写的结果，映射页由操作系统按需换入换出，不计入内存预算"""
+        self.stats["spill_reads"] += 1
+        if PYARROW_AVAILABLE:
+            return ipc.open_file(pa.memory_map(entry["path"], "r")).read_all()
+        table = {}
+        for index, name in enumerate(entry["names"]):
+            file_path = os.path.join(entry["path"], f"{index}.npy")
+            try:
+                table[name] = np.load(file_path, mmap_mode="r")
+            except ValueError:
+                # object数组无法内存映射，完整读取
+                table[name] = np.load(file_path, allow_pickle=True)
+        return table
+    
+    @staticmethod
+    def _remove_files(entry: Dict[str, Any]):
+        """删除条目的溢写文件"""
+        path = entry.get("path")
+        if not path:
+            return
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"删除溢写文件失败 {path}: {e}")
+    
+    def _memory_usage(self, session_id: Optional[str] = None) -> int:
+        """统计内存中的结果大小，可按会话过滤"""
+        return sum(
+            entry["nbytes"] for entry in self._entries.values()
+            if entry["table"] is not None and (session_id is None or entry["session"] == session_id)
+        )
+    
+    def _disk_usage(self) -> int:
+        """统计溢写文件总大小"""
+        return sum(entry["disk_bytes"] for entry in self._entries.values() if entry["path"])
+    
+    def _evict(self, result_id: str):
+        """彻底删除一个结果"""
+        entry = self._entries.pop(result_id, None)
+        if entry is not None:
+            self._remove_files(entry)
+            self.stats["evicted"] += 1
+    
+    def _enforce_budgets(self, session_id: str):
+        """按LRU顺序执行会话条目数、会话内存、全局内存和磁盘预算"""
+        session_budget = self.config["session_memory_budget_mb"] * MB
+        global_budget = self.config["global_memory_budget_mb"] * MB
+        disk_budget = self.config["disk_budget_mb"] * MB
+        max_results = self.config.get("max_results_per_session", 20)
+        
+        session_ids = [key for key, entry in self._entries.items() if entry["session"] == session_id]
+        for result_id in session_ids[:max(len(session_ids) - max_results, 0)]:
+            self._evict(result_id)
+        
+        for result_id, entry in list(self._entries.items()):
+            if self._memory_usage(session_id) <= session_budget:
+                break
+            if entry["session"] == session_id:
+                self._spill(entry)
+        
+        for entry in list(self._entries.values()):
+            if self._memory_usage() <= global_budget:
+                break
+            self._spill(entry)
+        
+        for result_id in list(self._entries):
+            if self._disk_usage() <= disk_budget:
+                break
+            if self._entries[result_id]["path"]:
+                self._evict(result_id)
+    
+    def put(self, columns: List[str], rows: List[tuple], session_id: str = "default") -> str:
+        """
+        保存查询结果
+        
+        Args:
+            columns: 列名列表
+            rows: 行元组列表
+            session_id: 所属会话，用于会话内存预算和会话级清理
+        
+        Returns:
+            str: 结果ID（轻量句柄）
+        """
+        table, nbytes = self._make_table(columns, rows)
+        result_id = f"res-{uuid.uuid4().hex[:16]}"
+        entry = {
+            "id": result_id,
+            "session": session_id,
+            "columns": list(columns),
+            "names": self._unique_names(columns),
+            "num_rows": len(rows),
+            "table": table,
+            "nbytes": nbytes,
+            "path": None,
+            "disk_bytes": 0,
+            "created_at": time.time()
+        }
+        with self._lock:
+            self._entries[result_id] = entry
+            self.stats["stored"] += 1
+            if nbytes > self.config["spill_threshold_mb"] * MB:
+                # 大结果直接溢写，不占用常驻内存
+                self._spill(entry)
+            self._enforce_budgets(session_id)
+        return result_id
+    
+    def contains(self, result_id: Optional[str]) -> bool:
+        """结果是否仍然可用（未被淘汰）"""
+        with self._lock:
+            return result_id in self._entries
+    
+    def _get_table(self, result_id: str):
+        """读取列式表并刷新LRU顺序，不存在返回None"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None:
+                self.stats["expired_handles"] += 1
+                return None, None
+            self._entries.move_to_end(result_id)
+            table = entry["table"] if entry["table"] is not None else self._load_spilled(entry)
+            return entry, table
+    
+    def get_row_count(self, result_id: str) -> Optional[int]:
+        """获取结果行数，不存在返回None"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            return None if entry is None else entry["num_rows"]
+    
+    def get_columns(self, result_id: str) -> Optional[List[str]]:
+        """获取结果列名，不存在返回None"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            return None if entry is None else list(entry["columns"])
+    
+    def to_dataframe(self, result_id: str) -> Optional[pd.DataFrame]:
+        """将结果转换为DataFrame用于展示，不存在返回None"""
+        entry, table = self._get_table(result_id)
+        if entry is None:
+            return None
+        if PYARROW_AVAILABLE:
+            df = table.to_pandas()
+        else:
+            df = pd.DataFrame({name: np.asarray(array) for name, array in table.items()})
+        df.columns = entry["columns"]
+        return df
+    
+    def get_rows(self, result_id: str) -> Optional[List[tuple]]:
+        """将结果还原为行元组列表（用于原始格式显示），不存在返回None"""
+        entry, table = self._get_table(result_id)
+        if entry is None:
+            return None
+        if PYARROW_AVAILABLE:
+            column_values = [column.to_pylist() for column in table.columns]
+        else:
+            column_values = [
+                [None if isinstance(value, float) and np.isnan(value) else value for value in array.tolist()]
+                for array in table.values()
+            ]
+        return list(zip(*column_values)) if column_values else []
+    
+    def release(self, result_id: str):
+        """释放单个结果"""
+        with self._lock:
+            entry = self._entries.pop(result_id, None)
+            if entry is not None:
+                self._remove_files(entry)
+    
+    def release_session(self, session_id: str):
+        """释放会话的所有结果"""
+        with self._lock:
+            for result_id in [key for key, entry in self._entries.items() if entry["session"] == session_id]:
+                self.release(result_id)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计：结果数、内存占用、溢写占用和淘汰次数"""
+        with self._lock:
+            return {
+                **self.stats,
+                "results": len(self._entries),
+                "in_memory": sum(1 for entry in self._entries.values() if entry["table"] is not None),
+                "memory_mb": self._memory_usage() / MB,
+                "disk_mb": self._disk_usage() / MB,
+                "backend": "arrow" if PYARROW_AVAILABLE else "numpy"
+            }
+
+
+# 全局结果存储实例
+result_store = ResultStore()
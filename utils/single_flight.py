@@ -0,0 +1,76 @@
+"""
+请求合并工具 - 相同键的并发调用只执行一次，其余调用等待并共享结果
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _InFlightCall:
+    """正在执行中的调用"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """单飞（single-flight）请求合并器"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+    
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        执行调用，若相同键的调用正在进行则等待其结果
+        
+        Returns:
+            Tuple[Any, bool]: (调用结果, 是否复用了其他请求的结果)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self.stats["executed"] += 1
+            else:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+        
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            # 异常同样传递给所有等待者
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+    
+    def in_flight(self) -> int:
+        """当前正在执行的调用数"""
+        with self._lock:
+            return len(self._calls)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        with self._lock:
+            total = self.stats["executed"] + self.stats["coalesced"]
+            return {
+                **self.stats,
+                "in_flight": len(self._calls),
+                "coalesce_rate": self.stats["coalesced"] / total if total else 0.0
+            }
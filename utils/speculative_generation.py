@@ -0,0 +1,172 @@
+"""
+预测生成工具 - 用户输入问题时在后台低优先级地提前生成SQL，提交的问题与之相同时直接使用
+
+每个会话只保留最新一次输入的预测：输入变化时尚未开始的预测被取消，已完成但未被使用的结果计为浪费
+"""
+
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class SpeculativeGenerator:
+    """
+    预测生成器
+    
+    generate_fn(question, model_name) 返回 (SQL, 实际使用的模型)，生成失败时返回None；
+    单个后台线程依次执行，前台有查询时推迟开始，避免与用户正在等待的查询争用模型
+    """
+    
+    def __init__(self, generate_fn: Callable[[str, str], Optional[Tuple[str, str]]], config: Dict[str, Any]):
+        self.generate_fn = generate_fn
+        self.config = config
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        # 会话ID -> 最新一次预测 {"seq", "question", "model", "status", "due", "sql", "ms", ...}
+        self._states = {}
+        self._seq = 0
+        self._foreground = 0
+        self._thread = None
+        self.stats = {
+            "requested": 0, "started": 0, "cancelled": 0, "hits": 0, "joined": 0, "misses": 0,
+            "wasted": 0, "wasted_ms": 0.0, "saved_ms": 0.0
+        }
+    
+    def _ensure_worker(self):
+        """按需启动后台线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="speculative-generation", daemon=True)
+            self._thread.start()
+    
+    def _discard(self, state: Dict[str, Any]):
+        """丢弃一个预测：未开始的计为取消，已完成的计为浪费（调用方持有锁）"""
+        if state["status"] == "pending":
+            self.stats["cancelled"] += 1
+        elif state["status"] == "ready":
+            self.stats["wasted"] += 1
+            self.stats["wasted_ms"] += state["ms"]
+        elif state["status"] == "running":
+            # 正在生成，完成时由后台线程计入浪费
+            state["superseded"] = True
+    
+    def submit(self, session_id: str, model_name: str, question: str):
+        """输入变化时提交预测，取代本会话之前的预测"""
+        question = question.strip()
+        if len(question) < self.config.get("min_chars", 4):
+            return
+        with self._lock:
+            current = self._states.get(session_id)
+            if current and (current["question"], current["model"]) == (question, model_name):
+                return
+            if current:
+                self._discard(current)
+            self._seq += 1
+            self._states[session_id] = {
+                "seq": self._seq, "question": question, "model": model_name, "status": "pending",
+                "due": time.time() + self.config.get("debounce_ms", 800) / 1000, "done": threading.Event()
+            }
+            self.stats["requested"] += 1
+            self._jobs.put((session_id, self._seq))
+            self._ensure_worker()
+    
+    def take(self, session_id: str, model_name: str, question: str) -> Optional[Dict[str, Any]]:
+        """
+        提交查询时取用预测结果，预测正在生成时等待其完成（与重新生成做的是同一件事）
+        
+        Returns:
+            Optional[Dict[str, Any]]: 与提交的问题和模型一致且生成成功时返回 {"sql", "model", "ms"}
+        """
+        question = question.strip()
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return None
+            matched = (state["question"], state["model"]) == (question, model_name)
+            if matched and state["status"] == "running":
+                state["joined"] = True
+            else:
+                return self._consume(session_id, state, matched)
+        state["done"].wait()
+        with self._lock:
+            return self._consume(session_id, state, True)
+    
+    def _consume(self, session_id: str, state: Dict[str, Any], matched: bool) -> Optional[Dict[str, Any]]:
+        """取用或丢弃会话的预测（调用方持有锁）"""
+        if self._states.get(session_id) is state:
+            del self._states[session_id]
+        fresh = state["status"] == "ready" and time.time() - state["finished_at"] <= self.config.get("result_ttl", 300)
+        if matched and fresh:
+            self.stats["joined" if state.get("joined") else "hits"] += 1
+            self.stats["saved_ms"] += state["ms"]
+            return {"sql": state["sql"], "model": state["generated_by"], "ms": state["ms"]}
+        if state["status"] != "failed":
+            self._discard(state)
+        self.stats["misses"] += 1
+        return None
+    
+    @contextmanager
+    def foreground(self):
+        """标记前台查询进行中，期间不开始新的预测"""
+        with self._lock:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground -= 1
+    
+    def _wait_until_runnable(self, session_id: str, seq: int) -> Optional[Dict[str, Any]]:
+        """等待去抖时间结束且前台空闲，期间被取代时返回None"""
+        poll = self.config.get("idle_poll_ms", 100) / 1000
+        while True:
+            with self._lock:
+                state = self._states.get(session_id)
+                if state is None or state["seq"] != seq:
+                    return None
+                if time.time() >= state["due"] and not self._foreground:
+                    state["status"] = "running"
+                    self.stats["started"] += 1
+                    return state
+                delay = max(state["due"] - time.time(), poll)
+            time.sleep(delay)
+    
+    def _run(self):
+        """后台线程：依次执行预测"""
+        while True:
+            session_id, seq = self._jobs.get()
+            state = self._wait_until_runnable(session_id, seq)
+            if state is None:
+                continue
+            
+            start_time = time.perf_counter()
+            try:
+                outcome = self.generate_fn(state["question"], state["model"])
+            except Exception:
+                outcome = None
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            
+            with self._lock:
+                current = self._states.get(session_id) is state
+                if outcome is None:
+                    state["status"] = "failed"
+                if outcome is None or state.get("superseded") or not current:
+                    self.stats["wasted"] += 1
+                    self.stats["wasted_ms"] += elapsed_ms
+                else:
+                    state.update({
+                        "status": "ready", "sql": outcome[0], "generated_by": outcome[1],
+                        "ms": elapsed_ms, "finished_at": time.time()
+                    })
+            state["done"].set()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预测命中率和浪费的生成耗时"""
+        with self._lock:
+            submitted = self.stats["hits"] + self.stats["joined"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": (self.stats["hits"] + self.stats["joined"]) / submitted if submitted else 0.0,
+                "pending": sum(1 for state in self._states.values() if state["status"] in ("pending", "running"))
+            }
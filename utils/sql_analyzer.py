@@ -0,0 +1,186 @@
+"""
+SQL分析工具 - 基于轻量级词法处理分析SQL语句的结构特征
+"""
+
+import re
+import hashlib
+from typing import List, Set
+from config import TABLE_COLUMNS
+
+
+class SQLAnalyzer:
+    """SQL语句分析器"""
+    
+    # 只读语句的起始关键字
+    READ_ONLY_KEYWORDS = ('SELECT', 'WITH', 'SHOW', 'DESCRIBE', 'DESC', 'EXPLAIN')
+    
+    AGGREGATE_FUNCTIONS = ('COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'GROUP_CONCAT')
+    
+    # DDL语句的起始关键字
+    DDL_KEYWORDS = ('CREATE', 'DROP', 'ALTER', 'RENAME', 'TRUNCATE')
+    
+    # 可带 schema 前缀、可用反引号引用的对象名
+    OBJECT_NAME = r'`?(\w+)`?(?:\s*\.\s*`?(\w+)`?)?'
+    
+    def __init__(self):
+        self.known_tables = {name.lower(): name for name in TABLE_COLUMNS}
+        self.known_columns = {
+            column.lower() for columns in TABLE_COLUMNS.values() for column in columns
+        }
+    
+    def strip_comments(self, sql: str) -> str:
+        """移除SQL中的行注释和块注释"""
+        sql = re.sub(r'/\*.*?\*/', ' ', sql, flags=re.DOTALL)
+        sql = re.sub(r'(--|#)[^\n]*', ' ', sql)
+        return sql
+    
+    def strip_literals(self, sql: str) -> str:
+        """将字符串字面量替换为空字符串，避免其内容干扰关键字判断"""
+        return re.sub(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"", "''", sql)
+    
+    def _keyword_text(self, sql: str) -> str:
+        """获取仅用于关键字匹配的大写SQL文本"""
+        return self.strip_literals(self.strip_comments(sql)).upper()
+    
+    def normalize_sql(self, sql: str) -> str:
+        """
+        规范化SQL文本用于模式匹配：去注释、关键字小写（保留字符串字面量）、
+        合并空白、去除逗号/括号/比较符两侧空格以及末尾分号
+        """
+        sql = self.strip_comments(sql).replace('`', '')
+        parts = re.split(r"('(?:[^'\\]|\\.|'')*')", sql)
+        normalized = ''.join(part if i % 2 else part.lower() for i, part in enumerate(parts))
+        normalized = re.sub(r'\s+', ' ', normalized).strip().rstrip(';').strip()
+        normalized = re.sub(r'\s*([,=<>()])\s*', r'\1', normalized)
+        # 恢复括号后的关键字空格，如 "count(*)as" -> "count(*) as"
+        normalized = re.sub(r'\)(?=[a-z_])', ') ', normalized)
+        return normalized
+    
+    def fingerprint(self, sql: str) -> str:
+        """计算SQL指纹：规范化后将字符串和数字字面量替换为占位符再取哈希"""
+        normalized = self.normalize_sql(sql)
+        normalized = re.sub(r"'(?:[^'\\]|\\.|'')*'", '?', normalized)
+        normalized = re.sub(r'(?<![\w.])-?\d+(?:\.\d+)?\b', '?', normalized)
+        # IN列表长度不影响指纹
+        normalized = re.sub(r'\(\?(?:,\?)*\)', '(?)', normalized)
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+    
+    def split_statements(self, sql: str) -> List[str]:
+        """按分号拆分多条SQL语句（忽略字符串和注释中的分号）"""
+        statements = []
+        current = []
+        quote = None
+        i = 0
+        while i < len(sql):
+            char = sql[i]
+            if quote:
+                current.append(char)
+                if char == '\\' and i + 1 < len(sql):
+                    current.append(sql[i + 1])
+                    i += 1
+                elif char == quote:
+                    quote = None
+            elif char in ("'", '"', '`'):
+                quote = char
+                current.append(char)
+            elif sql.startswith('--', i) or char == '#':
+                end = sql.find('\n', i)
+                i = len(sql) if end == -1 else end
+                continue
+            elif sql.startswith('/*', i):
+                end = sql.find('*/', i + 2)
+                i = len(sql) if end == -1 else end + 2
+                continue
+            elif char == ';':
+                statement = ''.join(current).strip()
+                if statement:
+                    statements.append(statement)
+                current = []
+            else:
+                current.append(char)
+            i += 1
+        
+        statement = ''.join(current).strip()
+        if statement:
+            statements.append(statement)
+        return statements
+    
+    def is_read_only(self, sql: str) -> bool:
+        """判断SQL是否为单条只读语句"""
+        statements = self.split_statements(sql)
+        if len(statements) != 1:
+            return False
+        
+        text = self._keyword_text(statements[0]).strip()
+        if not text.startswith(self.READ_ONLY_KEYWORDS):
+            return False
+        
+        # SELECT ... INTO / FOR UPDATE / LOCK IN SHARE MODE 等同样存在副作用
+        side_effect_patterns = (
+            r'\bINTO\s+(OUTFILE|DUMPFILE|@)',
+            r'\bFOR\s+(UPDATE|SHARE)\b',
+            r'\bLOCK\s+IN\s+SHARE\s+MODE\b',
+        )
+        return not any(re.search(pattern, text) for pattern in side_effect_patterns)
+    
+    def is_aggregate_query(self, sql: str) -> bool:
+        """判断SQL是否为聚合查询（包含GROUP BY或聚合函数）"""
+        text = self._keyword_text(sql)
+        if re.search(r'\bGROUP\s+BY\b', text):
+            return True
+        return any(re.search(rf'\b{func}\s*\(', text) for func in self.AGGREGATE_FUNCTIONS)
+    
+    def is_ddl(self, sql: str) -> bool:
+        """判断SQL是否为DDL语句（CREATE/DROP/ALTER/RENAME/TRUNCATE）"""
+        return bool(re.match(rf"\s*(?:{'|'.join(self.DDL_KEYWORDS)})\b", self._keyword_text(sql)))
+    
+    def _ddl_targets(self, text: str) -> List[re.Match]:
+        """
+        DDL语句中 TABLE/VIEW 之外的目标对象：DROP/RENAME 的对象列表、TRUNCATE 的表、
+        索引所在的表以及 ALTER ... RENAME TO 的新表名
+        """
+        keyword = text.lstrip()[:8].upper()
+        patterns = [
+            rf'^\s*TRUNCATE\s+(?:TABLE\s+)?{self.OBJECT_NAME}',
+            rf'\bINDEX\s+`?\w+`?\s+ON\s+{self.OBJECT_NAME}',
+            rf'\bRENAME\s+(?:TO|AS)\s+{self.OBJECT_NAME}'
+        ]
+        if keyword.startswith(('DROP', 'RENAME')):
+            # DROP TABLE a, b / RENAME TABLE a TO b, c TO d
+            patterns.append(rf'(?:,|\bTO\b)\s*{self.OBJECT_NAME}')
+        return [match for pattern in patterns for match in re.finditer(pattern, text, flags=re.IGNORECASE)]
+    
+    def extract_tables(self, sql: str) -> Set[str]:
+        """提取SQL中引用的表名（按配置中的表名大小写返回），DDL语句包括其创建、删除或重命名的表和视图"""
+        text = self.strip_literals(self.strip_comments(sql))
+        pattern = rf'\b(?:FROM|JOIN|UPDATE|INTO|TABLE|VIEW)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?{self.OBJECT_NAME}'
+        matches = list(re.finditer(pattern, text, flags=re.IGNORECASE))
+        if self.is_ddl(text):
+            matches += self._ddl_targets(text)
+        tables = set()
+        for match in matches:
+            # 兼容 schema.table 写法
+            name = match.group(2) or match.group(1)
+            tables.add(self.known_tables.get(name.lower(), name))
+        
+        # 逗号分隔的多表FROM子句
+        for from_clause in re.finditer(
+            r'\bFROM\s+(.+?)(?=\bWHERE\b|\bGROUP\b|\bORDER\b|\bLIMIT\b|\bHAVING\b|\bJOIN\b|\)|$)',
+            text, flags=re.IGNORECASE | re.DOTALL
+        ):
+            for part in from_clause.group(1).split(',')[1:]:
+                name = part.strip().split()[0].strip('`') if part.strip() else ''
+                if name and name.lower() in self.known_tables:
+                    tables.add(self.known_tables[name.lower()])
+        
+        # 过滤 EXTRACT(YEAR FROM OrderDate) 之类误识别的列名
+        return {
+            table for table in tables
+            if table.upper() != 'DUAL' and (
+                table.lower() in self.known_tables or table.lower() not in self.known_columns
+            )
+        }
+
+
+# 全局SQL分析器实例
+sql_analyzer = SQLAnalyzer()
@@ -0,0 +1,167 @@
+"""
+Ollama替身服务 - 在本地端口模拟Ollama的HTTP接口，用于压测和离线评估
+
+按 "提示词处理 + 逐token生成" 模拟延迟，并用并行槽位模拟 OLLAMA_NUM_PARALLEL，
+记录每个请求在槽位前的排队时间
+"""
+
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Optional, List, Dict, Any
+from utils.prompt_budget import PromptBudgetManager
+
+
+class StubOllamaServer:
+    """
+    Ollama替身服务
+    
+    responder(model, prompt) 返回模型输出文本，未提供时固定返回 SELECT 1;
+    """
+    
+    def __init__(self, responder: Optional[Callable[[str, str], str]] = None,
+                 models: Optional[List[str]] = None, host: str = "127.0.0.1", port: int = 0,
+                 parallel: int = 1, prompt_ms_per_token: float = 0.0, ms_per_token: float = 0.0):
+        self.responder = responder or (lambda model, prompt: "SELECT 1;")
+        self.models = list(models or [])
+        self.prompt_ms_per_token = prompt_ms_per_token
+        self.ms_per_token = ms_per_token
+        self._slots = threading.Semaphore(max(parallel, 1))
+        self._lock = threading.Lock()
+        self._waits = []
+        self.stats = {"requests": 0, "prompt_tokens": 0, "generated_tokens": 0}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def base_url(self) -> str:
+        """替身服务地址，可直接写入 OLLAMA_CONFIG["base_url"]"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self) -> "StubOllamaServer":
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def drain_waits(self) -> List[float]:
+        """取出并清空已记录的排队时间（毫秒）"""
+        with self._lock:
+            waits, self._waits = self._waits, []
+        return waits
+    
+    def _generate(self, model: str, prompt: str) -> Dict[str, Any]:
+        """占用一个并行槽位生成输出，按token数模拟耗时"""
+        queued_at = time.perf_counter()
+        with self._slots:
+            wait_ms = (time.perf_counter() - queued_at) * 1000
+            started_at = time.perf_counter()
+            text = self.responder(model, prompt)
+            prompt_tokens = PromptBudgetManager.count_tokens(prompt)
+            output_tokens = max(PromptBudgetManager.count_tokens(text), 1)
+            prompt_seconds = prompt_tokens * self.prompt_ms_per_token / 1000
+            eval_seconds = output_tokens * self.ms_per_token / 1000
+            time.sleep(prompt_seconds + eval_seconds)
+            total_ns = int((time.perf_counter() - started_at) * 1e9)
+        
+        with self._lock:
+            self._waits.append(wait_ms)
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["generated_tokens"] += output_tokens
+        return {
+            "text": text,
+            "done": {
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": total_ns,
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_seconds * 1e9),
+                "eval_count": output_tokens,
+                "eval_duration": int(eval_seconds * 1e9)
+            }
+        }
+    
+    def _make_handler(self):
+        """生成绑定到本实例的请求处理类"""
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def _send_stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    line = (json.dumps(chunk) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+            
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": model, "model": model, "size": 0} for model in stub.models]})
+                elif self.path == "/api/ps":
+                    self._send_json({"models": []})
+                elif self.path in ("/", "/api/version"):
+                    self._send_json({"version": "stub"})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                model = payload.get("model", "")
+                created_at = datetime.now(timezone.utc).isoformat()
+                
+                if self.path == "/api/generate":
+                    prompt = payload.get("prompt") or ""
+                    if not prompt:
+                        # 只加载模型（预加载请求）
+                        self._send_json({"model": model, "created_at": created_at, "response": "", "done": True})
+                        return
+                    output = stub._generate(model, (payload.get("system") or "") + prompt)
+                    wrap = lambda piece: {"response": piece}
+                elif self.path == "/api/chat":
+                    messages = payload.get("messages") or []
+                    output = stub._generate(model, "\n".join(str(message.get("content", "")) for message in messages))
+                    wrap = lambda piece: {"message": {"role": "assistant", "content": piece}}
+                elif self.path == "/api/show":
+                    self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {}})
+                    return
+                else:
+                    self._send_json({"error": "not found"}, 404)
+                    return
+                
+                base = {"model": model, "created_at": created_at}
+                final = {**base, **wrap(""), **output["done"]}
+                if payload.get("stream", True):
+                    pieces = [piece + " " for piece in output["text"].split(" ")]
+                    pieces[-1] = pieces[-1][:-1]
+                    self._send_stream([{**base, **wrap(piece), "done": False} for piece in pieces] + [final])
+                else:
+                    self._send_json({**final, **wrap(output["text"])})
+        
+        return Handler